@@ -4,18 +4,466 @@
 # In[1]:
 
 
-from os.path import expanduser, join
 import os
-import cheroot
-import pkg_resources
 import json
-import cherrypy
-import cobra
-import os
-import pandas as pd
-from multiprocessing import Process, Pool
+import logging
+from multiprocessing import Pool
 from itertools import combinations
 
+# cobra and pandas take a while to import, so they are imported inside the functions that use them. This keeps short jobs (and the command line interface, see main) quick to start.
+
+log = logging.getLogger(__name__)
+
+
+'''
+    Instrumentation of the functions of this module. The boundaries between the stages of the analysis (loading the models, creating the exchange reactions, renaming reactions and metabolites, applying the 'Diet', solving the linear programs, writing the models) are marked with getRecorder().stage(name). By default the recorder does nothing, so the cost of these hooks is negligible. To see where the time of a run goes, set a StageRecorder before running it, e.g.:
+
+        recorder = setRecorder(StageRecorder())
+        calculateGR(diet, comFolder, OutFile)
+        print(recorder.summary())
+        recorder.writeTrace('trace.tsv')
+'''
+
+
+TRACE_COLUMNS = ['Pair', 'Stage', 'Wall', 'CPU', 'Status', 'Iterations', 'Reactions', 'Metabolites', 'Error']
+
+
+class _NullStage(object):
+    '''
+    Context returned by NullRecorder for every stage. The dictionary it gives can be filled like the events of a StageRecorder, but is thrown away.
+    '''
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+class NullRecorder(object):
+    '''
+    Recorder used by default, which does not record anything.
+    '''
+
+    enabled = False
+
+    def stage(self, name):
+        return _NullStage()
+
+    def pair(self, pairID):
+        return _NullStage()
+
+    def drain(self):
+        return []
+
+    def merge(self, events):
+        pass
+
+
+class _RecordedStage(object):
+    '''
+    Context created by StageRecorder.stage. It measures the wall and CPU time spent inside it, and gives the dictionary of the event, to which the code inside the stage can add the status of a linear program or the size of a model.
+    '''
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.event = {'pair': recorder.currentPair, 'stage': name}
+
+    def __enter__(self):
+        import time
+        import timeit
+
+        self.wall = timeit.default_timer()
+        self.cpu = time.process_time()
+        return self.event
+
+    def __exit__(self, excType, excValue, traceback):
+        import time
+        import timeit
+
+        self.event['wall'] = timeit.default_timer() - self.wall
+        self.event['cpu'] = time.process_time() - self.cpu
+        if excValue is not None:
+            self.event['error'] = str(excValue)
+        self.recorder.events.append(self.event)
+        return False
+
+
+class _RecordedPair(_RecordedStage):
+    '''
+    Context created by StageRecorder.pair. All the stages recorded inside it are attributed to the pair, and its own event (stage 'pair') has the total time spent on the pair.
+    '''
+
+    def __init__(self, recorder, pairID):
+        self.previousPair = recorder.currentPair
+        recorder.currentPair = pairID
+        _RecordedStage.__init__(self, recorder, 'pair')
+
+    def __exit__(self, excType, excValue, traceback):
+        _RecordedStage.__exit__(self, excType, excValue, traceback)
+        self.recorder.currentPair = self.previousPair
+        return False
+
+
+class StageRecorder(object):
+    '''
+    Recorder of the time spent on each stage of the analysis. Each stage produces an event (a dictionary) with the pair being analysed, the name of the stage, its wall and CPU time in seconds and, when available, the status of the linear program and the number of simplex iterations it took, the number of reactions and metabolites of the model and the error raised inside the stage. The events can be written to a trace file with one row per stage and pair (writeTrace), or summarised per stage at the end of the run (summary). The events recorded in worker processes are sent back to the main process and added to its recorder with merge.
+    '''
+
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self.currentPair = None
+
+    def stage(self, name):
+        return _RecordedStage(self, name)
+
+    def pair(self, pairID):
+        return _RecordedPair(self, pairID)
+
+    def drain(self):
+        '''
+        Returns the events recorded so far and forgets them, so that a worker process can send them to the main process after each task.
+        '''
+        events = self.events
+        self.events = []
+        return events
+
+    def merge(self, events):
+        '''
+        Adds the events recorded by another recorder (e.g. in a worker process).
+        '''
+        self.events.extend(events)
+
+    def stages(self):
+        '''
+        Returns the totals of each stage, as a dictionary with the name of the stage as key and a list with the number of calls, the wall time and the CPU time as value.
+        '''
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault(event['stage'], [0, 0., 0.])
+            total[0] += 1
+            total[1] += event['wall']
+            total[2] += event['cpu']
+        return totals
+
+    def summary(self):
+        '''
+        Returns a table with the number of calls, the total and mean wall time and the total CPU time of each stage, followed by the number of pairs, the mean time per pair, the number of linear programs that were solved and that did not reach an optimal solution, and the number of simplex iterations they took.
+        '''
+        totals = self.stages()
+        lines = ['%-12s %8s %12s %12s %12s' %('Stage', 'Calls', 'Wall (s)', 'CPU (s)', 'Mean (s)')]
+        for name in sorted(totals, key=lambda name: -totals[name][1]):
+            calls, wall, cpu = totals[name]
+            lines.append('%-12s %8d %12.4f %12.4f %12.6f' %(name, calls, wall, cpu, wall / calls))
+
+        solves = [event for event in self.events if 'status' in event]
+        notOptimal = [event for event in solves if event['status'] != 'optimal']
+        pairs = [event for event in self.events if event['stage'] == 'pair']
+        failed = [event for event in pairs if 'error' in event]
+        if pairs:
+            lines.append('%d pairs (%d failed), %.4f s per pair.' %(len(pairs), len(failed), sum([event['wall'] for event in pairs]) / len(pairs)))
+        lines.append('%d linear programs solved, %d not optimal.' %(len(solves), len(notOptimal)))
+
+        iterations = [event['iterations'] for event in solves if event.get('iterations') is not None]
+        if iterations:
+            lines.append('%d simplex iterations, %.1f per linear program.' %(sum(iterations), sum(iterations) / float(len(iterations))))
+
+        return '\n'.join(lines)
+
+    def writeTrace(self, path):
+        '''
+        Writes the events to a tab-delimited file with the columns of TRACE_COLUMNS, one row per stage of each pair.
+        '''
+        fields = ['pair', 'stage', 'wall', 'cpu', 'status', 'iterations', 'reactions', 'metabolites', 'error']
+
+        traceFile = open(path, 'w')
+        traceFile.write('\t'.join(TRACE_COLUMNS) + '\n')
+        for event in self.events:
+            traceFile.write('\t'.join(['' if event.get(field) is None else str(event[field]).replace('\t', ' ').replace('\n', ' ') for field in fields]) + '\n')
+        traceFile.close()
+
+
+_recorder = NullRecorder()
+
+
+def getRecorder():
+    '''
+    Returns the recorder used by the functions of this module.
+    '''
+    return _recorder
+
+
+def setRecorder(recorder):
+    '''
+    Sets the recorder used by the functions of this module. NullRecorder() turns the instrumentation off again.
+    :param recorder: StageRecorder or NullRecorder object
+    :return recorder: the same recorder
+    '''
+    global _recorder
+    _recorder = recorder
+    return recorder
+
+
+def recordModelSize(event, model):
+    '''
+    Adds the number of reactions and metabolites of a model to the event of a stage.
+    '''
+    event['reactions'] = len(model.reactions)
+    event['metabolites'] = len(model.metabolites)
+
+
+def isGLPK(lp):
+    '''
+    Returns True if an optlang problem uses GLPK, whose basis and iteration count can be read through swiglpk.
+    '''
+    return type(lp).__module__.startswith('optlang.glpk')
+
+
+def glpkArray(arrayType, values):
+    '''
+    Returns a swiglpk array (intArray or doubleArray) with a copy of the values of a numpy array, which must already have the C type of the array (numpy.intc or numpy.double). The values are copied in one block instead of element by element.
+    '''
+    import ctypes
+
+    array = arrayType(len(values))
+    ctypes.memmove(int(array.cast()), values.ctypes.data, values.nbytes)
+    return array
+
+
+def sumDuplicates(rows, cols, values, nCols):
+    '''
+    Returns the entries of a sparse matrix in coordinate format sorted by row and column, with the values of repeated (row, column) entries summed.
+    :param rows: numpy array with the row of each entry
+    :param cols: numpy array with the column of each entry
+    :param values: numpy array with the value of each entry
+    :param nCols: number of columns of the matrix
+    :return rows, cols, values: numpy arrays with the entries of the matrix, each (row, column) appearing once
+    '''
+    import numpy as np
+
+    keys = rows.astype(np.int64) * nCols + cols
+    order = np.argsort(keys, kind='mergesort')
+    keys = keys[order]
+    if len(keys) == 0:
+        return rows[order], cols[order], values[order].astype(float)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    keys = keys[starts]
+    return keys // nCols, keys % nCols, np.add.reduceat(values[order].astype(float), starts)
+
+
+def solverIterations(lp):
+    '''
+    Returns the number of simplex iterations done so far on an optlang problem, or None if the solver doesn't report it (only GLPK does).
+    :param lp: optlang Model object (e.g. model.solver)
+    '''
+    if not isGLPK(lp):
+        return None
+    import swiglpk
+    return swiglpk.glp_get_it_cnt(lp.problem)
+
+
+def solveModel(model):
+    '''
+    Optimizes a cobrapy model as a 'solve' stage, recording the status of the solver and the number of simplex iterations. An error is raised if the solution is not optimal.
+    :param model: cobrapy Model object
+    :return objective value of the solution
+    '''
+    with getRecorder().stage('solve') as event:
+        iterations = solverIterations(model.solver)
+        try:
+            return model.slim_optimize(error_value=None)
+        finally:
+            event['status'] = model.solver.status
+            if iterations is not None:
+                event['iterations'] = solverIterations(model.solver) - iterations
+
+# Names of the solver backends and of the optlang interfaces that cobrapy uses for them. HiGHS is used through the 'hybrid' interface of optlang. Other interfaces known to cobrapy (e.g. 'gurobi' or 'cplex') can be given by their own name.
+SOLVER_INTERFACES = {'glpk': 'glpk', 'highs': 'hybrid'}
+
+# Methods used to solve the linear programs with each backend, tried by autotuneSolver.
+SOLVER_METHODS = {'glpk': ['primal', 'dual', 'dualp'], 'highs': ['simplex', 'interior point']}
+
+
+def availableSolvers():
+    '''
+    Returns the names of the solver backends of SOLVER_INTERFACES that are installed.
+    '''
+    from cobra.util.solver import solvers
+
+    return [name for name, interface in SOLVER_INTERFACES.items() if interface in solvers]
+
+
+class SolverConfig(object):
+    '''
+    Solver backend and parameters used for the linear programs of the growth, sweep and exchange stages. The settings left as None keep the defaults of cobrapy and of the solver, so SolverConfig() changes nothing. A configuration is set for the whole module with setSolverConfig, and can be saved to a JSON file (e.g. by the autotune command) and loaded again.
+    :param solver: name of the backend ('glpk', 'highs', or any solver interface known to cobrapy)
+    :param presolve: True or False to turn the presolver of the solver on or off, or 'auto'
+    :param method: method used to solve the linear programs (SOLVER_METHODS): 'primal', 'dual' or 'dualp' with GLPK, 'simplex' or 'interior point' with HiGHS
+    :param tolerances: dictionary with the 'feasibility' and 'optimality' tolerances
+    :param threads: number of threads, for the solvers that can use several
+    :param timeout: maximum time in seconds of each optimization
+    '''
+
+    SETTINGS = ['solver', 'presolve', 'method', 'tolerances', 'threads', 'timeout']
+
+    def __init__(self, solver=None, presolve=None, method=None, tolerances=None, threads=None, timeout=None):
+        self.solver = solver
+        self.presolve = presolve
+        self.method = method
+        self.tolerances = dict(tolerances or {})
+        self.threads = threads
+        self.timeout = timeout
+
+    def settings(self):
+        '''
+        Returns the settings as a dictionary.
+        '''
+        return dict((name, getattr(self, name)) for name in self.SETTINGS)
+
+    def isDefault(self):
+        return self.settings() == SolverConfig().settings()
+
+    def __repr__(self):
+        return 'SolverConfig(%s)' %', '.join(['%s=%r' %(name, value) for name, value in self.settings().items() if value not in (None, {})])
+
+    def interface(self):
+        '''
+        Returns the name of the optlang interface of the solver, or None to keep the default solver of cobrapy.
+        '''
+        if self.solver is None:
+            return None
+        return SOLVER_INTERFACES.get(self.solver, self.solver)
+
+    def apply(self, lp):
+        '''
+        Sets the parameters on an optlang problem (e.g. model.solver). A ValueError is raised for a method that the solver doesn't have.
+        :param lp: optlang Model object
+        '''
+        configuration = lp.configuration
+
+        if self.presolve is not None:
+            configuration.presolve = self.presolve
+        if self.timeout is not None:
+            configuration.timeout = self.timeout
+        for name, value in self.tolerances.items():
+            try:
+                setattr(configuration.tolerances, name, value)
+            except AttributeError:
+                log.warning('The %s tolerance can not be set with %s.' %(name, type(lp).__module__))
+
+        if self.method is not None:
+            if isGLPK(lp):
+                import swiglpk
+
+                methods = {'primal': swiglpk.GLP_PRIMAL, 'dual': swiglpk.GLP_DUAL, 'dualp': swiglpk.GLP_DUALP}
+                if self.method not in methods:
+                    raise ValueError('%s is not a simplex method of GLPK (%s)' %(self.method, ', '.join(sorted(methods))))
+                configuration._smcp.meth = methods[self.method]
+            elif hasattr(configuration, 'lp_method'):
+                configuration.lp_method = self.method
+            else:
+                raise ValueError('the method of %s can not be chosen' %type(lp).__module__)
+
+        if self.threads is not None:
+            if hasattr(configuration, 'threads'):
+                configuration.threads = self.threads
+            elif hasattr(getattr(lp, 'problem', None), 'settings'):
+                # HiGHS (hybrid interface) keeps its options in the settings of the problem
+                lp.problem.settings['threads'] = self.threads
+            else:
+                log.warning('The number of threads can not be set with %s.' %type(lp).__module__)
+
+    def save(self, path, benchmark=None):
+        '''
+        Writes the settings to a JSON file, with the results of autotuneSolver if they are given.
+        '''
+        content = self.settings()
+        if benchmark is not None:
+            content['benchmark'] = benchmark
+        configFile = open(path, 'w')
+        json.dump(content, configFile, indent=2)
+        configFile.write('\n')
+        configFile.close()
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Reads the settings from a JSON file written by save. Other keys are ignored.
+        '''
+        configFile = open(path, 'r')
+        content = json.load(configFile)
+        configFile.close()
+        return cls(**dict((name, content.get(name)) for name in cls.SETTINGS))
+
+
+_solverConfig = SolverConfig()
+
+
+def getSolverConfig():
+    '''
+    Returns the SolverConfig used by the functions of this module.
+    '''
+    return _solverConfig
+
+
+def setSolverConfig(config):
+    '''
+    Sets the SolverConfig used by the functions of this module. SolverConfig() goes back to the defaults of cobrapy.
+    :param config: SolverConfig object
+    :return config: the same configuration
+    '''
+    global _solverConfig
+    _solverConfig = config
+    return config
+
+
+def configureSolver(model, config=None):
+    '''
+    Switches a cobrapy model to the solver of a SolverConfig, if it uses another one, and sets the parameters of the configuration on it. Nothing is done with the default configuration.
+    :param model: cobrapy Model object
+    :param config: SolverConfig object. Defaults to the one of the module (getSolverConfig).
+    :return model: the same model
+    '''
+    if config is None:
+        config = getSolverConfig()
+    if config.isDefault():
+        return model
+
+    interface = config.interface()
+    if interface is not None and not type(model.solver).__module__.startswith('optlang.%s_interface' %interface):
+        model.solver = interface
+    config.apply(model.solver)
+
+    return model
+
+
+def fallbackSolverConfig(config=None):
+    '''
+    Returns the SolverConfig with which the pairs that failed or timed out are tried again: the same backend, tolerances and timeout, with another method of SOLVER_METHODS and the presolver switched on (or off, if it was on). A numerically difficult linear program often goes through with a different path of the simplex.
+    :param config: SolverConfig object of the first attempt. Defaults to the one of the module (getSolverConfig).
+    :return fallback: SolverConfig object
+    '''
+    import cobra
+
+    if config is None:
+        config = getSolverConfig()
+
+    solver = config.solver
+    if solver is None:
+        interface = cobra.Configuration().solver.__name__.split('.')[-1].replace('_interface', '')
+        solver = dict((value, name) for name, value in SOLVER_INTERFACES.items()).get(interface, interface)
+
+    methods = SOLVER_METHODS.get(solver, [])
+    method = config.method
+    others = [other for other in methods if other != (method or methods[0])]
+    if others:
+        method = others[0]
+
+    return SolverConfig(solver, config.presolve is not True, method, config.tolerances, config.threads, config.timeout)
+
+
 # In[2]:
 def get_all_pairs(source_models):
     """ Get all of the unique pairs from a list of models.
@@ -38,42 +486,46 @@ def get_all_pairs(source_models):
 '''
 
 
-def totalEXRxns(modelA,modelB): 
+def getEXRxns(model):
+    '''
+    This function creates an index of the exchange reactions of a species model. Reactions are considered exchange reactions if 'EX_' is found in their id, as in totalEXRxns. The index is built once per species and then shared by totalEXRxns and addEXMets2SpeciesEX, so that the reactions don't have to be searched again for each exchange reaction.
+    :param model: cobrapy Model object
+    :return exIndex: dictionary with the exchange reaction ids as keys and the corresponding Reaction objects of the model as values.
+    '''
+
+    exIndex = {}
+    for rxn in model.reactions:
+        if 'EX_' in rxn.id:
+            exIndex[rxn.id] = rxn
+
+    return exIndex
+
+
+def totalEXRxns(modelA,modelB,exIndexA=None,exIndexB=None): 
     '''
     This function creates a list object with the id (Reaction.id method from cobrapy) for all the unique exchange reactions found in both models listed (modelA, modelB). These exchange reactions are then differentiated from the reactions from models A and B by an additional tag in the end of the reaction id ([u])
     :param modelA: cobrapy Model object
     :param modelB: cobrapy Model object
+    :param exIndexA: index of the exchange reactions of modelA (output of getEXRxns). It is created if not given.
+    :param exIndexB: index of the exchange reactions of modelB (output of getEXRxns). It is created if not given.
     :return EX_finalRxns: list with the ids of all the unique exchange reactions from modelA and modelB.
     '''
 
     #cherrypy.log('Started function totalEXRxns. Working on %s as modelA and %s as modelB' %(modelA,modelB))
 
 
-    # List all the exchange reactions in modelA
-    EX_rxnsA = set()
-    for i in range(len(modelA.reactions)):
-        rxnsA = str(modelA.reactions[i])
-        if 'EX_' in rxnsA:
-            EX_rxnsA.add(rxnsA)
-    
-
-    #cherrypy.log('Finished finding all exchange reactions in modelA. There are %d of them' %(len(EX_rxnsA)))
-
-
-    # List all the exchange reactions in modelB
-    EX_rxnsB = set()
-    
-    for j in range(len(modelB.reactions)):
-        rxnsB = str(modelB.reactions[j])
-        if 'EX_' in rxnsB:
-            EX_rxnsB.add(rxnsB)
+    # List all the exchange reactions in modelA and modelB
+    if exIndexA is None:
+        exIndexA = getEXRxns(modelA)
+    if exIndexB is None:
+        exIndexB = getEXRxns(modelB)
 
 
-    #cherrypy.log('Finished finding all exchange reactions in modelB. There are %d of them' %(len(EX_rxnsB)))
+    #cherrypy.log('Finished finding all exchange reactions in modelA and modelB. There are %d and %d of them' %(len(exIndexA),len(exIndexB)))
 
 
-    # List all the different exchange reactions that are present in models A and B. They will have some that overlap.
-    EX_total =  list(EX_rxnsA | EX_rxnsB)
+    # List all the different exchange reactions that are present in models A and B. They will have some that overlap. The list is sorted so that the community models are always built in the same order.
+    EX_total = sorted(set(exIndexA) | set(exIndexB))
 
 
     #cherrypy.log('Finished creating a list with all the exchange reactions existing in the two models. There are %d of them' %(len(EX_total)))
@@ -97,6 +549,7 @@ def createEXmodel(EXreactions):
     :param EXreactions: list of reactions that are the output of the function totalEXRxns (above)
     :return exchange_model: cobrapy Model object for the compartment that will serve as an extra compartment in the full community model.
     '''
+    import cobra
 
 
     #cherrypy.log("Started the function that creates the exchange reactions for the community model")
@@ -104,19 +557,22 @@ def createEXmodel(EXreactions):
     exchange_model = cobra.Model('Model with the exchange reactions only')
 
     #cherrypy.log("Created the base exchange model object")
-    
+
+    # The reactions are added all at once. Reactions outside of a model have an objective coefficient of 0.
+    rxns = []
     for i in EXreactions: 
         new_i = str(i)
         new_i = new_i[3:]
-        new_met = cobra.Metabolite(new_i)
+        new_met = cobra.Metabolite(new_i, compartment='u')
         
         rxn = cobra.Reaction(i)
         rxn.lower_bound = -1000.000
         rxn.upper_bound = 1000.000
-        rxn.objective_coefficient = 0.000
         rxn.add_metabolites({new_met:-1.0}) 
         
-        exchange_model.add_reaction(rxn)
+        rxns.append(rxn)
+
+    exchange_model.add_reactions(rxns)
 
 
     #cherrypy.log('Finished adding all exchange reactions in exchange model object. There are %d of them' %(len(exchange_model.reactions)))
@@ -130,6 +586,7 @@ def createReverseEXmodel(EXreactions):
     :param EXreactions: list of reactions that are the output of the function totalEXRxns (above)
     :return exchange_modelRev: cobrapy Model object containing only exchange reactions with the production of their respective metabolites
     '''
+    import cobra
 
     #cherrypy.log("Started the function that creates the reverse exchange reactions for the community model")
 
@@ -137,18 +594,20 @@ def createReverseEXmodel(EXreactions):
 
     #cherrypy.log("Created the base reverse exchange model object")
 
+    rxns = []
     for i in EXreactions: 
         new_i = str(i)
         new_i = new_i[3:]
-        new_met = cobra.Metabolite(new_i)
+        new_met = cobra.Metabolite(new_i, compartment='u')
         
         rxn = cobra.Reaction(i)
         rxn.lower_bound = -1000.000
         rxn.upper_bound = 1000.000
-        rxn.objective_coefficient = 0.000
         rxn.add_metabolites({new_met:1.0})
         
-        exchange_modelRev.add_reaction(rxn)
+        rxns.append(rxn)
+
+    exchange_modelRev.add_reactions(rxns)
 
     #cherrypy.log('Finished adding all exchange reactions in reverse exchange model object. There are %d of them' %(len(exchange_modelRev.reactions)))
 
@@ -156,29 +615,30 @@ def createReverseEXmodel(EXreactions):
 
 
 
-def addEXMets2SpeciesEX(reverseEXmodel,speciesModel):
+def addEXMets2SpeciesEX(reverseEXmodel,speciesModel,exIndex=None):
     '''
     This function takes the model with exchange reactions where the metabolite is produced (output from function createReverseEXmodel) and a species model, and adds the metabolite from the reverse model to the exhange reactions of the species model. For instance:
     Reaction :  modelB_EX_cpd11588_e0 got the cpd11588_e0[u] added.
                 'model_B_cpd11588_e0 <=> cpd11588_e0[u]'
     This way, when a compound is exported to the extracellular environment, it is automatically transformed into a form that is common to all members in the community.
+    Each reverse exchange reaction is matched to the species exchange reaction with exactly the same id once the [u] tag is removed, using the index of exchange reactions of the species. Reactions are no longer matched by substring, which used to add EX_h2_e to the reaction of EX_h2o_e[u] as well.
     :param reverseEXmodel: cobrapy Model object containing only exchange reactions with the production of their respective metabolites
     :param speciesModel: Model object of a particular species.
+    :param exIndex: index of the exchange reactions of the species model (output of getEXRxns). It is created if not given.
     :return speciesModel: Model object of a particular species with updated exchange reactions are updated.
     '''
 
     #cherrypy.log('Started function to add metabolites to the exchange reactions of the reverse exchange model') #not right
 
-    for j in range(len(reverseEXmodel.reactions)):
-        exRxn = str(reverseEXmodel.reactions[j])
-        
-        for i in range(len(speciesModel.reactions)):
-            rxn = str(speciesModel.reactions[i])
-            if rxn in exRxn:
-                new_met = reverseEXmodel.reactions[j].metabolites 
-                speciesModel.reactions[i].add_metabolites(new_met)
-                speciesModel.reactions[i].lower_bound = -1000.000
-                speciesModel.reactions[i].upper_bound = 1000.000
+    if exIndex is None:
+        exIndex = getEXRxns(speciesModel)
+
+    for exRxn in reverseEXmodel.reactions:
+        rxn = exIndex.get(exRxn.id[:-len('[u]')])
+        if rxn is not None:
+            rxn.add_metabolites(exRxn.metabolites)
+            rxn.lower_bound = -1000.000
+            rxn.upper_bound = 1000.000
 
     #cherrypy.log('Finished adding metabolites to the exchange reactions of the reverse exchange model')
     return speciesModel       
@@ -197,7 +657,7 @@ def replaceRxns(model,modelID):
 
     
     for i in range(len(model.reactions)):
-        old_rxns = str(model.reactions[i])
+        old_rxns = model.reactions[i].id
         new_rxns = 'model' + modelID + '_' + old_rxns
         model.reactions[i].id = new_rxns
 
@@ -224,581 +684,4057 @@ def replaceMets(model,modelID):
 
 
 
-def createCommunityModel(modelFileA, modelFileB, comFolder):
+def loadModel(modelFile):
     '''
-    This function takes advantage of the outputs of all the functions defined previously to actually piece together the individual species models and the extra compartment model.
-    :param modelFileA: path to the metabolic model of species A in SBML format
-    :param modelFileB: path to the metabolic model of species B in SBML format
-    :param comFolder:  path to the folder where the metabolic models of the two-species communities will be stored.
-    :return two-species community model: in SBML format exported to the folder designated by the user (comFolder) to store these models
+    This function imports a metabolic model file into a Model object using cobrapy. The format of the file is chosen based on its extension (.mat, .xml, .sbml or .json).
+    :param modelFile: path to the metabolic model file
+    :return model: cobrapy Model object
     '''
-    
-    #cherrypy.log('Started function to create community models. ModelFileA is %s, ModelFileB is %s, and the folder where we are going to put the files in is %s' %(modelFileA, modelFileB, comFolder))
-
-    
-    #import the model file into the Model object model1 using cobrapy
-    try:
-        if modelFileA.endswith('.mat'):
-            #cherrypy.log('The extension is .mat .This is modelfileA %s' %modelFileA)
-            model1 = cobra.io.load_matlab_model(modelFileA)
-        elif modelFileA.endswith('.xml') or modelFileA.endswith('.sbml'):
-            #cherrypy.log('The extension is .xml or .sbml .This is modelfileA %s' %modelFileA)
-            model1 = cobra.io.read_sbml_model(modelFileA)
-        elif modelFileA.endswith('.json'):
-            #cherrypy.log('The extension is .json . This is modelfileA %s' %modelFileA)
-            model1 = cobra.io.load_json_model(modelFileA)
-        else:
-            #cherrypy.log('We were not able to find a model. This is modelfileA %s' %modelFileA)
-            print "not able to find model %s" %modelFileA
-    except Exception as e:
-        print e
-
-    #cherrypy.log('%s loaded successfully' %model1.id)
-
-    #import the model file into the Model object model2 using cobrapy
-    if modelFileB.endswith('.mat'):
-        #cherrypy.log('The extension is .mat .This is modelfileB %s' %modelFileB)
-        model2 = cobra.io.load_matlab_model(modelFileB)
-    elif modelFileB.endswith('.xml') or modelFileB.endswith('.sbml'):
-        #cherrypy.log('The extension is .xml or .sbml .This is modelfileB %s' %modelFileB)
-        model2 = cobra.io.read_sbml_model(modelFileB)
-    elif modelFileB.endswith('.json'):
-        #cherrypy.log('The extension is .json . This is modelfileB %s' %modelFileB)
-        model2 = cobra.io.load_json_model(modelFileB)
+    import cobra
+
+    if modelFile.endswith('.mat'):
+        #cherrypy.log('The extension is .mat .This is modelFile %s' %modelFile)
+        model = cobra.io.load_matlab_model(modelFile)
+    elif modelFile.endswith('.xml') or modelFile.endswith('.sbml'):
+        #cherrypy.log('The extension is .xml or .sbml .This is modelFile %s' %modelFile)
+        model = cobra.io.read_sbml_model(modelFile)
+    elif modelFile.endswith('.json'):
+        #cherrypy.log('The extension is .json . This is modelFile %s' %modelFile)
+        model = cobra.io.load_json_model(modelFile)
     else:
-        #cherrypy.log('We were not able to find a model. This is modelfileB %s' %modelFileB)
-        print "not able to find model %s" %modelFileB
-        
-    #cherrypy.log('%s loaded successfully' %model2.id)
+        #cherrypy.log('We were not able to find a model. This is modelFile %s' %modelFile)
+        raise IOError("not able to find model %s" %modelFile)
 
+    return model
 
-    # Create a communityID to identify the output files belonging to each 2-species community created
-    communityID = model1.id+ 'X' + model2.id
-
-    #cherrypy.log('The communityID (reflected in the filename is %s .'%communityID)
-    
 
-    # Get all the reactions identified as exchange reactions in both models you're mixing and create a list with of exchange reactions. Then use this list to create what is called an exchange reaction model. This exchange reaction model will be the equivalent of an outside world model, or the lumen for instance, as in the models in Heinken and Thiele AEM 2015 paper. Later manipulation of this particular model will allow the user to choose the diet under which the communities are growing.
-    #cherrypy.log('Lets actually run the function that creates te model with the exchange reactions.')
-    exModel = createEXmodel(totalEXRxns(model1, model2))
+def fileHash(path, blockSize=1 << 20):
+    '''
+    This function calculates the SHA-1 hash of the content of a file, which is used to recognise a model file that was already loaded even when it is found under a different name, and to notice when a model file has changed.
+    :param path: path to the file
+    :param blockSize: number of bytes read at a time
+    :return hexdigest: hexadecimal string with the hash of the file content
+    '''
+    import hashlib
 
-    
+    sha = hashlib.sha1()
+    modelFile = open(path, 'rb')
+    block = modelFile.read(blockSize)
+    while block:
+        sha.update(block)
+        block = modelFile.read(blockSize)
+    modelFile.close()
 
-    # Create a model that has the fluxes of the exchange reactions reversed. This is because these reactions will will added specifically to each species, in the model. So we are extending the original species models to have more reactions so that each species can exchange metabolites with exchange reactions model. The exchange reactions models then becomes a comparment shared by all the other species in the community model. This is what will allow us to determine how the species interact when they have to share resources.
-    #cherrypy.log('Lets actually run the function that creates te model with the reverse exchange reactions.')
-    revEXmodel = createReverseEXmodel(totalEXRxns(model1, model2))
+    return sha.hexdigest()
 
-    # Add a tag to the metabolite IDs of modelA and modelB.
-    #cherrypy.log('Lets actually run the function that replaces the metabolite IDs for modelA (%s) and modelB (%s).' %(model1,model2))
-    replaceMets(model1,'A')
-    replaceMets(model2,'B')
 
-    # Add the metabolites of the external model to the exchange reactions of each species.
-    #cherrypy.log('Lets add the metabolites to the exchange reactions of the species models')
-    new_m1 = addEXMets2SpeciesEX(revEXmodel,model1) 
-    new_m2 = addEXMets2SpeciesEX(revEXmodel,model2) 
+def speciesAvailability(models, dietValues, tolerance=1e-9):
+    '''
+    This function finds the metabolites of the [u] compartment that the species of a run may take up under a 'Diet'. The exchange reactions of the [u] compartment keep their lower bound of -1000 unless the 'Diet' changes it, so only the metabolites listed in the 'Diet' with no uptake are missing, and only if none of the species can secrete them. These are found by starting with all the metabolites available and removing, until nothing changes, the ones that no species can secrete (maximum flux of its exchange reaction, with flux variability analysis) with the metabolites still available. Starting from all of them keeps the metabolites that the species could only exchange with each other in a cycle.
+    :param models: list of cobrapy Model objects of all the species of the run
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :param tolerance: smaller secretion fluxes are considered zero
+    :return available: set of the ids of the exchange reactions of the species (without the [u] tag) whose metabolites may be available
+    '''
+    from cobra.flux_analysis import flux_variability_analysis
+
+    exIndexes = [getEXRxns(model) for model in models]
+    available = set()
+    for exIndex in exIndexes:
+        available.update(exIndex)
+    closed = set([rxnID[:-len('[u]')] for rxnID, value in dietValues if rxnID.endswith('[u]') and value <= 0]) & available
+
+    while True:
+        secreted = set()
+        for model, exIndex in zip(models, exIndexes):
+            candidates = [rxnID for rxnID in exIndex if rxnID in closed and rxnID not in secreted]
+            if not candidates:
+                continue
+            with model:
+                for rxnID, rxn in exIndex.items():
+                    rxn.bounds = (-1000. if rxnID in available else 0., 1000.)
+                try:
+                    fluxRanges = flux_variability_analysis(model, candidates, fraction_of_optimum=0., processes=1)
+                    secreted.update([rxnID for rxnID in candidates if fluxRanges.loc[rxnID, 'maximum'] > tolerance])
+                except Exception as e:
+                    # The species can't be analysed alone under these conditions, so it may secrete any of them
+                    log.warning('The secretions of %s could not be calculated: %s' %(model.id, e))
+                    secreted.update(candidates)
 
+        missing = set([rxnID for rxnID in closed if rxnID in available and rxnID not in secreted])
+        if not missing:
+            return available
+        available -= missing
 
-    # Add a tag to the reaction IDs of modelA and modelB.
-    #cherrypy.log('Lets replace the reaction IDs on the species models')
-    replaceRxns(new_m1,'A')
-    replaceRxns(new_m2,'B')
 
-    #cherrypy.log('Finished replacing the reaction IDs on the species models')
-    
-    
+def mergeLinearChains(model, protected=()):
+    '''
+    This function merges the pairs of reactions that are the only two reactions of a metabolite. At steady state the flux of one of them is then a fixed multiple of the flux of the other one, so they can be replaced by a single reaction (the first one, with the stoichiometry of the second one added in that proportion and the intersection of their bounds) without changing the fluxes the other reactions can carry. The metabolite is removed. Merging is repeated until no more reactions can be merged, so whole linear pathways become one reaction.
+    :param model: cobrapy Model object. It is changed in place.
+    :param protected: ids of the reactions that are kept as they are (e.g. the exchange and objective reactions)
+    :return merged: number of reactions removed
+    '''
+    protected = set(protected)
+    merged = 0
+
+    changed = True
+    while changed:
+        changed = False
+        for met in list(model.metabolites):
+            if met.model is None or len(met.reactions) != 2:
+                continue
+            rxn1, rxn2 = sorted(met.reactions, key=lambda rxn: rxn.id)
+            if rxn1.id in protected or rxn2.id in protected:
+                continue
 
-    # Actually create the community model. All previous steps were changing the models that will be put together in the community so that the reactions and metabolites for each organism can still be distinguished and there is proper compartmentalization of reactions and metabolites. Because you can't really create a model from the sum of other 2, I just created a new model (mix) that is exactly model1. The alternative would have been to create an empty model, then add the reactions and metabolites of model1, model2, and exModel.
-    #cherrypy.log('Now, after we prepared every piece, we are going to put it all together in a community model')
-    mix = new_m1
-    mix.id = communityID
-    mix.add_reactions(new_m2.reactions)
-    mix.add_metabolites(new_m2.metabolites)
-    mix.add_reactions(exModel.reactions)
-    mix.add_metabolites(exModel.metabolites)
+            # Steady state of met: a * v1 + b * v2 = 0, so v2 = k * v1
+            k = -rxn1.metabolites[met] / rxn2.metabolites[met]
+            if not 1e-6 < abs(k) < 1e6:
+                continue
+            if k > 0:
+                lower, upper = max(rxn1.lower_bound, rxn2.lower_bound / k), min(rxn1.upper_bound, rxn2.upper_bound / k)
+            else:
+                lower, upper = max(rxn1.lower_bound, rxn2.upper_bound / k), min(rxn1.upper_bound, rxn2.lower_bound / k)
+            if lower > upper:
+                continue
 
-    #cherrypy.log('A community model with the id %s was created. It has %d reactions and %d metabolites'%(mix.id, len(mix.reactions),len(mix.metabolites)))
+            stoichiometry = dict((other, k * coefficient) for other, coefficient in rxn2.metabolites.items() if other is not met)
+            stoichiometry[met] = -rxn1.metabolites[met]
+            rules = [rule for rule in (rxn1.gene_reaction_rule, rxn2.gene_reaction_rule) if rule]
 
-    # Export the newly created community model to its folder. The models should then be ready to be further analyzed on Widget 5
-    cobra.io.write_sbml_model(mix, "%s/community%s.sbml" %(comFolder,communityID))
+            model.remove_reactions([rxn2])
+            rxn1.add_metabolites(stoichiometry)
+            for other, coefficient in list(rxn1.metabolites.items()):
+                if abs(coefficient) < 1e-12:
+                    rxn1.add_metabolites({other: -coefficient})
+            rxn1.bounds = (lower, upper)
+            if len(rules) == 2:
+                rxn1.gene_reaction_rule = '(%s) and (%s)' %(rules[0], rules[1])
+            if met.model is not None and len(met.reactions) == 0:
+                model.remove_metabolites([met])
 
-    cherrypy.log('The model has been exported to the %s folder'%comFolder)
+            merged += 1
+            changed = True
 
+    return merged
 
-    
 
-def allPairComModels(listOfPairs,modelFolder,comFolder):
+class SpeciesCompression(object):
     '''
-    This function goes through a list with the models that should be paired together to form a community and creates the corresponding two-species community metabolic model using the function createCommunityModel
-    :param listOfPairs: file with pairs of species that will make up each 
-    two-species community metabolic model.
-    :param modelFolder: path to the folder containing the metabolic models of individual species in a SBML format
-    :param comFolder: path to the folder that will store the two-species community metabolic models.
-    :return set of two-species community metabolic models
+    Diet-aware compression of species models, applied once per species before the communities are built. The reactions that can't carry flux in any community built under the 'Diet' are removed: the blocked reactions of the species alone (find_blocked_reactions), with its exchange reactions open for the metabolites that may be available (speciesAvailability) and closed for the rest, as in the communities, where the exchange reactions of the species only exchange metabolites with the [u] compartment. The flux the other reactions can carry is the same, so the growth rates of the communities are the same (within the tolerance of the solver), with smaller linear programs. The linear chains of reactions are then merged (mergeLinearChains). The biomass (objective) reactions and the exchange reactions are never removed or merged.
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :param available: set of the ids of the exchange reactions whose metabolites may be available (output of speciesAvailability). If it is None, all of them are considered available, which is safe for any partner.
+    :param mergeChains: if True, the linear chains of reactions are merged
     '''
-    import os
 
-    #cherrypy.log('We are going to run the createCommunityModel script for all pairs of models in the %s file' %listOfPairs)
+    def __init__(self, dietValues, available=None, mergeChains=True):
+        import hashlib
+
+        self.dietID = dietHash(dietValues)
+        self.available = available
+        self.mergeChains = mergeChains
+        availableIDs = None
+        if available is not None:
+            availableIDs = sorted(available)
+        self.id = hashlib.sha1(json.dumps([self.dietID, availableIDs, mergeChains]).encode('utf-8')).hexdigest()[:16]
+        self.species = 0
+        self.blocked = 0
+        self.merged = 0
+        self.reactions = 0
+
+    def compress(self, model):
+        '''
+        Compresses a species model in place and returns it.
+        '''
+        from cobra.flux_analysis import find_blocked_reactions
+        from cobra.util.solver import linear_reaction_coefficients
 
-    # Check if the directory where two-species community models will be stored exists. If not, create it.
-    if not os.path.exists(comFolder):
-        os.makedirs(comFolder)
-    
-    pairsListFile = open(listOfPairs,'r')
-    pairsList = []
+        exIndex = getEXRxns(model)
+        objective = set([rxn.id for rxn in linear_reaction_coefficients(model)])
+        self.reactions += len(model.reactions)
 
+        with getRecorder().stage('compress'):
+            with model:
+                for rxnID, rxn in exIndex.items():
+                    rxn.bounds = (-1000. if self.available is None or rxnID in self.available else 0., 1000.)
+                try:
+                    blocked = find_blocked_reactions(model, processes=1)
+                except Exception as e:
+                    log.warning('The blocked reactions of %s could not be found, so it is not compressed: %s' %(model.id, e))
+                    return model
 
-    for i in pairsListFile:
-        i = i.rstrip()
-        i = i.replace("'","")
-        i = i.split()
-        pairsList.append(i)
-    
-    #cherrypy.log('We created a list with the list of model pairs that will be put together. This list has %d pairs.' %(len(pairsList)))
+            blocked = [rxnID for rxnID in blocked if rxnID not in objective]
+            model.remove_reactions(blocked, remove_orphans=True)
+            self.blocked += len(blocked)
 
-    # Go down the list containing pairs of species and create a two-species community model.
-    for i in range(len(pairsList)):
-        modelA = modelFolder + '%s' %pairsList[i][0]
-        modelA = str(modelA)
-        #cherrypy.log('The pair number %d will use file %s as modelA.' %(i,modelA))
+            if self.mergeChains:
+                self.merged += mergeLinearChains(model, set(getEXRxns(model)) | objective)
 
-        modelB = modelFolder + '%s' %pairsList[i][1]
-        modelB =str(modelB)
-        #cherrypy.log('The pair number %d will use file %s as modelB.' %(i,modelB))
-        try:
-            createCommunityModel(modelA,modelB,comFolder)
-        except Exception as e:
-            print e
-    
-    #cherrypy.log('We finished creating the models for all pairs in your list.')
+        self.species += 1
+        return model
 
-    pairsListFile.close()
+    def summary(self):
+        return 'Species compression: %d species, %d blocked reactions removed and %d merged out of %d.' %(self.species, self.blocked, self.merged, self.reactions)
 
 
-# In[3]:
+def pairsCompression(listOfPairs, diet, modelFolder='', cache=None, mergeChains=True):
+    '''
+    This function prepares the SpeciesCompression of the species of a run, finding the metabolites that may be available to them under the 'Diet' with all the species of the pairs (speciesAvailability).
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames
+    :param diet: path to the file with the metabolite availability conditions, or its values already loaded with loadDiet
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param cache: ModelCache object used to parse the models. It should not compress them yet.
+    :param mergeChains: if True, the linear chains of reactions are merged
+    :return compression: SpeciesCompression object, to be given to the ModelCache that loads the species of the communities
+    '''
+    if isinstance(listOfPairs, str):
+        listOfPairs = readPairsFile(listOfPairs)
+    if isinstance(diet, str):
+        diet = loadDiet(diet)
+    if cache is None:
+        cache = ModelCache(maxSize=1)
 
+    modelFiles = sorted(set([modelFile for pair in listOfPairs for modelFile in pair[:2]]))
+    available = speciesAvailability([cache.get(modelFolder + '%s' %modelFile) for modelFile in modelFiles], diet)
 
+    return SpeciesCompression(diet, available, mergeChains)
 
-def getListOfModels(comFolder):
+
+class ModelCache(object):
     '''
-    This function creates a list with all the community models that will be used in the analysis. It creates this list by listing the metabolic models in SBML format present in the user specified folder that contains the community models.
-    :param comFolder: path to the folder that contains the community metabolic models.
-    :return listOfModels: list object containing the filenames for all the models that will be analysed in the function calculateGR
+    Cache of parsed species models shared by all the pairs of a run. Each species takes part in many pairs, so instead of parsing its model file once per pair, the file is parsed the first time it is needed and the Model object is kept in memory. Models are identified by the path of the file and the hash of its content, so a file that changes during the run is read again. The in-memory tier keeps at most maxSize models and drops the least recently used one when it is full. If cacheDir is given, parsed models are also pickled to that folder, so that later runs (or other processes) can skip the parsing of the model files altogether. Callers always receive a copy of the cached model, since building a community changes the reaction and metabolite ids of the species models.
+    If a SpeciesCompression is given, the models are compressed once when they are parsed, and the compressed models are the ones kept in memory and on disk.
+    :param maxSize: maximum number of models kept in memory
+    :param cacheDir: path to the folder used for the on-disk tier of the cache. No models are written to disk if it is None.
+    :param compression: SpeciesCompression object applied to the models
     '''
 
-    import os
-    #cherrypy.log('We will first get the full list of community models from the %s folder' %comFolder)
-    
-    path = comFolder+"/"
-    listOfFiles = os.listdir(path)
+    def __init__(self, maxSize=256, cacheDir=None, compression=None):
+        from collections import OrderedDict
 
-    listOfModels = []
-    
-    for file in listOfFiles:
-        if (file.endswith('.sbml') or file.endswith('.xml')):
-            pathToFile = path + file
-            listOfModels.append(pathToFile)
+        self.maxSize = maxSize
+        self.cacheDir = cacheDir
+        self.compression = compression
+        self.models = OrderedDict()
+        self.speciesArrays = OrderedDict()
+        self.hashes = {}
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
 
-    #cherrypy.log('There are %s community models what will be analyzed.'%listOfModels)
+        if cacheDir is not None and not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
 
-    return listOfModels
+    def key(self, modelFile):
+        '''
+        Returns the key used for a model file, (path, content hash). The hash is only calculated again if the size or modification time of the file changed.
+        '''
+        path = os.path.abspath(modelFile)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime)
+        if path not in self.hashes or self.hashes[path][0] != signature:
+            self.hashes[path] = (signature, fileHash(path))
+        return path, self.hashes[path][1]
+
+    def modelKey(self, modelFile):
+        '''
+        Returns the key of the model returned for a model file: the hash of the file content, followed by the id of the SpeciesCompression if there is one. It identifies the species in a CommunityArchive, a ResultStore or a SoloGrowth memo.
+        '''
+        if self.compression is None:
+            return self.key(modelFile)[1]
+        return self.key(modelFile)[1] + '.' + self.compression.id
 
+    def get(self, modelFile):
+        '''
+        Returns a copy of the species model in modelFile, parsing the file only if the model is not in the cache.
+        '''
+        import pickle
 
-def calculateGR(diet, comFolder, OutFile="OutputGR.txt"):
-    '''
-    In this function we use cobrapy to calculate the growth rates of the two species that make up the two species community metabolic models under particular metabolite availability conditions. We start by loading the community model (full model) into 3 distinct Model objects with cobrapy. We then change the fluxes of the exchange reactions of the external model so they have lower bounds corresponding to whichever 'Diet' condition the user specifies. We then run a flux balance analysis on the full model, optimizing the biomass reactions of the two species that make up the community at the same time. It then remove all reactions whose IDs start with modelA from the model in modelMinusA, thus leaving only the reactions from modelB and from the external compartment. It then runs a FBA on it, maximizing the biomass reaction for the model with the tag modelB. It then does the samething but for reactions tagged with modelB on modelMinusB. The optimal flux values for the biomass reactions of each species resulting from optimization in the full model and in each model containing only one species, which correspond to predicted growth rates, are then exported to a table in the tab-delimited text formal to a folder chosen by the user.
-    :param diet: the metabolite availability conditions. Default on MMinte is complete, but the user can choose another value ('Variant1 through 10')
-    :param comFolder: path to the folder containing all the two-species community metabolic models.
-    :return outputGRs: table with growth rate information for each of the species belonging to a two-species community metabolic model in the presence and absence of another species.
-    '''
-    growth_rate_cutoff = 1e-6
-    #cherrypy.log('We will now calculate the growth rates of the two species in a community model in the presence and absence of the other species')
-    growthRatesFile = open(OutFile,'a+')
-    print>>growthRatesFile, 'ModelName', '\t', 'ObjFuntionSpeciesA', '\t', 'ObjFunctionSpeceisB', '\t', 'GRSpeciesAFull','\t', 'GRSpeciesBFull','\t','GRASolo','\t','GRBSolo'
-    
+        key = self.key(modelFile)
+        if self.compression is not None:
+            key = (key[0], self.modelKey(modelFile))
 
-    # Create a list of all the models that will be analysed
-    allModels = getListOfModels(comFolder)
+        if key in self.models:
+            self.hits += 1
+            model = self.models.pop(key)
+        else:
+            model = None
+            if self.cacheDir is not None:
+                pickled = os.path.join(self.cacheDir, key[1] + '.pickle')
+                if os.path.exists(pickled):
+                    try:
+                        pickleFile = open(pickled, 'rb')
+                        model = pickle.load(pickleFile)
+                        pickleFile.close()
+                        self.diskHits += 1
+                    except Exception as e:
+                        log.warning('The cached model %s could not be read, %s is parsed again: %s' %(pickled, modelFile, e))
+                        model = None
+            if model is None:
+                self.misses += 1
+                model = loadModel(modelFile)
+                if self.compression is not None:
+                    model = self.compression.compress(model)
+                if self.cacheDir is not None:
+                    pickleFile = open(pickled + '.tmp', 'wb')
+                    pickle.dump(model, pickleFile, pickle.HIGHEST_PROTOCOL)
+                    pickleFile.close()
+                    os.rename(pickled + '.tmp', pickled)
+
+        # The most recently used model goes to the end, the least recently used one is dropped if the cache is full.
+        self.models[key] = model
+        while len(self.models) > self.maxSize:
+            self.models.popitem(last=False)
+
+        return model.copy()
+
+    def arrays(self, modelFile):
+        '''
+        Returns the SpeciesArrays of the species model in modelFile, used to assemble community models with CommunityLP. They are kept in the cache as well, and are not copied, since assembling a community doesn't change them.
+        '''
+        key = (self.key(modelFile)[0], self.modelKey(modelFile))
 
+        if key in self.speciesArrays:
+            self.hits += 1
+            speciesArrays = self.speciesArrays.pop(key)
+        else:
+            speciesArrays = SpeciesArrays(self.get(modelFile))
 
-    for item in range(len(allModels)):
-        
+        self.speciesArrays[key] = speciesArrays
+        while len(self.speciesArrays) > self.maxSize:
+            self.speciesArrays.popitem(last=False)
+
+        return speciesArrays
+
+    def summary(self):
         '''
-        @summary: load the model, all versions that will be manipulated in the analysis.
+        Returns a short report of the number of cache hits and misses.
         '''
-        try:
-        # Import the models with cobrapy
-            #cherrypy.log(allModels[item])
-            modelFull = cobra.io.read_sbml_model(allModels[item])
-            modelMinusA = cobra.io.read_sbml_model(allModels[item])
-            modelMinusB = cobra.io.read_sbml_model(allModels[item])
+        text = 'Species model cache: %d hits in memory, %d hits on disk, %d misses (models parsed from file).' %(self.hits, self.diskHits, self.misses)
+        if self.compression is not None:
+            text += ' ' + self.compression.summary()
+        return text
 
-            #cherrypy.log('We successfully loaded the file %s into three different Model objects with ids, %s, %s, and %s. They should all have the same id.'%(allModels[item],modelFull.id,modelMinusA.id,modelMinusB.id))
-        
-        # Determine what the objective function is. It should be composed of two reactions, the biomass reactions for each of the species that compose the model. Store the biomass reactions in a new variable to be used later.
-            ObjKeys = modelFull.objective.keys()
-            idObjKeys = ObjKeys[0].id, ObjKeys[1].id
-        
-        # Open the metabolite conditions file ('Diet')
-            dietValues = open(diet,'r')
+
+def buildCommunityModel(model1, model2):
+    '''
+    This function takes advantage of the outputs of all the functions defined previously to actually piece together the individual species models and the extra compartment model, in memory. The two species models are changed in place, so copies should be given if the original models are still needed.
+    :param model1: cobrapy Model object of species A
+    :param model2: cobrapy Model object of species B
+    :return mix: cobrapy Model object of the two-species community, with id model1.id + 'X' + model2.id
+    '''
+    from cobra.util.solver import linear_reaction_coefficients
+
+    # Create a communityID to identify the output files belonging to each 2-species community created
+    communityID = model1.id+ 'X' + model2.id
+
+    #cherrypy.log('The communityID (reflected in the filename is %s .'%communityID)
     
-        # Default 'Diet' for MMinte is Complete. After choosing the 'Diet' change the lower bounds for the exchange reactions of the external compartment.
 
-#            cherrypy.log('The diet chosen for this particular run of the functions was %s' %diet)
-            #cherrypy.log(str(modelFull))
-            for line in dietValues:
-                try:
-                    new_line = line.rstrip('\n').split('\t')
-                    modelFull.reactions.get_by_id(new_line[0]).lower_bound = -float(new_line[1])
-                    modelMinusA.reactions.get_by_id(new_line[0]).lower_bound = -float(new_line[1])
-                    modelMinusB.reactions.get_by_id(new_line[0]).lower_bound = -float(new_line[1])
-                    #cherrypy.log(new_line[0]+"found")
-                except:
-                    #cherrypy.log(new_line[0])
-                    continue
+    recorder = getRecorder()
 
+    with recorder.stage('exchanges'):
+        # Index the exchange reactions of each species once. The same indexes are used to list the exchange reactions of the community and to connect the species exchange reactions to the extra compartment.
+        exIndex1 = getEXRxns(model1)
+        exIndex2 = getEXRxns(model2)
+        EXreactions = totalEXRxns(model1, model2, exIndex1, exIndex2)
 
-            #cherrypy.log('We finished changing the lower bounds for the fluxes of the exchange reactions in the models to better fit the availability of metabolites for the microbial communities we are simulating the growth of. ')
-            dietValues.close()
+        # Get all the reactions identified as exchange reactions in both models you're mixing and create a list with of exchange reactions. Then use this list to create what is called an exchange reaction model. This exchange reaction model will be the equivalent of an outside world model, or the lumen for instance, as in the models in Heinken and Thiele AEM 2015 paper. Later manipulation of this particular model will allow the user to choose the diet under which the communities are growing.
+        exModel = createEXmodel(EXreactions)
 
-        # Run FBA on Full model
-            modelFull.optimize()
-        
+        # Create a model that has the fluxes of the exchange reactions reversed. This is because these reactions will will added specifically to each species, in the model. So we are extending the original species models to have more reactions so that each species can exchange metabolites with exchange reactions model. The exchange reactions models then becomes a comparment shared by all the other species in the community model. This is what will allow us to determine how the species interact when they have to share resources.
+        revEXmodel = createReverseEXmodel(EXreactions)
 
+    # Keep the objective functions (biomass reactions) of both species, so that the community objective can be set once all the reactions are in the same model.
+    objective = {}
+    objective.update(linear_reaction_coefficients(model1))
+    objective.update(linear_reaction_coefficients(model2))
 
-        #cherrypy.log('The objective function of the full model, %s, contains the objective functions of the two models that make it up. They are %s.'%(allModels[item], idObjKeys))
+    with recorder.stage('rename'):
+        # Add a tag to the metabolite IDs of modelA and modelB.
+        replaceMets(model1,'A')
+        replaceMets(model2,'B')
 
-        #cherrypy.log('We finished running the FBA on the full model. The status of the solution is %s and the value of the solution found is %f'%(modelFull.solution.status,modelFull.solution.f))
+        # Add the metabolites of the external model to the exchange reactions of each species.
+        new_m1 = addEXMets2SpeciesEX(revEXmodel,model1,exIndex1) 
+        new_m2 = addEXMets2SpeciesEX(revEXmodel,model2,exIndex2) 
 
-        # Find which reactions are tagged as being from modelA, store them in a list, then create the modelMinusA, that is, remove all reactions that are part of one of the species in the model.
-        # Run FBA on that reduced model.
+        # Add a tag to the reaction IDs of modelA and modelB.
+        replaceRxns(new_m1,'A')
+        replaceRxns(new_m2,'B')
 
-            #cherrypy.log('We are now going to remove all reactions that are tagged as being of species A from the model.')
+    # Actually create the community model. All previous steps were changing the models that will be put together in the community so that the reactions and metabolites for each organism can still be distinguished and there is proper compartmentalization of reactions and metabolites. Because you can't really create a model from the sum of other 2, I just created a new model (mix) that is exactly model1. The alternative would have been to create an empty model, then add the reactions and metabolites of model1, model2, and exModel.
+    with recorder.stage('merge') as event:
+        mix = new_m1
+        mix.id = communityID
+        mix.add_reactions(new_m2.reactions)
+        mix.add_reactions(exModel.reactions)
+        mix.objective = dict((mix.reactions.get_by_id(rxn.id), coefficient) for rxn, coefficient in objective.items())
+        recordModelSize(event, mix)
 
-            listSilentItemsA = []
-        
-            for item in modelMinusA.reactions:
-                item = str(item)
-                if item.startswith('modelA_'):
-                    listSilentItemsA.append(item)
+    return mix
 
-            #cherrypy.log('We found %d reactions tagged as being of species A'%len(listSilentItemsA))
 
+def createCommunityModel(modelFileA, modelFileB, comFolder, cache=None):
+    '''
+    This function loads the metabolic models of two species, pieces them together in a two-species community model with the function buildCommunityModel and exports it to the community models folder.
+    :param modelFileA: path to the metabolic model of species A in SBML format
+    :param modelFileB: path to the metabolic model of species B in SBML format
+    :param comFolder:  path to the folder where the metabolic models of the two-species communities will be stored.
+    :param cache: ModelCache object with the species models already parsed. If it is None, the model files are read from disk.
+    :return two-species community model: in SBML format exported to the folder designated by the user (comFolder) to store these models
+    '''
+    import cobra
+    
+    #cherrypy.log('Started function to create community models. ModelFileA is %s, ModelFileB is %s, and the folder where we are going to put the files in is %s' %(modelFileA, modelFileB, comFolder))
 
-            for j in listSilentItemsA:
-                rxn = j.strip()
-                deadRxnA = modelMinusA.reactions.get_by_id(rxn)
-                deadRxnA.remove_from_model()
+    
+    recorder = getRecorder()
 
-            #cherrypy.log('We finished removing all reactions from the model. The model now has %s reactions and the reaction on the objective function in %s'%(len(modelMinusA.reactions),modelMinusA.objective))
-        
-            modelMinusA.optimize()
+    #import the model files into the Model objects model1 and model2 using cobrapy, or get a fresh copy of them from the cache of species models
+    with recorder.stage('load'):
+        if cache is not None:
+            model1 = cache.get(modelFileA)
+            model2 = cache.get(modelFileB)
+        else:
+            model1 = loadModel(modelFileA)
+            model2 = loadModel(modelFileB)
 
-            #cherrypy.log('We finished running the FBA on the model without reactions of species A. The status of the solution is %s and the value of the solution found is %f'%(modelMinusA.solution.status,modelMinusA.solution.f))
+    mix = buildCommunityModel(model1, model2)
+    if cache is not None:
+        setMemberKeys(mix, [cache.modelKey(modelFileA), cache.modelKey(modelFileB)])
+    else:
+        setMemberKeys(mix, [fileHash(modelFileA), fileHash(modelFileB)])
 
+    # Export the newly created community model to its folder. The models should then be ready to be further analyzed on Widget 5
+    with recorder.stage('write'):
+        cobra.io.write_sbml_model(mix, "%s/community%s.sbml" %(comFolder,mix.id))
 
-        # Find which reactions are tagged as being from modelB, store them in a list, then create the modelMinusB, that is, remove all reactions that are part of one of the species in the model.
-        # Run FBA on that reduced model.
 
-            #cherrypy.log('We are now going to remove all reactions that are tagged as being of species B from the model.')
+    
 
-            listSilentItemsB = []
-        
-            for item in modelMinusB.reactions:
-                item = str(item)
-                if item.startswith('modelB_'):
-                    listSilentItemsB.append(item)
-
-            #cherrypy.log('We found %d reactions tagged as being of species B'%len(listSilentItemsB))
-            for j in listSilentItemsB:
-                rxn = j.strip()
-                deadRxnB = modelMinusB.reactions.get_by_id(rxn)
-                deadRxnB.remove_from_model()
-
-            #cherrypy.log('We finished removing all reactions from the model. The model now has %s reactions and the reaction on the objective function in %s'%(len(modelMinusB.reactions),modelMinusB.objective))
-        
-            modelMinusB.optimize()
+def readPairsFile(listOfPairs):
+    '''
+    This function reads the file with the pairs of species that will make up each two-species community, one pair per line, with the two model filenames separated by white space (as written from the output of get_all_pairs).
+    :param listOfPairs: path to the file with pairs of species
+    :return pairsList: list with the two model filenames of each pair
+    '''
 
-            #cherrypy.log('We finished running the FBA on the model without reactions of species A. The status of the solution is %s and the value of the solution found is %f'%(modelMinusB.solution.status,modelMinusB.solution.f))
+    pairsListFile = open(listOfPairs,'r')
+    pairsList = []
 
+    for i in pairsListFile:
+        i = i.rstrip()
+        i = i.replace("'","")
+        i = i.split()
+        if len(i) >= 2:
+            pairsList.append(i)
 
-        # Get the x_dict values (fluxes) for the reactions listed under idObjKeys for all three models.
-        # Output them to a file with a table that has the information about the model, the species ID in the model, and the growth rates of each species in the full model and in isolation.
+    pairsListFile.close()
 
+    return pairsList
 
-            ObjA = []
-            ObjB = []
-        
-            if idObjKeys[0].startswith('modelA'):
-                ObjA = idObjKeys[0]
-            else:
-                ObjB = idObjKeys[0]
-            
-        
-            if idObjKeys[1].startswith('modelB'):
-                ObjB = idObjKeys[1]
-            else:
-                ObjA = idObjKeys[1]
 
-            #cherrypy.log('We matched the reactions in the objective function to the model they came from. %s was originally from modelA and %s was originally from mobelB' %(ObjA,ObjB))
-        
-            grAfull = modelFull.solution.x_dict[ObjA]
-            grBfull = modelFull.solution.x_dict[ObjB]
+def pairID(pair):
+    '''
+    Returns the id used for a pair of species in the traces of the recorder, made from the two model filenames (without folder and extension) as the id of their community model is made from the two model ids.
+    :param pair: list or tuple with the two model filenames
+    :return pairID: e.g. 'sp0Xsp1' for the pair ('sp0.xml', 'sp1.xml')
+    '''
+    return 'X'.join([os.path.splitext(os.path.basename(modelFile))[0] for modelFile in pair])
 
-            #cherrypy.log("We are going to create a table with the information about the growth of A and B alone and in the presence of B and A respectively.")
-        
-            if ObjA in modelMinusA.solution.x_dict:
-                grAMinusA = modelMinusA.solution.x_dict[ObjA]
-            else:
-                grAMinusA = 'Solo'
-        
-        
-            if ObjB in modelMinusA.solution.x_dict:
-                grBMinusA = modelMinusA.solution.x_dict[ObjB]
-            else:
-                grBMinusA = 'Solo'
-        
-        
-            if ObjA in modelMinusB.solution.x_dict:
-                grAMinusB = modelMinusB.solution.x_dict[ObjA]
-            else:
-                grAMinusB = 'Solo'
-        
-        
-            if ObjB in modelMinusB.solution.x_dict:
-                grBMinusB = modelMinusB.solution.x_dict[ObjB]
-            else:
-                grBMinusB = 'Solo'
-
-            if grAMinusA != 'Solo' or grBMinusB != 'Solo':
-                cherrypy.log('There is a problem with the attribution of growth rate values to their respective species in model %s .'%modelFull.id)
-
-
-            modelID = modelFull.id
-            organisms = modelID.split('X')
-        #grAfull,'\t', grBfull,'\t',grAMinusB,'\t',grBMinusA
-            # Round very small growth rates to zero.
-            if grAfull < growth_rate_cutoff:
-                grAfull = 0.
-            if grBfull < growth_rate_cutoff:
-                grBfull = 0.
-            if grAMinusB < growth_rate_cutoff:
-                grAMinusB = 0.
-            if grBMinusA < growth_rate_cutoff:
-                grBMinusA = 0.
-
-            print>> growthRatesFile, modelID, '\t', organisms[0], '\t', organisms[1], '\t', grAfull,'\t', grBfull,'\t',grAMinusB,'\t',grBMinusA
-            cherrypy.log("next")
-        except: 
-            #cherrypy.log("model had problems")
-            continue
-    #cherrypy.log('We finished calculating the growth rates of the species in isolation and when in the presence of another species and dumped the information to the file: %s' %growthRatesFile)
-    growthRatesFile.close()
 
+def schedulePairs(pairs, species=None):
+    '''
+    This function orders the pairs so that consecutive pairs share a species as often as possible, so that the optimization of each community can start from the basis of the previous one (see WarmStart). All the pairs of one species are taken in their original order, and then all the remaining pairs of the other species of the last pair, and so on, starting again from the first pair left when the chain breaks. For the pairs made by get_all_pairs every pair shares a species with the previous one.
+    :param pairs: list of pairs, or of items made of two species (e.g. community model files)
+    :param species: function returning the two species of an item. Defaults to its first two elements.
+    :return pairs: the same pairs, in the order they should be evaluated
+    '''
 
+    if species is None:
+        species = lambda pair: (pair[0], pair[1])
 
+    members = [tuple(species(pair)) for pair in pairs]
+    pairsOf = {}
+    for position, pairMembers in enumerate(members):
+        for member in set(pairMembers):
+            pairsOf.setdefault(member, []).append(position)
 
-def calculate_growth_rates_multiproc(diet,comFolder,n_processes=32):
-    """ Calculate growth rates for the pairs in a community.
-    The medium is a dictionary with an exchange reaction ID as the key and the
-    absolute value of bound in direction of metabolite creation as the value
-    (i.e. lower bound for `met <--` or upper bound for `met -->`). For example,
-    {'EX_h2o': 0.0, 'EX_h2s': 1.0, 'EX_pi': 10.0, ...}
-    Parameters
-    ----------
-    pair_models : list of str
-        List of path names to two species community model files
-    medium : dict
-        Dictionary with exchange reaction ID as key and bound as value
-    n_processes: int, optional
-        Number of processes in job pool
-    Returns
-    -------
-    pandas.DataFrame
-        Results of growth rate calculations
-    """
-    pool = Pool(n_processes)
-    result_list = [pool.apply(calculateGR,args=(diet, comFolder+"/"+i))
-    for i in os.listdir(comFolder)]
-    pool.close()
+    # Position of the first pair of each species that may not have been scheduled yet
+    pending = dict((member, 0) for member in pairsOf)
+    done = [False] * len(pairs)
+    order = []
+    first = 0
+    anchor = None
 
-# In[5]:
+    while len(order) < len(pairs):
+        if anchor is not None:
+            while pending[anchor] < len(pairsOf[anchor]) and done[pairsOf[anchor][pending[anchor]]]:
+                pending[anchor] += 1
+        if anchor is None or pending[anchor] == len(pairsOf[anchor]):
+            while done[first]:
+                first += 1
+            anchor = members[first][0]
 
+        for position in pairsOf[anchor][pending[anchor]:]:
+            if not done[position]:
+                done[position] = True
+                order.append(position)
+        pending[anchor] = len(pairsOf[anchor])
 
+        last = members[order[-1]]
+        anchor = last[-1] if last[0] == anchor else last[0]
 
-def evaluateInteractions(inGRs, outInter):
+    return [pairs[position] for position in order]
+
+
+def communityPairID(modelFile):
     '''
-    This function goes over the file with the growth rates of the species that make up a two-species community model and determines the kind of interaction occurring in between the two species. The types interactions are determined according to the paper by Heinken and Thiele 2015 AEM. These are determined based on the amplitude of change in growth rate of species in the presence and absence of another species in the community (>10% of change in growth of the particular species when in the presence of another species relative to the absence of another species indicates significant interaction), and the sign of the change (positive or negative). The information about the calculations of change and the type of interaction predicted in each community is added to the original table with the growth rates.
-    :param inGRs: path to the file with the table listing the growth rates of the two species in a two-species community metabolic model in the presence and absence of another species in the community.
-    :param outInter: path to the file that will contain the information contained in the file with growth rates, plus information regarding the the types of interactions predicted to be occurring in the community
-    :return outInter: file with the interactions that are predicted to be occurring between species in a two-species community.
+    Returns the id of the pair of a community model file from its name, 'community<speciesA>X<speciesB>.sbml' as written by createCommunityModel, which is the id of the community model.
+    '''
+    name = os.path.splitext(os.path.basename(modelFile))[0]
+    if name.startswith('community'):
+        name = name[len('community'):]
+    return name
+
+
+def communitySpecies(modelFile):
+    '''
+    Returns the two species of a community model file from its name, 'community<speciesA>X<speciesB>.sbml' as written by createCommunityModel, for schedulePairs. If the name can't be split in two, the whole name is returned as both species.
+    '''
+    name = communityPairID(modelFile)
+    organisms = name.split('X')
+    if len(organisms) != 2:
+        return name, name
+    return organisms[0], organisms[1]
+
+
+def allPairComModels(listOfPairs,modelFolder,comFolder,cache=None,cacheDir=None,compression=None):
+    '''
+    This function goes through a list with the models that should be paired together to form a community and creates the corresponding two-species community metabolic model using the function createCommunityModel. Each species model is parsed only once for all the pairs it takes part in, using a ModelCache, and the number of cache hits and misses is reported at the end of the run.
+    :param listOfPairs: file with pairs of species that will make up each 
+    two-species community metabolic model, or list of pairs of model filenames.
+    :param modelFolder: path to the folder containing the metabolic models of individual species in a SBML format
+    :param comFolder: path to the folder that will store the two-species community metabolic models.
+    :param cache: ModelCache object to use. A new one is created if it is None.
+    :param cacheDir: path to the folder for the on-disk tier of the new cache. Only used if cache is None.
+    :param compression: SpeciesCompression object applied to the species models by the new cache (see pairsCompression). Only used if cache is None.
+    :return set of two-species community metabolic models
     '''
+    import os
 
-    cherrypy.log("We will use the information on the growth rates of the species in file %s to determine what kind of interaction is occurring between the organisms. We will output the table of interactions to %s. We will also count how many instances of each type of interaction are found" %(inGRs,outInter))
+    #cherrypy.log('We are going to run the createCommunityModel script for all pairs of models in the %s file' %listOfPairs)
 
-    grFile = open(inGRs, 'r')
+    # Check if the directory where two-species community models will be stored exists. If not, create it.
+    if not os.path.exists(comFolder):
+        os.makedirs(comFolder)
 
-    interactionsTableFile = open(outInter,'w')
+    # The species models are parsed once and then copied from the cache for each pair
+    if cache is None:
+        cache = ModelCache(cacheDir=cacheDir, compression=compression)
     
-    print>> interactionsTableFile, 'Model','\t','GenomeIDSpeciesA', '\t','GenomeIDSpeciesB','\t','GRSpeciesAFull','\t','GRSpeciesBFull','\t','GRASolo','\t','GRBSolo','\t','PercentChangeRawA','\t','PercentChangeRawB','\t', 'TypeOfInteraction'
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
     
-    #next(grFile)
+    #cherrypy.log('We created a list with the list of model pairs that will be put together. This list has %d pairs.' %(len(pairsList)))
 
-    # We will count how many times each interaction is predicted to occur. This information is shown in the terminal window and in the logError file.
-    countMutualism = 0
-    countParasitism = 0
-    countCommensalism = 0
-    countCompetition = 0
-    countAmensalism = 0
-    countNeutralism = 0
+    # Go down the list containing pairs of species and create a two-species community model.
+    for i in range(len(pairsList)):
+        modelA = modelFolder + '%s' %pairsList[i][0]
+        modelA = str(modelA)
+        #cherrypy.log('The pair number %d will use file %s as modelA.' %(i,modelA))
+
+        modelB = modelFolder + '%s' %pairsList[i][1]
+        modelB =str(modelB)
+        #cherrypy.log('The pair number %d will use file %s as modelB.' %(i,modelB))
+        try:
+            with getRecorder().pair(pairID(pairsList[i])):
+                createCommunityModel(modelA,modelB,comFolder,cache)
+        except Exception as e:
+            log.warning('The community model of %s and %s could not be created: %s' %(modelA, modelB, e))
+    
+    #cherrypy.log('We finished creating the models for all pairs in your list.')
 
+    log.info(cache.summary())
 
 
-    for item in grFile:
-        
-        item = item.replace("_",".")
-        item = item.replace("A.","")
-        item = item.replace(".model","")
+# In[3]:
 
 
-        try:
-            itemNew = item.split('\t')
-            item = item.rstrip()
 
-            # Calculation of the effect of the presence of a competing species in the growht rate of species A
-            if float(itemNew[5]) != 0:
-                percentChangeRawA = (float(itemNew[3])-float(itemNew[5]))/float(itemNew[5])
-            else:
-                percentChangeRawA = (float(itemNew[3])-float(itemNew[5]))/float(1e-25)
+def getListOfModels(comFolder):
+    '''
+    This function creates a list with all the community models that will be used in the analysis. It creates this list by listing the metabolic models in SBML format present in the user specified folder that contains the community models.
+    :param comFolder: path to the folder that contains the community metabolic models.
+    :return listOfModels: list object containing the filenames for all the models that will be analysed in the function calculateGR
+    '''
 
+    import os
+    #cherrypy.log('We will first get the full list of community models from the %s folder' %comFolder)
+    
+    path = comFolder+"/"
+    listOfFiles = os.listdir(path)
 
-            # Calculation of the effect of the presence of a competing species in the growht rate of species B
-            if float(itemNew[6]) != 0:
-                percentChangeRawB = (float(itemNew[4])-float(itemNew[6]))/float(itemNew[6])
-            else:
-                percentChangeRawB = (float(itemNew[4])-float(itemNew[6]))/float(1e-25)
-        
-            # Assign a type of interaction to the community based on the percent change
-            #cherrypy.log('For this item, species A changed %f percent, and species B changed %f percent.'%(percentChangeRawA,percentChangeRawB))
+    listOfModels = []
+    
+    for file in listOfFiles:
+        if (file.endswith('.sbml') or file.endswith('.xml')):
+            pathToFile = path + file
+            listOfModels.append(pathToFile)
 
-            if percentChangeRawA > 0.1 and percentChangeRawB > 0.1:
-                typeOfInteraction = 'Mutualism'
-                countMutualism += 1
+    #cherrypy.log('There are %s community models what will be analyzed.'%listOfModels)
 
-            elif percentChangeRawA > 0.1 and percentChangeRawB < -0.1:
-                typeOfInteraction ='Parasitism'
-                countParasitism += 1
+    return listOfModels
 
-            elif percentChangeRawA > 0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
-                typeOfInteraction = 'Commensalism'
-                countCommensalism += 1
 
-            elif percentChangeRawA < -0.1 and percentChangeRawB > 0.1:
-                typeOfInteraction = 'Parasitism'
-                countParasitism += 1
+def loadDiet(diet):
+    '''
+    This function reads the metabolite availability conditions file ('Diet') a single time, so that the same values can be applied to as many community models as needed without re-opening the file for each one of them. Each line of the file has the id of an exchange reaction of the external compartment (e.g. EX_h2_e[u]) and the maximum uptake for that metabolite, separated by a tab. Lines that can't be read this way are skipped, as they were when the diet was applied line by line.
+    :param diet: path to the file with the metabolite availability conditions.
+    :return dietValues: list of tuples with the exchange reaction id and the uptake value, in the order they appear in the file.
+    '''
 
-            elif percentChangeRawA < -0.1 and percentChangeRawB < -0.1:
-                typeOfInteraction = 'Competition'
-                countCompetition += 1
+    dietValues = []
 
-            elif percentChangeRawA < -0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
-                typeOfInteraction = 'Amensalism'
-                countAmensalism += 1
+    dietFile = open(diet,'r')
+    for line in dietFile:
+        new_line = line.rstrip('\n').split('\t')
+        try:
+            dietValues.append((new_line[0], float(new_line[1])))
+        except (IndexError, ValueError):
+            continue
+    dietFile.close()
 
-            elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB > 0.1:
-                typeOfInteraction = 'Commensalism'
-                countCommensalism += 1
+    return dietValues
 
-            elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB < -0.1:
-                typeOfInteraction = 'Amensalism'
-                countAmensalism += 1
 
-            elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
-                typeOfInteraction = 'Neutralism'
-                countNeutralism += 1
+def setDietBounds(model, dietValues):
+    '''
+    This function changes the lower bounds of the exchange reactions of the external compartment of a community model so that they correspond to the 'Diet' loaded with the function loadDiet. Exchange reactions listed in the diet but not present in the model are ignored.
+    :param model: cobrapy Model object of a two-species community
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :return model: same model with the updated lower bounds
+    '''
 
-            else:
-                typeOfInteraction = 'Empty'
-                #cherrypy.log('Attention! For model %s , an interaction was identified as Empty. Something is wrong!' %item[0])#todo print out to user
+    for rxnID, value in dietValues:
+        if rxnID in model.reactions:
+            model.reactions.get_by_id(rxnID).lower_bound = -value
 
-        except Exception as e:
-            print e
+    return model
 
-        
 
-        # Create the interactions table. See what the growth rates file looks like, and get the appropriate columns from there, and merge the information with the information in the file with the growth rates.
+def getObjectiveSpecies(model):
+    '''
+    This function finds the reactions in the objective function of a community model, which should be the biomass reactions of the two species that make it up, and matches them to the species they came from using the modelA/modelB tag added by replaceRxns.
+    :param model: cobrapy Model object of a two-species community
+    :return ObjA, ObjB: ids of the biomass reactions of species A and species B
+    '''
+    from cobra.util.solver import linear_reaction_coefficients
 
-        print>>interactionsTableFile, item,'\t', percentChangeRawA,'\t', percentChangeRawB, '\t', typeOfInteraction
+    ObjA = None
+    ObjB = None
 
+    for rxn in linear_reaction_coefficients(model):
+        if rxn.id.startswith('modelA'):
+            ObjA = rxn.id
+        elif rxn.id.startswith('modelB'):
+            ObjB = rxn.id
 
-    # Report the counts for each interaction type.
-    cherrypy.log("We finished creating the interactions table, and saved it to the file %s ." %interactionsTableFile)
-    cherrypy.log("We counted %d interactions that were identified as Mutualism." %countMutualism)
-    cherrypy.log("We counted %d interactions that were identified as Parasitism." %countParasitism)
-    cherrypy.log("We counted %d interactions that were identified as Commensalism." %countCommensalism)
-    cherrypy.log("We counted %d interactions that were identified as Competition." %countCompetition)
-    cherrypy.log("We counted %d interactions that were identified as Amensalism." %countAmensalism)
-    cherrypy.log("We counted %d interactions that were identified as Neutralism." %countNeutralism)
+    if ObjA is None or ObjB is None:
+        log.warning('There is a problem with the attribution of growth rate values to their respective species in model %s .'%model.id)
+        raise ValueError('could not find the objective reactions of both species in model %s' %model.id)
 
-        
-    interactionsTableFile.close()
+    return ObjA, ObjB
 
 
-# In[1]:
+def _matchBasis(columnRows, rowBasic):
+    '''
+    Finds a maximum matching between the basic structural variables of a basis and the constraints, with augmenting paths. The constraints whose slack variable is basic are matched to it. A basis whose variables are all matched has a basis matrix with a nonzero diagonal after permutation, so it is structurally nonsingular.
+    :param columnRows: dictionary with the positions of the constraints of each basic structural variable
+    :param rowBasic: list with True for the constraints whose slack variable is basic
+    :return rowMatch: dictionary with the structural variable matched to each constraint that is not matched to its slack variable
+    '''
+    rowMatch = {}
+    columnMatch = {}
+    for column in columnRows:
+        parent = {}
+        queue = [column]
+        found = None
+        while queue and found is None:
+            current = queue.pop()
+            for row in columnRows[current]:
+                if rowBasic[row] or row in parent:
+                    continue
+                parent[row] = current
+                if row not in rowMatch:
+                    found = row
+                    break
+                queue.append(rowMatch[row])
+        # Flip the matched and unmatched edges along the path from the free constraint back to the column
+        row = found
+        while row is not None:
+            current = parent[row]
+            previous = columnMatch.get(current)
+            rowMatch[row] = current
+            columnMatch[current] = row
+            row = previous if current != column else None
+    return rowMatch
+
+
+class WarmStart(object):
+    '''
+    Optimal basis of the last community that was optimized, kept to start the optimization of the next community from it. The status (basic or not) of each variable and constraint is saved by species and by the id of the reaction or metabolite in the species model, so that it can be given back to the same species in the next community, whether it is species A or B there, and by name for the [u] compartment. The reactions of a new species start out of the basis and its metabolites with their slack variables in the basis, as in a new problem. The species that left the community takes its basic variables with it, so the basis is then repaired: the basic variables are matched to the constraints (_matchBasis), the ones that can't be matched leave the basis and the constraints left without one get their slack variable back, which gives as many basic variables as constraints and a basis matrix that is structurally nonsingular. If it still can't be factorized, or if the two communities have no species in common, the optimization starts from an advanced basis built by the solver (glp_adv_basis) when advancedBasis is True, or from the standard basis of GLPK otherwise, and summary reports how many communities started from each. Only GLPK (the default solver of cobrapy) gives access to its basis through optlang, so with the other solvers restore and save do nothing.
+    :param advancedBasis: if True, the communities whose saved basis can't be used start from an advanced basis instead of the standard one.
+    '''
+
+    def __init__(self, advancedBasis=True):
+        self.advancedBasis = advancedBasis
+        self.species = []
+        self.columns = {}
+        self.rows = {}
+        self.restored = 0
+        self.crashed = 0
+        self.standard = 0
+
+    @staticmethod
+    def key(name, speciesIDs, tags):
+        '''
+        Returns the key of a variable or constraint of a community: (species id, id in the species model) for the reactions (modelA_) and metabolites (model_A_) of the species, and the name itself for the [u] compartment. The reverse variables of cobrapy, whose names end with a hash of the reaction id, get the key of the reaction followed by '_reverse'.
+        '''
+        for tag, speciesID in zip(tags, speciesIDs):
+            if name.startswith('model%s_' %tag):
+                name = name[len(tag) + 6:]
+                if '_reverse_' in name:
+                    name = name[:name.rfind('_reverse_')] + '_reverse'
+                return speciesID, name
+            if name.startswith('model_%s_' %tag):
+                return speciesID, name[len(tag) + 7:]
+        return name
+
+    def save(self, lp, speciesIDs, tags=('A', 'B')):
+        '''
+        Saves the basis of an optlang problem after an optimal solution was found.
+        :param lp: optlang Model object (e.g. model.solver)
+        :param speciesIDs: ids of the species of the community
+        :param tags: tags of the species in the names of the reactions and metabolites
+        '''
+        if not isGLPK(lp):
+            return
+        import swiglpk
+
+        problem = lp.problem
+        self.species = list(speciesIDs)
+        self.rows = dict((self.key(swiglpk.glp_get_row_name(problem, i), speciesIDs, tags), swiglpk.glp_get_row_stat(problem, i)) for i in range(1, swiglpk.glp_get_num_rows(problem) + 1))
+        self.columns = dict((self.key(swiglpk.glp_get_col_name(problem, j), speciesIDs, tags), swiglpk.glp_get_col_stat(problem, j)) for j in range(1, swiglpk.glp_get_num_cols(problem) + 1))
+
+    def restore(self, lp, speciesIDs, tags=('A', 'B')):
+        '''
+        Gives the saved basis to an optlang problem before it is optimized, or an advanced (or standard) basis if the saved one can't be used.
+        :return restored: True if the saved basis was used
+        '''
+        if not isGLPK(lp):
+            return False
+        import swiglpk
+
+        problem = lp.problem
+        restored = False
+        if set(speciesIDs) & set(self.species):
+            nRows = swiglpk.glp_get_num_rows(problem)
+            nCols = swiglpk.glp_get_num_cols(problem)
+            rowBasic = [self.rows.get(self.key(swiglpk.glp_get_row_name(problem, i), speciesIDs, tags), swiglpk.GLP_BS) == swiglpk.GLP_BS for i in range(1, nRows + 1)]
+            colStatus = [self.columns.get(self.key(swiglpk.glp_get_col_name(problem, j), speciesIDs, tags), swiglpk.GLP_NL) for j in range(1, nCols + 1)]
+
+            index = swiglpk.intArray(nRows + 1)
+            values = swiglpk.doubleArray(nRows + 1)
+            columnRows = {}
+            for j, status in enumerate(colStatus):
+                if status == swiglpk.GLP_BS:
+                    columnRows[j] = [index[k] - 1 for k in range(1, swiglpk.glp_get_mat_col(problem, j + 1, index, values) + 1)]
+            rowMatch = _matchBasis(columnRows, rowBasic)
+
+            matched = set(rowMatch.values())
+            for j in columnRows:
+                if j not in matched:
+                    colStatus[j] = swiglpk.GLP_NL
+            for i in range(nRows):
+                if not rowBasic[i] and i not in rowMatch:
+                    rowBasic[i] = True
+
+            # Nonbasic variables get the status that fits their bounds (e.g. GLP_NS for the fixed mass balances) from GLPK
+            for i in range(nRows):
+                swiglpk.glp_set_row_stat(problem, i + 1, swiglpk.GLP_BS if rowBasic[i] else self.rows.get(self.key(swiglpk.glp_get_row_name(problem, i + 1), speciesIDs, tags), swiglpk.GLP_NS))
+            for j, status in enumerate(colStatus):
+                swiglpk.glp_set_col_stat(problem, j + 1, status)
+            restored = swiglpk.glp_warm_up(problem) == 0
+
+        if restored:
+            self.restored += 1
+        elif self.advancedBasis:
+            swiglpk.glp_adv_basis(problem, 0)
+            self.crashed += 1
+        else:
+            swiglpk.glp_std_basis(problem)
+            self.standard += 1
+        return restored
 
+    def summary(self):
+        return 'The optimization of %d communities started from the basis of the previous one, of %d from an advanced basis and of %d from the standard basis.' %(self.restored, self.crashed, self.standard)
 
-def apply_diet(diet, models_dir, models_dieted):
+
+class SoloGrowth(object):
     '''
-    In this function we use cobrapy to calculate the growth rates of the two species that make up the two species community metabolic models under particular metabolite availability conditions. We start by loading the community model (full model) into 3 distinct Model objects with cobrapy. We then change the fluxes of the exchange reactions of the external model so they have lower bounds corresponding to whichever 'Diet' condition the user specifies. We then run a flux balance analysis on the full model, optimizing the biomass reactions of the two species that make up the community at the same time. It then remove all reactions whose IDs start with modelA from the model in modelMinusA, thus leaving only the reactions from modelB and from the external compartment. It then runs a FBA on it, maximizing the biomass reaction for the model with the tag modelB. It then does the samething but for reactions tagged with modelB on modelMinusB. The optimal flux values for the biomass reactions of each species resulting from optimization in the full model and in each model containing only one species, which correspond to predicted growth rates, are then exported to a table in the tab-delimited text formal to a folder chosen by the user.
-    :param diet: the metabolite availability conditions. Default on MMinte is complete, but the user can choose another value ('Variant1 through 10')
-    :param comFolder: path to the folder containing all the two-species community metabolic models.
-    :return outputGRs: table with growth rate information for each of the species belonging to a two-species community metabolic model in the presence and absence of another species.
+    Memo of the growth rates of species alone under one 'Diet'. The growth rate of species A in the absence of species B is calculated on the community model with all the reactions of B switched off, which leaves species A alone with the [u] compartment, whose exchange reactions only depend on the 'Diet'. It is then the same in all the pairs species A takes part in, whatever its partner, so it only has to be calculated once per species: the growth stage solves one linear program per pair, plus one per species, instead of three per pair. The species are identified by keys that change with their models, like the hashes of the model files (see communitySpeciesHash for the community model files). The growth rates are kept before the growth rate cutoff is applied.
+    :param dietID: id of the 'Diet' the growth rates are calculated with (see dietHash)
     '''
-    
-    allModels = getListOfModels(models_dir)
 
+    def __init__(self, dietID=None):
+        self.dietID = dietID
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
 
-    for item in range(len(allModels)):
-        
+    def get(self, speciesKey):
         '''
-        @summary: load the model, all versions that will be manipulated in the analysis.
+        Returns the growth rate of a species alone, or None if it was not calculated yet.
         '''
+        value = self.values.get((speciesKey, self.dietID))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
 
-        # Import the models with cobrapy
-        #cherrypy.log(allModels[item])
-        modelFull = cobra.io.read_sbml_model(allModels[item])
+    def set(self, speciesKey, value):
+        self.values[(speciesKey, self.dietID)] = value
 
+    def summary(self):
+        return 'Growth rates of species alone: %d calculated, %d taken from earlier pairs.' %(self.misses, self.hits)
 
-        #cherrypy.log('We successfully loaded the file %s into a Model object with id, %s. They should all have the same id.'%(allModels[item],modelFull.id))
-        
-        # Determine what the objective function is. It should be composed of two reactions, the biomass reactions for each of the species that compose the model. Store the biomass reactions in a new variable to be used later.
-        modelID = modelFull.id
- 
-        
-        # Open the metabolite conditions file ('Diet')
-        dietValues = open(diet,'r')
-    
-        # Default 'Diet' for MMinte is Complete. After choosing the 'Diet' change the lower bounds for the exchange reactions of the external compartment.
 
-        #cherrypy.log('The diet chosen for this particular run of the functions was %s' %diet)
-        #cherrypy.log(str(modelFull))
-        for line in dietValues:
-            try:
-                new_line = line.rstrip('\n').split('\t')
-                modelFull.reactions.get_by_id(new_line[0][0:-3]).lower_bound = -float(new_line[1])
-                cherrypy.log(new_line[0][0:-3]+"found")
-                cherrypy.log("eureka")
-            except:
-                cherrypy.log(new_line[0][0:-3])
-                continue
+def communitySpeciesHash(model, tag):
+    '''
+    This function calculates a hash of the network of one species of a community model (its reactions, with their bounds, metabolites and objective coefficients, without the tags added by replaceRxns and replaceMets), which identifies the species in a SoloGrowth memo when only the community model files are available.
+    :param model: cobrapy Model object of a two-species community
+    :param tag: 'A' or 'B'
+    :return hexdigest: hexadecimal string with the hash of the species network
+    '''
+    import hashlib
+    from cobra.util.solver import linear_reaction_coefficients
+
+    rxnPrefix = 'model%s_' %tag
+    metPrefix = 'model_%s_' %tag
+    objective = dict((rxn.id, coefficient) for rxn, coefficient in linear_reaction_coefficients(model).items())
+
+    reactions = []
+    for rxn in model.reactions:
+        if rxn.id.startswith(rxnPrefix):
+            metabolites = sorted([(met.id[len(metPrefix):] if met.id.startswith(metPrefix) else met.id, coefficient) for met, coefficient in rxn.metabolites.items()])
+            reactions.append((rxn.id[len(rxnPrefix):], rxn.lower_bound, rxn.upper_bound, objective.get(rxn.id, 0), metabolites))
+    reactions.sort()
+
+    return hashlib.sha1(repr(reactions).encode('utf-8')).hexdigest()
+
+
+# Name of the note of a community model with the keys of its two species models (see setMemberKeys)
+MEMBER_KEYS_NOTE = 'MEMBER_KEYS'
+
+
+def setMemberKeys(model, keys):
+    '''
+    This function records the keys of the two species models of a community (ModelCache.modelKey, the hash of each species model file) in the notes of the community model, which are written to its SBML file, so that the results of the community can be found in a ResultStore under the same key as in pairInteractions (see communityStoreKey).
+    :param model: cobrapy Model object of a two-species community
+    :param keys: keys of the models of species A and B
+    '''
+    model.notes[MEMBER_KEYS_NOTE] = ' '.join(keys)
+
+
+def memberKeys(modelFile):
+    '''
+    This function returns the keys of the two species models of a community model file recorded by setMemberKeys, without parsing the whole model: the notes of a SBML model come before its lists of compartments, metabolites and reactions, so only the beginning of the file is read.
+    :param modelFile: path to the community model in SBML format
+    :return keys: list with the keys of the models of species A and B, or None if the file doesn't have them (community models written before they were recorded)
+    '''
+    import re
+
+    pattern = re.compile(r'<p>%s: (\S+) (\S+)</p>' %MEMBER_KEYS_NOTE)
+    with open(modelFile) as sbmlFile:
+        for line in sbmlFile:
+            match = pattern.search(line)
+            if match is not None:
+                return [match.group(1), match.group(2)]
+            if '<listOf' in line:
+                break
+    return None
+
+
+def communityStoreKey(modelFile, dietID, growth_rate_cutoff, archive=None):
+    '''
+    This function returns the key of the result of a community model in a ResultStore. It is made from the keys of the two species models, as in pairInteractions, so a pair calculated from its community model or from its species models is only calculated once, and the result stays valid when the community model is written again. The keys are those of the record of the pair in the archive, or those written in the community model file by setMemberKeys. The hash of the community model file is used for older files without them.
+    :param modelFile: path to the community model in SBML format, or id of the pair if archive is given
+    :param dietID: hash of the 'Diet' (see dietHash)
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :param archive: CommunityArchive object the community is loaded from
+    :return key: key of the result in the ResultStore
+    '''
+    if archive is not None:
+        keys = archive.record(modelFile)['members']
+    else:
+        keys = memberKeys(modelFile)
+        if keys is None:
+            keys = [fileHash(modelFile)]
+    return ResultStore.key(keys, dietID, growth_rate_cutoff)
+
+
+def parsimoniousExchangeFluxes(model, members=None, fraction_of_optimum=1.0, flux_cutoff=1e-9):
+    '''
+    This function runs a parsimonious flux balance analysis (pFBA) on a community model that has just been optimized: the community objective is kept at its optimum (or at a fraction of it) and the sum of the absolute fluxes of all reactions is minimized, which removes the fluxes that are not needed for growth and leaves the metabolites that the two species actually exchange. The changes made to the model for pFBA are reverted afterwards. Only the fluxes of the exchange reactions of each species (modelA_EX_ and modelB_EX_) are returned, and only if they are not zero: a positive flux is a metabolite secreted by the species to the [u] compartment, and a negative flux a metabolite taken up from it.
+    :param model: cobrapy Model object of a two-species community
+    :param members: ids of species A and B. Defaults to the two parts of the id of the community model ('<speciesA>X<speciesB>'), or to 'A' and 'B'.
+    :param fraction_of_optimum: fraction of the optimum of the community objective that has to be kept
+    :param flux_cutoff: fluxes with a smaller absolute value are left out
+    :return fluxes: list of tuples with the metabolite (the id of the exchange reaction without 'EX_'), the species and the flux
+    '''
+    from cobra.flux_analysis.parsimonious import add_pfba
+
+    if members is None:
+        members = model.id.split('X')
+        if len(members) != 2:
+            members = ['A', 'B']
+
+    fluxes = []
+    with model:
+        with getRecorder().stage('pfba'):
+            add_pfba(model, fraction_of_optimum=fraction_of_optimum)
+        solveModel(model)
+        for rxn in model.reactions:
+            for tag, member in zip(['A', 'B'], members):
+                if rxn.id.startswith('model%s_EX_' %tag):
+                    flux = rxn.flux
+                    if abs(flux) > flux_cutoff:
+                        fluxes.append((rxn.id[len(tag) + 9:], member, flux))
+
+    return fluxes
+
+
+def calculateGRModel(model, dietValues, growth_rate_cutoff=1e-6, warmStart=None, fluxes=None, soloGrowth=None, speciesKeys=None):
+    '''
+    This function calculates the growth rates of the two species of a community model that has already been loaded, in the presence and absence of the other species. The diet is applied to the model, and a flux balance analysis is run on the full model, optimizing the biomass reactions of both species at the same time. The absence of species A is then simulated by setting the bounds of all reactions tagged with modelA to zero inside a reversible context, and the model is optimized again for the biomass of species B. The context is then reverted and the same is done for species B. This way the same Model object (and the same solver instance) is used for the three optimizations, instead of loading the community model three times and removing the reactions of each species one by one, and the optimizations without species A and B start from the optimal basis of the full model.
+    :param model: cobrapy Model object of a two-species community
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet). If it is None, the bounds already set on the model are used.
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :param warmStart: WarmStart object with the basis of the previous community. The full model is optimized starting from it, and its own basis is then saved in it for the next community. The species are identified by the id of the community model ('<speciesA>X<speciesB>').
+    :param fluxes: if a list is given, the exchange fluxes of the two species in the full model are added to it (see parsimoniousExchangeFluxes), with one more optimization right after the one of the full model.
+    :param soloGrowth: SoloGrowth object for the same 'Diet'. The growth rates of the species alone are taken from it if they were already calculated in another pair, and added to it otherwise.
+    :param speciesKeys: keys of species A and B in soloGrowth. They are calculated from the model with communitySpeciesHash if they are not given.
+    :return grAfull, grBfull, grASolo, grBSolo: growth rates of species A and B in the full model, and of species A and B in the absence of the other species.
+    '''
+
+    recorder = getRecorder()
+
+    ObjA, ObjB = getObjectiveSpecies(model)
+
+    if dietValues is not None:
+        with recorder.stage('diet'):
+            setDietBounds(model, dietValues)
+
+    organisms = model.id.split('X')
+    if warmStart is not None and len(organisms) == 2:
+        warmStart.restore(model.solver, organisms)
+
+    # Run FBA on the full model. slim_optimize raises an error if the solution is not optimal.
+    solveModel(model)
+    if warmStart is not None and len(organisms) == 2:
+        warmStart.save(model.solver, organisms)
+    grAfull = model.reactions.get_by_id(ObjA).flux
+    grBfull = model.reactions.get_by_id(ObjB).flux
+
+    if fluxes is not None:
+        fluxes.extend(parsimoniousExchangeFluxes(model))
+
+    if soloGrowth is not None and speciesKeys is None:
+        speciesKeys = [communitySpeciesHash(model, 'A'), communitySpeciesHash(model, 'B')]
+
+    # Run FBA without species A, then without species B, unless the growth rate of the species alone is already known. The bounds are restored when leaving the context.
+    grBSolo = None
+    if soloGrowth is not None:
+        grBSolo = soloGrowth.get(speciesKeys[1])
+    if grBSolo is None:
+        with model:
+            with recorder.stage('knockout'):
+                for rxn in model.reactions:
+                    if rxn.id.startswith('modelA_'):
+                        rxn.knock_out()
+            solveModel(model)
+            grBSolo = model.reactions.get_by_id(ObjB).flux
+        if soloGrowth is not None:
+            soloGrowth.set(speciesKeys[1], grBSolo)
+
+    grASolo = None
+    if soloGrowth is not None:
+        grASolo = soloGrowth.get(speciesKeys[0])
+    if grASolo is None:
+        with model:
+            with recorder.stage('knockout'):
+                for rxn in model.reactions:
+                    if rxn.id.startswith('modelB_'):
+                        rxn.knock_out()
+            solveModel(model)
+            grASolo = model.reactions.get_by_id(ObjA).flux
+        if soloGrowth is not None:
+            soloGrowth.set(speciesKeys[0], grASolo)
+
+    # Round very small growth rates to zero.
+    if grAfull < growth_rate_cutoff:
+        grAfull = 0.
+    if grBfull < growth_rate_cutoff:
+        grBfull = 0.
+    if grASolo < growth_rate_cutoff:
+        grASolo = 0.
+    if grBSolo < growth_rate_cutoff:
+        grBSolo = 0.
+
+    return grAfull, grBfull, grASolo, grBSolo
+
+
+GROWTH_RATE_CUTOFF = 1e-6
+
+# Values of the rows returned by growthRatesRow, which were also the columns of the growth rates tables before GROWTH_COLUMNS.
+GROWTH_HEADER = ['ModelName', 'ObjFuntionSpeciesA', 'ObjFunctionSpeceisB', 'GRSpeciesAFull', 'GRSpeciesBFull', 'GRASolo', 'GRBSolo']
+
+EXCHANGE_FLUX_COLUMNS = ['Pair', 'DietID', 'Metabolite', 'Member', 'Flux']
+
+
+def openExchangeFluxes(fluxFile):
+    '''
+    Creates the table of exchange fluxes of a run, replacing any previous one, and returns it open with its header written.
+    '''
+    exchangeFluxFile = open(fluxFile, 'w')
+    exchangeFluxFile.write('\t'.join(EXCHANGE_FLUX_COLUMNS) + '\n')
+    return exchangeFluxFile
 
 
-        #cherrypy.log('We finished changing the lower bounds for the fluxes of the exchange reactions in the models to better fit the availability of metabolites for the microbial communities we are simulating the growth of. ')
-        dietValues.close()
+def writeExchangeFluxes(fluxFile, pairID, dietID, fluxes):
+    '''
+    Writes the exchange fluxes of a pair under a 'Diet' (output of parsimoniousExchangeFluxes) to an open file, one row per metabolite and species with the columns of EXCHANGE_FLUX_COLUMNS.
+    '''
+    for metabolite, member, flux in fluxes:
+        fluxFile.write('%s\t%s\t%s\t%s\t%r\n' %(pairID, dietID, metabolite, member, flux))
+
+
+# Schema of the tables of results written by ResultsWriter: the growth rates table (calculateGR), and the interactions table (evaluateInteractions, writeInteractionsTable), which adds the changes in growth rate and the type of interaction to it.
+GROWTH_COLUMNS = ['PairID', 'SpeciesA', 'SpeciesB', 'DietID', 'GRSpeciesAFull', 'GRSpeciesBFull', 'GRASolo', 'GRBSolo', 'Status']
+
+INTERACTION_RESULT_COLUMNS = GROWTH_COLUMNS + ['PercentChangeRawA', 'PercentChangeRawB', 'TypeOfInteraction']
+
+RESULT_TYPES = {'PairID': 'str', 'SpeciesA': 'str', 'SpeciesB': 'str', 'DietID': 'str', 'GRSpeciesAFull': 'float', 'GRSpeciesBFull': 'float', 'GRASolo': 'float', 'GRBSolo': 'float', 'Status': 'str', 'PercentChangeRawA': 'float', 'PercentChangeRawB': 'float', 'TypeOfInteraction': 'str'}
+
+RESULT_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
 
-        # Run FBA on Full model
-        cobra.io.write_sbml_model(modelFull,models_dieted+modelID+".xml")
+def resultsFormat(path):
+    '''
+    Returns the format of a table of results from the extension of its path: 'parquet' (.parquet), 'arrow' for the Arrow IPC file format (.arrow, .feather, .ipc) or 'tsv' for any other extension.
+    '''
+    return RESULT_FORMATS.get(os.path.splitext(path)[1].lower(), 'tsv')
+
+
+def growthResult(row, dietID, status='optimal'):
+    '''
+    Returns the values of GROWTH_COLUMNS for a row of growth rates (output of growthRatesRow).
+    '''
+    return [row[0], row[1], row[2], dietID] + [float(x) for x in row[3:7]] + [status]
 
 
+def failedResult(modelFile, dietID, error):
+    '''
+    Returns the values of GROWTH_COLUMNS for a community model that could not be analysed: the growth rates are missing (NaN) and the status is 'failed: ' followed by the error message.
+    '''
+    speciesA, speciesB = communitySpecies(modelFile)
+    return [communityPairID(modelFile), speciesA, speciesB, dietID] + [float('nan')] * 4 + ['failed: %s' %error]
 
 
+class ResultsWriter(object):
+    '''
+    Writer of a table of results with a fixed schema (GROWTH_COLUMNS or INTERACTION_RESULT_COLUMNS, typed as in RESULT_TYPES). The rows are kept in memory as one list per column and written in batches of batchSize rows, as Parquet row groups or Arrow IPC record batches if the path ends in .parquet or .arrow/.feather/.ipc, or as a tab-separated table with a single header line otherwise. pyarrow is only needed for the columnar formats: if it isn't installed, a warning is logged and the table is written as TSV next to the requested path, with the .tsv extension (the path actually written is kept in the attribute path). The table is always written from scratch. The growth rates are written with repr, so they are read back exactly, and the missing ones as 'nan'. It can be used as a context manager, which closes it at the end.
+    :param path: path to the table
+    :param columns: columns of the table
+    :param batchSize: number of rows written at a time
+    '''
+
+    def __init__(self, path, columns=GROWTH_COLUMNS, batchSize=10000):
+        self.columns = list(columns)
+        self.types = [RESULT_TYPES[column] for column in self.columns]
+        self.batchSize = batchSize
+        self.format = resultsFormat(path)
+        self.rows = 0
+        self.batch = [[] for column in self.columns]
+        self.writer = None
+
+        if self.format != 'tsv':
+            try:
+                import pyarrow
+            except ImportError:
+                path = os.path.splitext(path)[0] + '.tsv'
+                log.warning('pyarrow is not installed, so the table will be written as TSV to %s.' %path)
+                self.format = 'tsv'
+        self.path = path
+
+        if self.format == 'tsv':
+            self.writer = open(path, 'w')
+            self.writer.write('\t'.join(self.columns) + '\n')
+        else:
+            import pyarrow as pa
+
+            self.schema = pa.schema([(column, pa.float64() if valueType == 'float' else pa.string()) for column, valueType in zip(self.columns, self.types)])
+            if self.format == 'parquet':
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(path, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, row):
+        '''
+        Adds a row, given as a sequence of values in the order of the columns.
+        '''
+        for values, value in zip(self.batch, row):
+            values.append(value)
+        self.rows += 1
+        if len(self.batch[0]) >= self.batchSize:
+            self.flush()
+
+    def writeFrame(self, frame):
+        '''
+        Adds all the rows of a pandas DataFrame with (at least) the columns of the table.
+        '''
+        for values, column in zip(self.batch, self.columns):
+            values.extend(frame[column].tolist())
+        self.rows += len(frame)
+        if len(self.batch[0]) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the rows kept in memory.
+        '''
+        if not self.batch[0]:
+            return
+
+        if self.format == 'tsv':
+            columns = []
+            for values, valueType in zip(self.batch, self.types):
+                if valueType == 'float':
+                    columns.append([repr(float(value)) for value in values])
+                else:
+                    columns.append(['' if value is None else str(value).replace('\t', ' ').replace('\n', ' ') for value in values])
+            self.writer.write(''.join(['\t'.join(fields) + '\n' for fields in zip(*columns)]))
+            self.writer.flush()
+        else:
+            import pyarrow as pa
+
+            batch = pa.record_batch([pa.array([None if value is None else float(value) for value in values] if valueType == 'float' else [None if value is None else str(value) for value in values], type=field.type) for values, valueType, field in zip(self.batch, self.types, self.schema)], schema=self.schema)
+            self.writer.write_batch(batch)
+
+        self.batch = [[] for column in self.columns]
+
+    def close(self):
+        '''
+        Writes the remaining rows and closes the file.
+        '''
+        if self.writer is None:
+            return
+        self.flush()
+        self.writer.close()
+        self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _legacyGrowthRates(path, chunksize):
+    '''
+    Reads a growth rates table written before GROWTH_COLUMNS, with the columns of GROWTH_HEADER separated by ' \t ' and a header line for each run, and yields its rows converted to GROWTH_COLUMNS (without 'Diet' id, and with the status 'optimal', since only the successful models were written).
+    '''
+    import pandas as pd
+
+    chunks = pd.read_csv(path, sep='\t', header=None, names=GROWTH_HEADER, usecols=range(len(GROWTH_HEADER)), dtype=str, chunksize=chunksize, skip_blank_lines=True, keep_default_na=False)
+    for chunk in chunks:
+        chunk = chunk.apply(lambda column: column.str.strip())
+        growthRates = chunk[GROWTH_HEADER[3:]].apply(pd.to_numeric, errors='coerce')
+        valid = growthRates.notnull().all(axis=1).values
+        frame = pd.DataFrame({'PairID': chunk[GROWTH_HEADER[0]].values[valid], 'SpeciesA': chunk[GROWTH_HEADER[1]].values[valid], 'SpeciesB': chunk[GROWTH_HEADER[2]].values[valid], 'DietID': ''})
+        for column, legacyColumn in zip(GROWTH_COLUMNS[4:8], GROWTH_HEADER[3:]):
+            frame[column] = growthRates[legacyColumn].values[valid]
+        frame['Status'] = 'optimal'
+        yield frame
+
+
+def iterResults(path, chunksize=100000):
+    '''
+    This function reads a table of results written by ResultsWriter (in any of its formats, chosen from the extension of the path) in chunks, so that tables with millions of rows can be processed with a bounded amount of memory. Growth rates tables written before GROWTH_COLUMNS are read as well, and converted to it.
+    :param path: path to the table
+    :param chunksize: number of rows of each chunk. The chunks of the Arrow IPC files are the batches they were written in.
+    :return chunks: generator of pandas DataFrames with the columns of the table, with float columns for the growth rates and the changes in growth rate, and string columns for the rest
+    '''
+    import pandas as pd
+
+    tableFormat = resultsFormat(path)
+
+    if tableFormat == 'parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    if tableFormat == 'arrow':
+        import pyarrow as pa
+
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for item in range(reader.num_record_batches):
+                yield reader.get_batch(item).to_pandas()
+        return
+
+    tableFile = open(path, 'r')
+    header = [column.strip() for column in tableFile.readline().rstrip('\n').split('\t')]
+    tableFile.close()
+
+    if header[0] == GROWTH_HEADER[0]:
+        for chunk in _legacyGrowthRates(path, chunksize):
+            yield chunk
+        return
+
+    floatColumns = [column for column in header if RESULT_TYPES.get(column) == 'float']
+    dtype = dict((column, float if column in floatColumns else str) for column in header)
+    for chunk in pd.read_csv(path, sep='\t', dtype=dtype, chunksize=chunksize, keep_default_na=False, na_values=dict((column, ['nan', '']) for column in floatColumns)):
+        yield chunk
+
+
+def readResults(path):
+    '''
+    This function reads a whole table of results written by ResultsWriter (or an older growth rates table) with iterResults, for the interaction stage and for the analyses of the notebooks.
+    :param path: path to the table
+    :return table: pandas DataFrame with the rows of the table
+    '''
+    import pandas as pd
+
+    chunks = list(iterResults(path))
+    if not chunks:
+        return pd.DataFrame(columns=GROWTH_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def growthRatesRow(modelFile, dietValues, growth_rate_cutoff=1e-6, archive=None, warmStart=None, fluxes=None, soloGrowth=None):
+    '''
+    This function loads a community model file and calculates the growth rates of its two species with the function calculateGRModel, returning the row of the growth rates table for this model. Errors found while loading or optimizing the model are raised, so that the caller can decide what to do with them.
+    :param modelFile: path to the community model in SBML format, or id of the pair if archive is given
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :param archive: CommunityArchive object the community is loaded from, instead of a SBML file
+    :param warmStart: WarmStart object passed on to calculateGRModel
+    :param fluxes: list passed on to calculateGRModel, to which the exchange fluxes of the two species are added
+    :param soloGrowth: SoloGrowth object passed on to calculateGRModel. The species are identified by their keys in the archive, or by communitySpeciesHash.
+    :return row: list with the values of GROWTH_HEADER for this model
+    '''
+    import cobra
+
+    # Import the model with cobrapy. The same Model object is used for the three optimizations.
+    speciesKeys = None
+    with getRecorder().stage('load') as event:
+        if archive is not None:
+            modelFull = archive.community(modelFile)
+            speciesKeys = archive.record(modelFile)['members']
+        else:
+            modelFull = cobra.io.read_sbml_model(modelFile)
+        configureSolver(modelFull)
+        recordModelSize(event, modelFull)
+
+    grAfull, grBfull, grASolo, grBSolo = calculateGRModel(modelFull, dietValues, growth_rate_cutoff, warmStart, fluxes, soloGrowth, speciesKeys)
+
+    modelID = modelFull.id
+    organisms = modelID.split('X')
+
+    return [modelID, organisms[0], organisms[1], grAfull, grBfull, grASolo, grBSolo]
+
+
+def dietHash(dietValues):
+    '''
+    This function calculates a hash of the values of a 'Diet', used to recognise results obtained under the same metabolite availability conditions.
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :return hexdigest: hexadecimal string with the hash of the diet
+    '''
+    import hashlib
+
+    return hashlib.sha1(json.dumps(sorted([list(value) for value in dietValues])).encode('utf-8')).hexdigest()
+
+
+class ResultStore(object):
+    '''
+    Local store of the results of the growth rate calculations, kept in a SQLite database file, so that long runs over all pairs can be resumed. Each result is identified by a key made from the hashes of the model files, the hash of the 'Diet' and the parameters of the calculation, and the status of each pair ('running', 'ok' or 'failed'), its growth rates and its error message are committed to the database as soon as the pair is done. Running the same command again with the same store skips the pairs that are already done, so a run that died only has to pay for the missing pairs.
+    :param path: path to the SQLite database file. It is created if it doesn't exist.
+    :param retryFailed: if True, pairs that failed in a previous run are calculated again.
+    '''
+
+    def __init__(self, path, retryFailed=False):
+        import sqlite3
+
+        self.path = path
+        self.retryFailed = retryFailed
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY, pair TEXT, speciesA TEXT, speciesB TEXT, diet TEXT, status TEXT,
+            grAfull REAL, grBfull REAL, grASolo REAL, grBSolo REAL, error TEXT, updated REAL)''')
+        self.connection.commit()
+
+    @staticmethod
+    def key(modelHashes, dietID, *parameters):
+        '''
+        Returns the key of a result from the hashes of the model files (species A and B, or the community model), the hash of the 'Diet' and any other parameter of the calculation.
+        '''
+        import hashlib
+
+        return hashlib.sha1(json.dumps([list(modelHashes), dietID, list(parameters)]).encode('utf-8')).hexdigest()
+
+    def status(self, key):
+        '''
+        Returns the status of a result, or None if the pair was never started.
+        '''
+        row = self.connection.execute('SELECT status FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def done(self, key):
+        '''
+        Returns True if the pair doesn't need to be calculated again.
+        '''
+        status = self.status(key)
+        return status == 'ok' or (status == 'failed' and not self.retryFailed)
+
+    def get(self, key):
+        '''
+        Returns the row of a result with the pair id, the ids of species A and B and the four growth rates, or None if there is no successful result for this key.
+        '''
+        return self.connection.execute("SELECT pair, speciesA, speciesB, grAfull, grBfull, grASolo, grBSolo FROM results WHERE key = ? AND status = 'ok'", (key,)).fetchone()
+
+    def start(self, key, pair, speciesA, speciesB, dietID):
+        '''
+        Records that the calculation of a pair has started.
+        '''
+        import time
+
+        self.connection.execute('INSERT OR REPLACE INTO results (key, pair, speciesA, speciesB, diet, status, updated) VALUES (?, ?, ?, ?, ?, ?, ?)', (key, pair, speciesA, speciesB, dietID, 'running', time.time()))
+        self.connection.commit()
+
+    def finish(self, key, pair, speciesA, speciesB, dietID, growthRates):
+        '''
+        Records the growth rates of a pair that was calculated successfully.
+        '''
+        import time
+
+        self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (key, pair, speciesA, speciesB, dietID, 'ok') + tuple([float(x) for x in growthRates]) + (None, time.time()))
+        self.connection.commit()
+
+    def fail(self, key, pair, speciesA, speciesB, dietID, error):
+        '''
+        Records the error of a pair that could not be calculated.
+        '''
+        import time
+
+        self.connection.execute('INSERT OR REPLACE INTO results (key, pair, speciesA, speciesB, diet, status, error, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (key, pair, speciesA, speciesB, dietID, 'failed', str(error), time.time()))
+        self.connection.commit()
+
+    def error(self, key):
+        '''
+        Returns the error message of a pair that failed, or None if it didn't.
+        '''
+        row = self.connection.execute("SELECT error FROM results WHERE key = ? AND status = 'failed'", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def rows(self):
+        '''
+        Returns the rows of all the successful results, with the values of GROWTH_HEADER, so that a complete table can be written after a run that was resumed.
+        '''
+        return [list(row) for row in self.connection.execute("SELECT pair, speciesA, speciesB, grAfull, grBfull, grASolo, grBSolo FROM results WHERE status = 'ok' ORDER BY pair")]
+
+    def summary(self):
+        '''
+        Returns a short report of the number of pairs with each status.
+        '''
+        counts = dict(self.connection.execute('SELECT status, COUNT(*) FROM results GROUP BY status').fetchall())
+        return 'Result store %s: %d pairs done, %d failed, %d still running or interrupted.' %(self.path, counts.get('ok', 0), counts.get('failed', 0), counts.get('running', 0))
+
+    def close(self):
+        self.connection.close()
+
+
+def calculateGR(diet, comFolder, OutFile="OutputGR.txt", store=None, shard=None, fluxFile=None):
+    '''
+    In this function we use cobrapy to calculate the growth rates of the two species that make up the two species community metabolic models under particular metabolite availability conditions. The 'Diet' file is read once, and each community model is then loaded a single time and analysed with the function calculateGRModel: the lower bounds of the exchange reactions of the external model are changed to correspond to the 'Diet', a flux balance analysis is run on the full model, optimizing the biomass reactions of the two species that make up the community at the same time, and the absence of each species is simulated by setting the bounds of all its reactions to zero before optimizing again. The optimal flux values for the biomass reactions of each species resulting from optimization in the full model and in the absence of the other species, which correspond to predicted growth rates, are then exported to a table with the columns of GROWTH_COLUMNS (see ResultsWriter), with the id of the 'Diet' and the status of each model: 'optimal', or 'failed: ' and the error message for the models that couldn't be analysed.
+    If a ResultStore is given, the status and growth rates of each model are committed to it as soon as the model is done, and models that are already done in the store are skipped, so that an interrupted run can be resumed. The growth rates of the skipped models (or their errors, for the models that failed) are copied from the store to the table, so the table of a resumed run is complete. Each model is found in the store by the keys of its two species models (communityStoreKey), so the pairs already done by pairInteractions are skipped too.
+    The models are analysed in the order given by schedulePairs, so that consecutive communities share a species, and each community is optimized starting from the basis of the previous one (WarmStart). The growth rate of each species alone is only calculated in the first community it is found in, and reused in the others (SoloGrowth).
+    :param diet: the metabolite availability conditions. Default on MMinte is complete, but the user can choose another value ('Variant1 through 10')
+    :param comFolder: path to the folder containing all the two-species community metabolic models, or to a CommunityArchive file.
+    :param OutFile: path to the table with the growth rates. Its format is chosen from the extension (Parquet for .parquet, Arrow IPC for .arrow, TSV otherwise).
+    :param store: ResultStore object where the results are recorded.
+    :param shard: only the community models of this shard ('i/n', see shardModels) are analysed. All of them are if it is None.
+    :param fluxFile: path to a table where the exchange fluxes of the two species of each community are written (see parsimoniousExchangeFluxes), with the columns of EXCHANGE_FLUX_COLUMNS and the id of the 'Diet'. It is written from scratch. The models skipped because they are done in the store are not included.
+    :return outputGRs: table with growth rate information for each of the species belonging to a two-species community metabolic model in the presence and absence of another species.
+    '''
+
+    growth_rate_cutoff = GROWTH_RATE_CUTOFF
+
+    # Open the metabolite conditions file ('Diet') once for all the models
+    dietValues = loadDiet(diet)
+    dietID = dietHash(dietValues)
+
+    #cherrypy.log('We will now calculate the growth rates of the two species in a community model in the presence and absence of the other species')
+    growthRatesFile = ResultsWriter(OutFile, GROWTH_COLUMNS)
+
+    # Create a list of all the models that will be analysed
+    if isArchive(comFolder):
+        archive = CommunityArchive(comFolder)
+        allModels = archive.pairIDs()
+    else:
+        archive = None
+        allModels = getListOfModels(comFolder)
+
+    if shard is not None:
+        allModels = shardModels(allModels, shard, archive)
+
+    if archive is not None:
+        allModels = schedulePairs(allModels, lambda pairID: archive.record(pairID)['members'])
+    else:
+        allModels = schedulePairs(allModels, communitySpecies)
+    warmStart = WarmStart()
+    soloGrowth = SoloGrowth(dietID)
+
+    fluxes = None
+    if fluxFile is not None:
+        exchangeFluxFile = openExchangeFluxes(fluxFile)
+
+    for item in range(len(allModels)):
+
+        modelFile = allModels[item]
+        modelName = os.path.basename(modelFile)
+
+        if store is not None:
+            key = communityStoreKey(modelFile, dietID, growth_rate_cutoff, archive)
+            if store.done(key):
+                stored = store.get(key)
+                if stored is not None:
+                    growthRatesFile.write(growthResult(stored, dietID))
+                else:
+                    growthRatesFile.write(failedResult(modelFile, dietID, store.error(key)))
+                continue
+            store.start(key, modelName, None, None, dietID)
+
+        if fluxFile is not None:
+            fluxes = []
+
+        try:
+            with getRecorder().pair(modelName):
+                row = growthRatesRow(modelFile, dietValues, growth_rate_cutoff, archive, warmStart, fluxes, soloGrowth)
+        except Exception as e:
+            if store is not None:
+                store.fail(key, modelName, None, None, dietID, e)
+            growthRatesFile.write(failedResult(modelFile, dietID, e))
+            continue
+
+        if store is not None:
+            store.finish(key, row[0], row[1], row[2], dietID, row[3:])
+
+        growthRatesFile.write(growthResult(row, dietID))
+        if fluxFile is not None:
+            writeExchangeFluxes(exchangeFluxFile, row[0], dietID, fluxes)
+    #cherrypy.log('We finished calculating the growth rates of the species in isolation and when in the presence of another species and dumped the information to the file: %s' %growthRatesFile)
+    growthRatesFile.close()
+    if fluxFile is not None:
+        exchangeFluxFile.close()
+    if archive is not None:
+        archive.close()
+
+    log.info(warmStart.summary())
+    log.info(soloGrowth.summary())
+    if store is not None:
+        log.info(store.summary())
+
+
+
+
+# Values shared by the functions running in the worker processes of the pools below. They are set once per worker by the pool initializers.
+_workerDiet = None
+_workerCache = None
+_workerArchive = None
+_workerWarmStart = None
+_workerSoloGrowth = None
+_workerFluxes = False
+
+
+def _initWorkerRecorder(instrument, solverConfig=None):
+    '''
+    Sets a StageRecorder in a worker process if the main process is recording, so that the events of each task can be sent back to it, and the SolverConfig of the main process, so that the workers solve the linear programs the same way.
+    '''
+    if instrument:
+        setRecorder(StageRecorder())
+    if solverConfig is not None:
+        setSolverConfig(solverConfig)
+
+
+def _initGrowthWorker(diet, instrument=False, archivePath=None, fluxes=False, solverConfig=None):
+    '''
+    Pool initializer for calculate_growth_rates_multiproc: loads the 'Diet' once in each worker process, and opens the CommunityArchive the community models are read from, if there is one. Each worker keeps the basis of the last community it optimized to start the next one from it, and the growth rates of the species alone it already calculated.
+    '''
+    global _workerDiet, _workerArchive, _workerWarmStart, _workerSoloGrowth, _workerFluxes
+    _workerDiet = loadDiet(diet)
+    _workerFluxes = fluxes
+    _workerWarmStart = WarmStart()
+    _workerSoloGrowth = SoloGrowth(dietHash(_workerDiet))
+    if archivePath is not None:
+        _workerArchive = CommunityArchive(archivePath)
+    _initWorkerRecorder(instrument, solverConfig)
+
+
+def _growthRatesWorker(modelFile):
+    '''
+    Task run by the workers of calculate_growth_rates_multiproc for one community model. Returns the row of the growth rates table and the error message, one of which is None, the events recorded for the model and its exchange fluxes (None if they are not calculated).
+    '''
+    recorder = getRecorder()
+    fluxes = None
+    if _workerFluxes:
+        fluxes = []
+    try:
+        with recorder.pair(os.path.basename(modelFile)):
+            row = growthRatesRow(modelFile, _workerDiet, GROWTH_RATE_CUTOFF, _workerArchive, _workerWarmStart, fluxes, _workerSoloGrowth)
+        return row, None, recorder.drain(), fluxes
+    except Exception as e:
+        return None, str(e), recorder.drain(), None
+
+
+def _initBuildWorker(cacheDir, instrument=False, compression=None, solverConfig=None):
+    '''
+    Pool initializer for create_community_models_multiproc: creates one cache of species models per worker process.
+    '''
+    global _workerCache
+    _workerCache = ModelCache(cacheDir=cacheDir, compression=compression)
+    _initWorkerRecorder(instrument, solverConfig)
+
+
+def _buildCommunityWorker(task):
+    '''
+    Task run by the workers of create_community_models_multiproc for one pair of species. Returns the error message if the community could not be created (None otherwise), and the events recorded for the pair.
+    '''
+    modelA, modelB, comFolder = task
+    recorder = getRecorder()
+    try:
+        with recorder.pair(pairID((modelA, modelB))):
+            createCommunityModel(modelA, modelB, comFolder, _workerCache)
+    except Exception as e:
+        return '%s %s: %s' %(modelA, modelB, e), recorder.drain()
+    return None, recorder.drain()
+
+
+def _watchdogWorker(connection, initializer, initargs):
+    '''
+    Loop run by each worker process of a WatchdogPool: receives the tasks through its pipe one at a time, and sends back the index of each task with its result and the error message, one of which is None. It stops when it receives None or when the pipe is closed.
+    '''
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        index, function, task = message
+        try:
+            connection.send((index, function(task), None))
+        except Exception as e:
+            connection.send((index, None, str(e)))
+    connection.close()
+
+
+class WatchdogPool(object):
+    '''
+    Pool of worker processes that enforces a wall-clock timeout on each task, so that a single community whose linear program hangs can't stall a whole run. Each worker is a Process with its own Pipe, and receives its tasks one at a time, so the main process knows which task each worker is running and since when. A worker that is still running a task after timeout seconds is killed, the task is reported as timed out, and a new worker (with the same initializer) takes its place. A worker that dies (e.g. a crash of the solver) is replaced the same way, and only its current task is lost.
+    As with Pool.imap, the tasks are split in chunks of consecutive tasks, and a worker runs all the tasks of a chunk before taking the next one, so that the pairs ordered with schedulePairs are still solved one after the other by the same worker (WarmStart). If a worker is replaced, the rest of its chunk goes to the new worker.
+    :param processes: number of worker processes
+    :param initializer: function called in each worker process when it starts, as the initializer of Pool
+    :param initargs: arguments of the initializer
+    :param timeout: maximum time in seconds of each task. The tasks are not limited if it is None.
+    :param context: start method of the processes ('fork', 'spawn' or 'forkserver'). Defaults to the one of multiprocessing.
+    '''
+
+    def __init__(self, processes, initializer=None, initargs=(), timeout=None, context=None):
+        import multiprocessing
+
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+        self.context = multiprocessing.get_context(context)
+        self.workers = []
+        self.timedOut = 0
+        self.died = 0
+
+    def _startWorker(self):
+        connection, workerConnection = self.context.Pipe()
+        process = self.context.Process(target=_watchdogWorker, args=(workerConnection, self.initializer, self.initargs))
+        process.daemon = True
+        process.start()
+        workerConnection.close()
+        worker = {'process': process, 'connection': connection, 'chunk': [], 'task': None, 'started': None}
+        self.workers.append(worker)
+        return worker
+
+    def _stopWorker(self, worker, kill=False):
+        if kill:
+            worker['process'].kill()
+        else:
+            try:
+                worker['connection'].send(None)
+            except (OSError, ValueError):
+                pass
+        worker['process'].join(None if kill else 5)
+        if worker['process'].is_alive():
+            worker['process'].kill()
+            worker['process'].join()
+        worker['connection'].close()
+        self.workers.remove(worker)
+
+    def _replaceWorker(self, worker):
+        chunk = worker['chunk']
+        self._stopWorker(worker, kill=True)
+        replacement = self._startWorker()
+        replacement['chunk'] = chunk
+        return replacement
+
+    def imap(self, function, tasks, chunksize=1):
+        '''
+        Runs function on each task in the worker processes, and returns a generator of the results in the order of the tasks. Each result is a tuple with the value returned by the function and an error message, one of which is None: the message of the exception raised by the function, or the reason why the task was lost ('timed out after ... s', or the exit code of the worker that died).
+        :param function: function of one argument, defined at the top level of a module so that it can be sent to the workers
+        :param tasks: list of the arguments of the function
+        :param chunksize: number of consecutive tasks run by the same worker
+        '''
+        import timeit
+        from collections import deque
+        from multiprocessing.connection import wait
+
+        tasks = list(tasks)
+        chunks = deque([deque(range(start, min(start + chunksize, len(tasks)))) for start in range(0, len(tasks), chunksize)])
+        results = {}
+        nextIndex = 0
+
+        while len(self.workers) < self.processes:
+            self._startWorker()
+
+        while nextIndex < len(tasks):
+            for worker in list(self.workers):
+                if worker['task'] is not None:
+                    continue
+                if not worker['chunk'] and chunks:
+                    worker['chunk'] = chunks.popleft()
+                if not worker['chunk']:
+                    continue
+                index = worker['chunk'].popleft()
+                try:
+                    worker['connection'].send((index, function, tasks[index]))
+                except (OSError, ValueError):
+                    # The worker died while it was idle: put the task back and replace it
+                    worker['chunk'].appendleft(index)
+                    self.died += 1
+                    self._replaceWorker(worker)
+                    continue
+                worker['task'] = index
+                worker['started'] = timeit.default_timer()
+
+            busy = [worker for worker in self.workers if worker['task'] is not None]
+            if not busy:
+                if not chunks and not any([worker['chunk'] for worker in self.workers]):
+                    raise RuntimeError('the worker processes are idle but %d tasks have no result' %(len(tasks) - nextIndex - len(results)))
+                # Workers that died while idle were just replaced: block until one of the new ones is up (or dies) instead of looping
+                wait([worker['process'].sentinel for worker in self.workers], 0.1)
+                continue
+            waitTime = None
+            if self.timeout is not None:
+                waitTime = max(0.0, min([worker['started'] + self.timeout for worker in busy]) - timeit.default_timer())
+            ready = wait([worker['connection'] for worker in busy], waitTime)
+
+            now = timeit.default_timer()
+            for worker in busy:
+                index = worker['task']
+                if worker['connection'] in ready:
+                    try:
+                        doneIndex, value, error = worker['connection'].recv()
+                    except (EOFError, OSError):
+                        worker['process'].join(1)
+                        log.warning('The worker running task %d died (exit code %s) and was replaced.' %(index, worker['process'].exitcode))
+                        results[index] = (None, 'worker process died (exit code %s)' %worker['process'].exitcode)
+                        self.died += 1
+                        self._replaceWorker(worker)
+                        continue
+                    results[doneIndex] = (value, error)
+                    worker['task'] = None
+                elif self.timeout is not None and now - worker['started'] >= self.timeout:
+                    log.warning('Task %d timed out after %g s, its worker was killed and replaced.' %(index, self.timeout))
+                    results[index] = (None, 'timed out after %g s' %self.timeout)
+                    self.timedOut += 1
+                    self._replaceWorker(worker)
+
+            while nextIndex in results:
+                yield results.pop(nextIndex)
+                nextIndex += 1
+
+    def summary(self):
+        '''
+        Returns a short report of the tasks that timed out and of the workers that died.
+        '''
+        return '%d tasks timed out and %d worker processes died.' %(self.timedOut, self.died)
+
+    def close(self):
+        '''
+        Stops the worker processes, killing the ones still running a task.
+        '''
+        for worker in list(self.workers):
+            self._stopWorker(worker, kill=worker['task'] is not None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+
+def calculate_growth_rates_multiproc(diet,comFolder,n_processes=32,chunksize=None,OutFile="OutputGR.txt",store=None,shard=None,fluxFile=None,timeout=None,retry=True,fallbackSolver=None):
+    '''
+    This function calculates the growth rates of the two species of all the community models in comFolder, as calculateGR does, using a pool of worker processes (WatchdogPool). Each community model is a separate task, and each worker loads the 'Diet' once when it starts. The models are ordered with schedulePairs and sent to the workers in chunks of consecutive models, so that each worker can start the optimization of a community from the basis of the previous one. The rows are collected by the main process, which is the only one writing to the output file (and to the ResultStore, if one is given), in the same order as the list of models, so the table is the same whatever the number of processes.
+    A worker that spends more than timeout seconds on a model is killed and replaced, so a community that hangs the solver only costs its own timeout. The models that failed or timed out are tried again at the end of the run with the fallback solver settings, in a new pool, and the ones that fail again are written to the table (and to the store) with the reasons of both attempts.
+    :param diet: path to the file with the metabolite availability conditions
+    :param comFolder: path to the folder containing all the two-species community metabolic models, or to a CommunityArchive file. Each worker opens the archive on its own.
+    :param n_processes: number of processes in the pool
+    :param chunksize: number of models sent to a worker at a time. By default the models are split in about four chunks per process.
+    :param OutFile: path to the table with the growth rates, with the columns of GROWTH_COLUMNS. Its format is chosen from the extension (see ResultsWriter).
+    :param store: ResultStore object where the results are recorded. Models already done in the store are skipped, and their growth rates are copied from the store to the table (or their errors, for the models that failed). The models sent to the workers are recorded as running until they are done.
+    :param shard: only the community models of this shard ('i/n', see shardModels) are analysed. All of them are if it is None.
+    :param fluxFile: path to a table where the exchange fluxes of the two species of each community are written, as in calculateGR. Only the main process writes to it.
+    :param timeout: maximum time in seconds spent on each community model. The models are not limited if it is None.
+    :param retry: if True, the models that failed or timed out are tried again with fallbackSolver.
+    :param fallbackSolver: SolverConfig object used to try the failed models again. Defaults to fallbackSolverConfig().
+    :return outputGRs: table with growth rate information for each of the species belonging to a two-species community metabolic model in the presence and absence of another species.
+    '''
+
+    if isArchive(comFolder):
+        archivePath = comFolder
+        archive = CommunityArchive(archivePath)
+        allModels = archive.pairIDs()
+    else:
+        archivePath = None
+        archive = None
+        allModels = sorted(getListOfModels(comFolder))
+
+    if shard is not None:
+        allModels = shardModels(allModels, shard, archive)
+
+    dietID = dietHash(loadDiet(diet))
+    growthRatesFile = ResultsWriter(OutFile, GROWTH_COLUMNS)
+
+    if store is not None:
+        keys = dict((modelFile, communityStoreKey(modelFile, dietID, GROWTH_RATE_CUTOFF, archive)) for modelFile in allModels)
+        for modelFile in allModels:
+            if store.done(keys[modelFile]):
+                stored = store.get(keys[modelFile])
+                if stored is not None:
+                    growthRatesFile.write(growthResult(stored, dietID))
+                else:
+                    growthRatesFile.write(failedResult(modelFile, dietID, store.error(keys[modelFile])))
+        allModels = [modelFile for modelFile in allModels if not store.done(keys[modelFile])]
+
+    if archive is not None:
+        allModels = schedulePairs(allModels, lambda pairID: archive.record(pairID)['members'])
+    else:
+        allModels = schedulePairs(allModels, communitySpecies)
+    if chunksize is None:
+        chunksize = max(1, -(-len(allModels) // (4 * n_processes)))
+
+    # The models handed to the workers are recorded as running, so an interrupted run shows which ones never finished
+    if store is not None:
+        for modelFile in allModels:
+            store.start(keys[modelFile], os.path.basename(modelFile), None, None, dietID)
+
+    if fluxFile is not None:
+        exchangeFluxFile = openExchangeFluxes(fluxFile)
+
+    recorder = getRecorder()
+
+    if archive is not None:
+        archive.close()
+
+    if fallbackSolver is None:
+        fallbackSolver = fallbackSolverConfig()
+
+    tasks = allModels
+    solverConfig = getSolverConfig()
+    errors = {}
+    try:
+        for attempt in range(2 if retry else 1):
+            if attempt > 0:
+                log.info('%d models failed, trying them again with %r.' %(len(tasks), fallbackSolver))
+                solverConfig = fallbackSolver
+                chunksize = max(1, -(-len(tasks) // (4 * n_processes)))
+
+            failed = []
+            pool = WatchdogPool(n_processes, initializer=_initGrowthWorker, initargs=(diet, recorder.enabled, archivePath, fluxFile is not None, solverConfig), timeout=timeout)
+            try:
+                for modelFile, (result, error) in zip(tasks, pool.imap(_growthRatesWorker, tasks, chunksize)):
+                    row = None
+                    if result is not None:
+                        row, error, events, fluxes = result
+                        recorder.merge(events)
+                    if row is None:
+                        errors[modelFile] = error if attempt == 0 else '%s; with %r: %s' %(errors[modelFile], solverConfig, error)
+                        failed.append(modelFile)
+                        continue
+                    growthRatesFile.write(growthResult(row, dietID))
+                    if fluxFile is not None:
+                        writeExchangeFluxes(exchangeFluxFile, row[0], dietID, fluxes)
+                    if store is not None:
+                        store.finish(keys[modelFile], row[0], row[1], row[2], dietID, row[3:])
+            finally:
+                pool.close()
+            log.info(pool.summary())
+
+            tasks = failed
+            if not tasks:
+                break
+
+        for modelFile in tasks:
+            growthRatesFile.write(failedResult(modelFile, dietID, errors[modelFile]))
+            if store is not None:
+                store.fail(keys[modelFile], os.path.basename(modelFile), None, None, dietID, errors[modelFile])
+    finally:
+        growthRatesFile.close()
+        if fluxFile is not None:
+            exchangeFluxFile.close()
+
+    if store is not None:
+        log.info(store.summary())
+
+
+def create_community_models_multiproc(listOfPairs,modelFolder,comFolder,n_processes=32,chunksize=8,cacheDir=None,compression=None):
+    '''
+    This function creates the two-species community models of all the pairs in listOfPairs, as allPairComModels does, using a pool of worker processes. Each pair is a separate task. Each worker keeps its own cache of species models, so sending consecutive pairs (which often share species A) to the same worker with a larger chunksize means fewer model files are parsed. If cacheDir is given, the workers also share the parsed models through the on-disk tier of the cache.
+    :param listOfPairs: file with pairs of species that will make up each two-species community metabolic model, or list of pairs of model filenames.
+    :param modelFolder: path to the folder containing the metabolic models of individual species in a SBML format
+    :param comFolder: path to the folder that will store the two-species community metabolic models.
+    :param n_processes: number of processes in the pool
+    :param chunksize: number of pairs sent to a worker at a time
+    :param cacheDir: path to the folder for the on-disk tier of the caches of species models
+    :param compression: SpeciesCompression object applied to the species models by the cache of each worker (see pairsCompression). With cacheDir, each species is compressed only once.
+    :return set of two-species community metabolic models
+    '''
+
+    if not os.path.exists(comFolder):
+        os.makedirs(comFolder)
+
+    if isinstance(listOfPairs, str):
+        listOfPairs = readPairsFile(listOfPairs)
+
+    tasks = [(modelFolder + '%s' %pair[0], modelFolder + '%s' %pair[1], comFolder) for pair in listOfPairs]
+
+    recorder = getRecorder()
+
+    pool = Pool(n_processes, initializer=_initBuildWorker, initargs=(cacheDir, recorder.enabled, compression, getSolverConfig()))
+    try:
+        for error, events in pool.imap(_buildCommunityWorker, tasks, chunksize):
+            recorder.merge(events)
+            if error is not None:
+                log.warning('The community model could not be created for %s' %error)
+    finally:
+        pool.close()
+        pool.join()
+
+# In[5]:
+
+
+
+INTERACTION_TYPES = ['Mutualism', 'Parasitism', 'Commensalism', 'Competition', 'Amensalism', 'Neutralism']
+
+
+def percentChange(grFull, grSolo):
+    '''
+    This function calculates the relative change in the growth rate of a species in the presence of another species (grFull) relative to its growth rate alone (grSolo). A very small number is used in place of a growth rate of zero alone.
+    :param grFull: growth rate of the species in the community
+    :param grSolo: growth rate of the species alone
+    :return percentChangeRaw: relative change in growth rate
+    '''
+
+    if grSolo != 0:
+        return (grFull-grSolo)/grSolo
+    else:
+        return (grFull-grSolo)/float(1e-25)
+
+
+def classifyInteraction(percentChangeRawA, percentChangeRawB):
+    '''
+    This function determines the type of interaction occurring between two species from the relative change in their growth rates in the presence of each other, according to the paper by Heinken and Thiele 2015 AEM. A change larger than 10% in either direction is considered significant.
+    :param percentChangeRawA: relative change in the growth rate of species A in the presence of species B
+    :param percentChangeRawB: relative change in the growth rate of species B in the presence of species A
+    :return typeOfInteraction: one of the INTERACTION_TYPES, or 'Empty' if the changes fall exactly on the thresholds
+    '''
+
+    if percentChangeRawA > 0.1 and percentChangeRawB > 0.1:
+        typeOfInteraction = 'Mutualism'
+
+    elif percentChangeRawA > 0.1 and percentChangeRawB < -0.1:
+        typeOfInteraction ='Parasitism'
+
+    elif percentChangeRawA > 0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
+        typeOfInteraction = 'Commensalism'
+
+    elif percentChangeRawA < -0.1 and percentChangeRawB > 0.1:
+        typeOfInteraction = 'Parasitism'
+
+    elif percentChangeRawA < -0.1 and percentChangeRawB < -0.1:
+        typeOfInteraction = 'Competition'
+
+    elif percentChangeRawA < -0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
+        typeOfInteraction = 'Amensalism'
+
+    elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB > 0.1:
+        typeOfInteraction = 'Commensalism'
+
+    elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB < -0.1:
+        typeOfInteraction = 'Amensalism'
+
+    elif percentChangeRawA > -0.1 and percentChangeRawA < 0.1 and percentChangeRawB > -0.1 and percentChangeRawB < 0.1:
+        typeOfInteraction = 'Neutralism'
+
+    else:
+        typeOfInteraction = 'Empty'
+
+    return typeOfInteraction
+
+
+def classifyInteractions(percentChangeRawA, percentChangeRawB):
+    '''
+    This function is the columnar version of classifyInteraction: it determines the type of interaction for whole arrays of relative changes in growth rate at once, with the same thresholds and in the same order of precedence.
+    :param percentChangeRawA: numpy array with the relative change in the growth rate of species A in the presence of species B
+    :param percentChangeRawB: numpy array with the relative change in the growth rate of species B in the presence of species A
+    :return typesOfInteraction: numpy array with the types of interaction ('Empty' where the changes fall exactly on the thresholds)
+    '''
+    import numpy as np
+
+    upA = percentChangeRawA > 0.1
+    downA = percentChangeRawA < -0.1
+    flatA = (percentChangeRawA > -0.1) & (percentChangeRawA < 0.1)
+    upB = percentChangeRawB > 0.1
+    downB = percentChangeRawB < -0.1
+    flatB = (percentChangeRawB > -0.1) & (percentChangeRawB < 0.1)
+
+    conditions = [upA & upB, upA & downB, upA & flatB, downA & upB, downA & downB, downA & flatB, flatA & upB, flatA & downB, flatA & flatB]
+    choices = ['Mutualism', 'Parasitism', 'Commensalism', 'Parasitism', 'Competition', 'Amensalism', 'Commensalism', 'Amensalism', 'Neutralism']
+
+    return np.select(conditions, choices, default='Empty')
+
+
+def evaluateInteractions(inGRs, outInter, chunksize=100000):
+    '''
+    This function goes over the file with the growth rates of the species that make up a two-species community model and determines the kind of interaction occurring in between the two species. The types interactions are determined according to the paper by Heinken and Thiele 2015 AEM. These are determined based on the amplitude of change in growth rate of species in the presence and absence of another species in the community (>10% of change in growth of the particular species when in the presence of another species relative to the absence of another species indicates significant interaction), and the sign of the change (positive or negative). The information about the calculations of change and the type of interaction predicted in each community is added to the original table with the growth rates.
+    The table is read in chunks of rows with iterResults, and the changes in growth rate and the types of interaction are calculated for all the rows of a chunk at once, so that tables with millions of rows are processed with a bounded amount of memory. Only the models with the status 'optimal' are evaluated.
+    :param inGRs: path to the file with the table listing the growth rates of the two species in a two-species community metabolic model in the presence and absence of another species in the community (written by calculateGR, in any of the formats of ResultsWriter).
+    :param outInter: path to the file that will contain the information contained in the file with growth rates, plus information regarding the the types of interactions predicted to be occurring in the community, with the columns of INTERACTION_RESULT_COLUMNS. Its format is chosen from the extension (see ResultsWriter).
+    :param chunksize: number of rows of the growth rates table processed at a time
+    :return outInter: file with the interactions that are predicted to be occurring between species in a two-species community.
+    '''
+    import numpy as np
+
+    log.info("We will use the information on the growth rates of the species in file %s to determine what kind of interaction is occurring between the organisms. We will output the table of interactions to %s. We will also count how many instances of each type of interaction are found" %(inGRs,outInter))
+
+    interactionsTableFile = ResultsWriter(outInter, INTERACTION_RESULT_COLUMNS, batchSize=chunksize)
+
+    # We will count how many times each interaction is predicted to occur. This information is shown in the terminal window and in the logError file.
+    counts = dict((typeOfInteraction, 0) for typeOfInteraction in INTERACTION_TYPES)
+
+    for chunk in iterResults(inGRs, chunksize):
+
+        # Skip the models that couldn't be analysed
+        chunk = chunk[(chunk['Status'] == 'optimal').values & chunk[GROWTH_COLUMNS[4:8]].notnull().all(axis=1).values].copy()
+        if len(chunk) == 0:
+            continue
+
+        grAfull, grBfull, grASolo, grBSolo = [chunk[column].values for column in GROWTH_COLUMNS[4:8]]
+
+        # Calculation of the effect of the presence of a competing species in the growht rate of species A and B. A very small number is used in place of a growth rate of zero alone.
+        percentChangeRawA = (grAfull-grASolo)/np.where(grASolo != 0, grASolo, 1e-25)
+        percentChangeRawB = (grBfull-grBSolo)/np.where(grBSolo != 0, grBSolo, 1e-25)
+
+        # Assign a type of interaction to each community based on the percent change
+        typesOfInteraction = classifyInteractions(percentChangeRawA, percentChangeRawB)
+
+        typesFound, typesCount = np.unique(typesOfInteraction, return_counts=True)
+        for typeOfInteraction, count in zip(typesFound, typesCount):
+            counts[str(typeOfInteraction)] = counts.get(str(typeOfInteraction), 0) + int(count)
+
+        # Create the interactions table, with the information in the file with the growth rates followed by the changes in growth rate and the type of interaction.
+        chunk['PercentChangeRawA'] = percentChangeRawA
+        chunk['PercentChangeRawB'] = percentChangeRawB
+        chunk['TypeOfInteraction'] = typesOfInteraction
+        interactionsTableFile.writeFrame(chunk)
+
+    interactionsTableFile.close()
+
+    # Report the counts for each interaction type.
+    log.info("We finished creating the interactions table, and saved it to the file %s ." %interactionsTableFile.path)
+    for typeOfInteraction in INTERACTION_TYPES:
+        log.info("We counted %d interactions that were identified as %s." %(counts[typeOfInteraction], typeOfInteraction))
+
+    return counts
+
+
+# In[1]:
+
+
+def apply_diet(diet, models_dir, models_dieted, shard=None):
+    '''
+    In this function we use cobrapy to write a copy of each two-species community model with a 'Diet' applied to it. The 'Diet' file is read once with the function loadDiet, and the lower bounds of the exchange reactions of the external compartment of each community model are then changed to correspond to it with the function setDietBounds. The models are written in SBML format to models_dieted, named after their id. Errors found while loading or writing a model are raised.
+    :param diet: path to the file with the metabolite availability conditions ('Diet')
+    :param models_dir: path to the folder containing all the two-species community metabolic models.
+    :param models_dieted: path to the folder where the models with the diet applied are written. It is put in front of the filenames, so it should end with a separator.
+    :param shard: only the models of this shard ('i/n', see shardModels) are changed. All of them are if it is None.
+    '''
+    import cobra
+
+    # Open the metabolite conditions file ('Diet') once for all the models
+    dietValues = loadDiet(diet)
+
+    allModels = getListOfModels(models_dir)
+    if shard is not None:
+        allModels = shardModels(allModels, shard)
+
+    for modelFile in allModels:
+        # Import the model with cobrapy
+        with getRecorder().stage('load') as event:
+            modelFull = cobra.io.read_sbml_model(modelFile)
+            recordModelSize(event, modelFull)
+
+        with getRecorder().stage('diet'):
+            setDietBounds(modelFull, dietValues)
+
+        with getRecorder().stage('write'):
+            cobra.io.write_sbml_model(modelFull, models_dieted + modelFull.id + ".xml")
+
+
+
+# In[7]:
+
+
+INTERACTION_COLUMNS = ['Model', 'GenomeIDSpeciesA', 'GenomeIDSpeciesB', 'GRSpeciesAFull', 'GRSpeciesBFull', 'GRASolo', 'GRBSolo', 'PercentChangeRawA', 'PercentChangeRawB', 'TypeOfInteraction']
+
+
+def failedInteraction(pair, error):
+    '''
+    Returns the values of INTERACTION_COLUMNS for a pair of species that could not be analysed. The species are named after their model files, the growth rates and their changes are missing (NaN), and the type of interaction is 'failed: ' followed by the error message, which writeInteractionsTable writes as the status of the pair.
+    :param pair: list or tuple with the two model filenames
+    :param error: exception or error message
+    '''
+    speciesA, speciesB = [os.path.splitext(os.path.basename(modelFile))[0] for modelFile in pair[:2]]
+    return (pairID(pair[:2]), speciesA, speciesB) + (float('nan'),) * 6 + ('failed: %s' %error,)
+
+
+def pairInteractions(listOfPairs, diet, modelFolder='', comFolder=None, cache=None, growth_rate_cutoff=1e-6, store=None, sparse=False, schedule=True, fluxFile=None):
+    '''
+    This function goes through the pairs of species in one pass: for each pair the two-species community model is built in memory (buildCommunityModel), its growth rates are calculated under the 'Diet' (calculateGRModel) and the type of interaction between the two species is determined (classifyInteraction). The results are produced one pair at a time as a generator, so nothing has to be written to disk and read back between the steps. The community models are only exported in SBML format if a comFolder is given.
+    If a ResultStore is given, each pair is recorded in it as soon as it is done, and pairs already calculated with the same species models, diet and parameters are taken from the store instead of being calculated again.
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames (e.g. the output of get_all_pairs)
+    :param diet: path to the file with the metabolite availability conditions, or its values already loaded with loadDiet
+    :param modelFolder: path to the folder containing the metabolic models of individual species. It is added in front of the filenames of each pair.
+    :param comFolder: path to the folder where the community models are exported in SBML format. They are not exported if it is None.
+    :param cache: ModelCache object to use. A new one is created if it is None.
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :param store: ResultStore object where the results are recorded.
+    :param sparse: if True, the community linear programs are assembled directly from the arrays of the species models (CommunityLP) instead of building cobrapy community models.
+    :param schedule: if True, the pairs are evaluated in the order given by schedulePairs, and each community is optimized starting from the basis of the previous one (WarmStart). Otherwise they are evaluated in their original order.
+    :param fluxFile: path to a table where the exchange fluxes of the two species of each pair are written, as in calculateGR. The pairs taken from the store are not included. Not available with sparse.
+    :return rows: generator of tuples with the values of INTERACTION_COLUMNS for each pair. The pairs that could not be analysed (or that failed in the store) are produced too, by failedInteraction.
+    '''
+    import cobra
+
+    if sparse and fluxFile is not None:
+        raise ValueError('the exchange fluxes are calculated on the cobrapy community models, so fluxFile can not be used with sparse')
+
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
+
+    if isinstance(diet, str):
+        dietValues = loadDiet(diet)
+    else:
+        dietValues = diet
+    dietID = dietHash(dietValues)
+
+    if cache is None:
+        cache = ModelCache()
+
+    if comFolder is not None and not os.path.exists(comFolder):
+        os.makedirs(comFolder)
+
+    if schedule:
+        pairsList = schedulePairs(pairsList)
+    warmStart = WarmStart()
+    soloGrowth = SoloGrowth(dietID)
+
+    fluxes = None
+    if fluxFile is not None:
+        exchangeFluxFile = openExchangeFluxes(fluxFile)
+
+    recorder = getRecorder()
+
+    for pair in pairsList:
+        modelA = modelFolder + '%s' %pair[0]
+        modelB = modelFolder + '%s' %pair[1]
+        key = None
+
+        try:
+            if store is not None:
+                key = ResultStore.key([cache.modelKey(modelA), cache.modelKey(modelB)], dietID, growth_rate_cutoff)
+                if store.done(key):
+                    stored = store.get(key)
+                    if stored is not None:
+                        communityID, organismA, organismB, grAfull, grBfull, grASolo, grBSolo = stored
+                        percentChangeRawA = percentChange(grAfull, grASolo)
+                        percentChangeRawB = percentChange(grBfull, grBSolo)
+                        yield (communityID, organismA, organismB, grAfull, grBfull, grASolo, grBSolo, percentChangeRawA, percentChangeRawB, classifyInteraction(percentChangeRawA, percentChangeRawB))
+                    else:
+                        yield failedInteraction(pair, store.error(key))
+                    continue
+                store.start(key, '%s %s' %(pair[0], pair[1]), None, None, dietID)
+
+            with recorder.pair(pairID(pair)):
+                with recorder.stage('load'):
+                    if sparse:
+                        members = [cache.arrays(modelA), cache.arrays(modelB)]
+                    else:
+                        model1 = cache.get(modelA)
+                        model2 = cache.get(modelB)
+
+                if sparse:
+                    # Assemble the linear program of the community directly from the arrays of the species models
+                    mix = CommunityLP(members)
+                    organisms = mix.members[0].id, mix.members[1].id
+                else:
+                    organisms = model1.id, model2.id
+                    mix = configureSolver(buildCommunityModel(model1, model2))
+
+                speciesKeys = [cache.modelKey(modelA), cache.modelKey(modelB)]
+
+                # The community model is exported before the diet is applied to it, as allPairComModels does.
+                if comFolder is not None:
+                    with recorder.stage('write'):
+                        if sparse:
+                            comModel = mix.toModel()
+                        else:
+                            comModel = mix
+                        setMemberKeys(comModel, speciesKeys)
+                        cobra.io.write_sbml_model(comModel, "%s/community%s.sbml" %(comFolder,mix.id))
+                if sparse:
+                    grAfull, grBfull, grASolo, grBSolo = mix.growthRates(dietValues, growth_rate_cutoff, warmStart, soloGrowth, speciesKeys)
+                else:
+                    if fluxFile is not None:
+                        fluxes = []
+                    grAfull, grBfull, grASolo, grBSolo = calculateGRModel(mix, dietValues, growth_rate_cutoff, warmStart, fluxes, soloGrowth, speciesKeys)
+        except Exception as e:
+            log.warning('The pair %s could not be analysed: %s' %(pairID(pair), e))
+            if key is not None:
+                store.fail(key, '%s %s' %(pair[0], pair[1]), None, None, dietID, e)
+            yield failedInteraction(pair, e)
+            continue
+
+        if store is not None:
+            store.finish(key, mix.id, organisms[0], organisms[1], dietID, (grAfull, grBfull, grASolo, grBSolo))
+
+        if fluxFile is not None:
+            writeExchangeFluxes(exchangeFluxFile, mix.id, dietID, fluxes)
+            exchangeFluxFile.flush()
+
+        percentChangeRawA = percentChange(grAfull, grASolo)
+        percentChangeRawB = percentChange(grBfull, grBSolo)
+        typeOfInteraction = classifyInteraction(percentChangeRawA, percentChangeRawB)
+
+        yield (mix.id, organisms[0], organisms[1], grAfull, grBfull, grASolo, grBSolo, percentChangeRawA, percentChangeRawB, typeOfInteraction)
+
+    if fluxFile is not None:
+        exchangeFluxFile.close()
+
+    log.info(cache.summary())
+    log.info(warmStart.summary())
+    log.info(soloGrowth.summary())
+    if store is not None:
+        log.info(store.summary())
+
+
+def writeInteractionsTable(rows, outInter, dietID=''):
+    '''
+    This function writes the rows produced by pairInteractions to a table of interactions with the same columns as the one created by evaluateInteractions (INTERACTION_RESULT_COLUMNS), as they are produced, and reports how many instances of each type of interaction were found.
+    :param rows: iterable of tuples with the values of INTERACTION_COLUMNS
+    :param outInter: path to the file that will contain the table of interactions. Its format is chosen from the extension (see ResultsWriter).
+    :param dietID: id of the 'Diet' the growth rates were calculated with (see dietHash)
+    :return counts: dictionary with the number of pairs found for each type of interaction
+    '''
+
+    counts = dict((typeOfInteraction, 0) for typeOfInteraction in INTERACTION_TYPES)
+
+    interactionsTableFile = ResultsWriter(outInter, INTERACTION_RESULT_COLUMNS)
+
+    failed = 0
+    for row in rows:
+        if str(row[-1]).startswith('failed'):
+            interactionsTableFile.write(growthResult(row, dietID, row[-1]) + [float('nan'), float('nan'), ''])
+            failed += 1
+            continue
+        interactionsTableFile.write(growthResult(row, dietID) + list(row[7:]))
+        counts[row[-1]] = counts.get(row[-1], 0) + 1
+
+    interactionsTableFile.close()
+
+    if failed:
+        log.warning('%d pairs could not be analysed, they are written with a failed status.' %failed)
+
+    for typeOfInteraction in INTERACTION_TYPES:
+        log.info("We counted %d interactions that were identified as %s." %(counts[typeOfInteraction], typeOfInteraction))
+
+    return counts
+
+
+
+# In[8]:
+
+
+SWEEP_HEADER = ['ModelName', 'SpeciesA', 'SpeciesB', 'Condition', 'GRSpeciesAFull', 'GRSpeciesBFull', 'GRASolo', 'GRBSolo', 'Status']
+
+
+def dietFileConditions(dietFiles):
+    '''
+    This function loads a set of 'Diet' files to be compared with sweepGR. Each diet is a condition named after its file (without the extension), e.g. cheesewhey250_50 and cheesewhey250_50+h2.
+    :param dietFiles: list of paths to files with metabolite availability conditions
+    :return conditions: list of tuples with the name of the condition and the diet values (as returned by loadDiet)
+    '''
+
+    conditions = []
+    for diet in dietFiles:
+        name = os.path.splitext(os.path.basename(diet))[0]
+        conditions.append((name, loadDiet(diet)))
+
+    return conditions
+
+
+def dietGridConditions(diet, grid):
+    '''
+    This function creates the conditions of a parametric scan of the medium to be used with sweepGR. Every combination of the values given in grid replaces the uptake of the corresponding exchange reactions in the base 'Diet' (or is added to it, if the exchange reaction is not in the diet). For instance, grid={'EX_h2_e[u]': [0, 10, 20]} creates three conditions that only differ in the availability of hydrogen.
+    :param diet: path to the file with the base metabolite availability conditions, or its values already loaded with loadDiet
+    :param grid: dictionary with exchange reaction ids as keys and lists of uptake values as values
+    :return conditions: list of tuples with the name of the condition (e.g. 'EX_h2_e[u]=10') and the diet values
+    '''
+    from itertools import product
+
+    if isinstance(diet, str):
+        dietValues = loadDiet(diet)
+    else:
+        dietValues = diet
+
+    exchanges = sorted(grid)
+    conditions = []
+
+    for values in product(*[grid[rxnID] for rxnID in exchanges]):
+        changed = dict(zip(exchanges, values))
+        conditionValues = [(rxnID, changed.get(rxnID, value)) for rxnID, value in dietValues]
+        present = set(rxnID for rxnID, value in dietValues)
+        conditionValues.extend([(rxnID, float(changed[rxnID])) for rxnID in exchanges if rxnID not in present])
+
+        name = ';'.join(['%s=%g' %(rxnID, changed[rxnID]) for rxnID in exchanges])
+        conditions.append((name, conditionValues))
+
+    return conditions
+
+
+def compileDiet(model, dietValues):
+    '''
+    This function resolves the exchange reactions of a 'Diet' in a community model once, so that the diet can be applied many times to the same model (setCompiledDiet) without looking the reactions up again. Exchange reactions listed in the diet but not present in the model are left out.
+    :param model: cobrapy Model object of a two-species community
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :return compiledDiet: list of tuples with the Reaction objects and their new lower bounds
+    '''
+
+    compiledDiet = []
+    for rxnID, value in dietValues:
+        if rxnID in model.reactions:
+            compiledDiet.append((model.reactions.get_by_id(rxnID), -value))
+
+    return compiledDiet
+
+
+def setCompiledDiet(compiledDiet):
+    '''
+    This function sets the lower bounds of the exchange reactions of a diet compiled with compileDiet.
+    :param compiledDiet: list of tuples with the Reaction objects and their new lower bounds
+    '''
+
+    for rxn, lower_bound in compiledDiet:
+        rxn.lower_bound = lower_bound
+
+
+def sweepModel(model, conditions, growth_rate_cutoff=1e-6):
+    '''
+    This function calculates the growth rates of the two species of a community model, in the presence and absence of the other species, under each of a list of conditions. The model is loaded only once: each condition is compiled into the bounds of the exchange reactions and applied inside a reversible context, so the model goes back to its original bounds before the next condition is applied, and the same solver instance is used for all the conditions.
+    :param model: cobrapy Model object of a two-species community
+    :param conditions: list of tuples with the name of the condition and the diet values (see dietFileConditions and dietGridConditions)
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :return results: generator of tuples with the name of the condition, the four growth rates returned by calculateGRModel and the status: 'optimal', or 'failed: ' and the error message for the conditions under which the model can't be optimized, whose growth rates are missing (NaN).
+    '''
+
+    configureSolver(model)
+    compiledConditions = [(name, compileDiet(model, dietValues)) for name, dietValues in conditions]
+
+    for name, compiledDiet in compiledConditions:
+        with model:
+            setCompiledDiet(compiledDiet)
+            try:
+                growthRates = calculateGRModel(model, None, growth_rate_cutoff)
+            except Exception as e:
+                log.warning('Model %s could not be optimized under condition %s: %s' %(model.id, name, e))
+                yield (name,) + (float('nan'),) * 4 + ('failed: %s' %e,)
+                continue
+        yield (name,) + tuple(growthRates) + ('optimal',)
+
+
+def iterCommunityModels(comFolder=None, listOfPairs=None, modelFolder='', cache=None):
+    '''
+    This function produces the two-species community models to be analysed, one at a time, either by loading the community models found in comFolder, or by building them in memory from the pairs of species in listOfPairs.
+    :param comFolder: path to the folder containing the two-species community metabolic models
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames. Only used if comFolder is None.
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param cache: ModelCache object used when building the models from pairs. A new one is created if it is None.
+    :return models: generator of cobrapy Model objects. Models that can't be loaded or built are skipped.
+    '''
+    import cobra
+
+    if comFolder is not None:
+        for modelFile in sorted(getListOfModels(comFolder)):
+            try:
+                yield cobra.io.read_sbml_model(modelFile)
+            except Exception as e:
+                log.warning('The community model %s could not be read: %s' %(modelFile, e))
+        return
+
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
+
+    if cache is None:
+        cache = ModelCache()
+
+    for pair in pairsList:
+        try:
+            model = buildCommunityModel(cache.get(modelFolder + '%s' %pair[0]), cache.get(modelFolder + '%s' %pair[1]))
+        except Exception as e:
+            log.warning('The community model of %s and %s could not be built: %s' %(pair[0], pair[1], e))
+            continue
+        yield model
+
+
+def sweepGR(conditions, OutFile, comFolder=None, listOfPairs=None, modelFolder='', growth_rate_cutoff=1e-6):
+    '''
+    This function compares a set of diets, or scans the availability of some metabolites, for all the two-species communities. Each community model is loaded (or built) once and all the conditions are solved on it with sweepModel, so K conditions cost K sets of optimizations instead of K runs of calculateGR. The results are written in long format, one row per community and condition, with the status of the condition (see sweepModel), so the table has a row for every condition of every community that could be loaded.
+    :param conditions: list of tuples with the name of the condition and the diet values (see dietFileConditions and dietGridConditions)
+    :param OutFile: path to the table with the growth rates for all conditions
+    :param comFolder: path to the folder containing the two-species community metabolic models
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames, used to build the community models in memory if comFolder is None
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :return OutFile: table with the columns of SWEEP_HEADER
+    '''
+
+    sweepFile = open(OutFile,'w')
+    sweepFile.write('\t'.join(SWEEP_HEADER) + '\n')
+
+    for model in iterCommunityModels(comFolder, listOfPairs, modelFolder):
+        organisms = model.id.split('X')
+        for result in sweepModel(model, conditions, growth_rate_cutoff):
+            row = [model.id, organisms[0], organisms[1]] + list(result)
+            sweepFile.write('\t'.join([str(x) for x in row]) + '\n')
+
+    sweepFile.close()
+
+
+
+# In[9]:
+
+
+class SpeciesArrays(object):
+    '''
+    Stoichiometric matrix, bounds and objective of a species model stored as flat arrays, so that community models can be assembled from them without going through cobrapy Model objects. The stoichiometric matrix is kept in coordinate format (rows, cols, values), with one row per metabolite and one column per reaction.
+    :param model: cobrapy Model object of a species
+    '''
+
+    def __init__(self, model):
+        import numpy as np
+        from cobra.util.solver import linear_reaction_coefficients
+
+        self.id = model.id
+        self.model = model
+        self.rxnIDs = [rxn.id for rxn in model.reactions]
+        self.metIDs = [met.id for met in model.metabolites]
+
+        metIndex = dict((metID, i) for i, metID in enumerate(self.metIDs))
+        rows = []
+        cols = []
+        values = []
+        for j, rxn in enumerate(model.reactions):
+            for met, coefficient in rxn.metabolites.items():
+                rows.append(metIndex[met.id])
+                cols.append(j)
+                values.append(coefficient)
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        self.values = np.array(values, dtype=float)
+
+        self.lb = np.array([rxn.lower_bound for rxn in model.reactions], dtype=float)
+        self.ub = np.array([rxn.upper_bound for rxn in model.reactions], dtype=float)
+
+        self.objective = np.zeros(len(self.rxnIDs))
+        rxnIndex = dict((rxnID, j) for j, rxnID in enumerate(self.rxnIDs))
+        for rxn, coefficient in linear_reaction_coefficients(model).items():
+            self.objective[rxnIndex[rxn.id]] = coefficient
+
+        # Exchange reactions, found as in getEXRxns. They are connected to the shared [u] compartment in the community.
+        self.exchanges = np.array([j for j, rxnID in enumerate(self.rxnIDs) if 'EX_' in rxnID], dtype=np.int64)
+        self.exIDs = [self.rxnIDs[j] for j in self.exchanges]
+
+    def compact(self):
+        '''
+        Drops the cobrapy Model and stores the ids of the reactions and metabolites as numpy arrays of strings, so that the whole object is made of a few large arrays instead of many small Python objects (see SpeciesLibrary). Community models can still be assembled from it with CommunityLP, but not converted to cobrapy models with toModel.
+        :return self
+        '''
+        import numpy as np
+
+        self.model = None
+        self.rxnIDs = np.array(self.rxnIDs, dtype=str)
+        self.metIDs = np.array(self.metIDs, dtype=str)
+        self.exIDs = np.array(self.exIDs, dtype=str)
+
+        return self
+
+
+class CommunityLP(object):
+    '''
+    Linear program of a community model assembled directly from the arrays of its members (SpeciesArrays), with the same layout as the models made by buildCommunityModel: the reactions and metabolites of each member are tagged with modelA_/model_A_ (modelB_/model_B_, ...), the exchange reactions of each member produce the corresponding metabolite of the shared [u] compartment, and the [u] compartment has one exchange reaction for each exchange reaction found in any member. The stoichiometric matrices of the members are stacked block-diagonally with the [u] block, and the whole problem is loaded into the solver in one bulk operation, with one variable per reaction (the net flux). A cobrapy Model is only created on request, with toModel.
+    :param members: list of SpeciesArrays objects
+    :param tags: list of tags for the members. Defaults to 'A', 'B', 'C', ... (or to the position of the member, for communities of more than 26 members)
+    :param solver: name of the solver to use (e.g. 'glpk' or 'highs', see SolverConfig). Defaults to the solver of the module SolverConfig (getSolverConfig), whose parameters are set on the problem, or to the cobrapy default solver.
+    :param dietBounds: dictionary with the lower bounds of the exchange reactions of the [u] compartment, set before the problem is loaded into the solver (e.g. SpeciesLibrary.dietBounds), instead of setting the 'Diet' afterwards with setDiet.
+    '''
+
+    def __init__(self, members, tags=None, solver=None, dietBounds=None):
+        import numpy as np
+        import cobra
+
+        if tags is None:
+            if len(members) <= 26:
+                tags = [chr(ord('A') + k) for k in range(len(members))]
+            else:
+                tags = ['%d' %k for k in range(len(members))]
+
+        self.members = members
+        self.tags = tags
+        self.id = 'X'.join([member.id for member in members])
+
+        config = getSolverConfig()
+        if solver is None:
+            solver = config.interface()
+        else:
+            solver = SOLVER_INTERFACES.get(solver, solver)
+        if solver is None:
+            interface = cobra.Configuration().solver
+        else:
+            interface = cobra.util.solver.solvers[solver]
+        self.interface = interface
+
+        # Columns (reactions) and rows (metabolites) of each member block, and of the [u] block at the end
+        self.EXreactions = sorted(set([exID for member in members for exID in member.exIDs]))
+        exIndex = dict((exID, i) for i, exID in enumerate(self.EXreactions))
+
+        rxnNames = []
+        metNames = []
+        rows = []
+        cols = []
+        values = []
+        lb = []
+        ub = []
+        objective = []
+        self.memberColumns = []
+        self.objectiveColumns = []
+        nRxns = 0
+        nMets = 0
+
+        # The metabolites of the [u] compartment come after the metabolites of all members
+        uOffset = sum([len(member.metIDs) for member in members])
+
+        for member, tag in zip(members, tags):
+            rxnNames.extend(['model%s_%s' %(tag, rxnID) for rxnID in member.rxnIDs])
+            metNames.extend(['model_%s_%s' %(tag, metID) for metID in member.metIDs])
+
+            rows.append(member.rows + nMets)
+            cols.append(member.cols + nRxns)
+            values.append(member.values)
+
+            # The exchange reactions of the member produce the metabolite of the [u] compartment and are opened in both directions, as in addEXMets2SpeciesEX
+            memberLb = member.lb.copy()
+            memberUb = member.ub.copy()
+            memberLb[member.exchanges] = -1000.
+            memberUb[member.exchanges] = 1000.
+            lb.append(memberLb)
+            ub.append(memberUb)
+            objective.append(member.objective)
+
+            rows.append(np.array([exIndex[exID] for exID in member.exIDs], dtype=np.int64) + uOffset)
+            cols.append(member.exchanges + nRxns)
+            values.append(np.ones(len(member.exchanges)))
+
+            self.memberColumns.append(np.arange(nRxns, nRxns + len(member.rxnIDs)))
+            self.objectiveColumns.append(np.flatnonzero(member.objective) + nRxns)
+            nRxns += len(member.rxnIDs)
+            nMets += len(member.metIDs)
+
+        # The [u] block: one metabolite and one exchange reaction for each exchange reaction of the community
+        rxnNames.extend([exID + '[u]' for exID in self.EXreactions])
+        metNames.extend([exID[3:] + '[u]' for exID in self.EXreactions])
+        rows.append(np.arange(len(self.EXreactions)) + nMets)
+        cols.append(np.arange(len(self.EXreactions)) + nRxns)
+        values.append(-np.ones(len(self.EXreactions)))
+        if dietBounds is None:
+            lb.append(-1000. * np.ones(len(self.EXreactions)))
+        else:
+            lb.append(np.array([dietBounds.get(exID + '[u]', -1000.) for exID in self.EXreactions], dtype=float))
+        ub.append(1000. * np.ones(len(self.EXreactions)))
+        objective.append(np.zeros(len(self.EXreactions)))
+        self.exchangeColumns = np.arange(nRxns, nRxns + len(self.EXreactions))
+
+        self.rows = np.concatenate(rows)
+        self.cols = np.concatenate(cols)
+        self.values = np.concatenate(values)
+        self.lb = np.concatenate(lb)
+        self.ub = np.concatenate(ub)
+        self.objective = np.concatenate(objective)
+        self.rxnNames = rxnNames
+        self.metNames = metNames
+        self.rxnIndex = dict((name, j) for j, name in enumerate(rxnNames))
+
+        # Load the problem into the solver: all the variables, then all the constraints, then their coefficients
+        with getRecorder().stage('assemble') as event:
+            event['reactions'] = len(rxnNames)
+            event['metabolites'] = len(metNames)
+            self.lp = self._loadProblem(interface, rxnNames, metNames)
+            if not config.isDefault():
+                config.apply(self.lp)
+
+    def _loadProblem(self, interface, rxnNames, metNames):
+        '''
+        Creates the optlang problem with one variable per reaction, one constraint per metabolite and the community objective, in bulk.
+        With GLPK the coefficients are loaded with a single glp_load_matrix call; other solvers get them one constraint at a time. Repeated entries of the matrix are summed.
+        '''
+        import numpy as np
+        from optlang.symbolics import Zero
+
+        lp = interface.Model()
+        self.variables = [interface.Variable(name, lb=lower, ub=upper) for name, lower, upper in zip(rxnNames, self.lb, self.ub)]
+        lp.add(self.variables)
+        constraints = [interface.Constraint(Zero, lb=0, ub=0, name=name) for name in metNames]
+        lp.add(constraints, sloppy=True)
+        lp.update()
+
+        # Repeated (row, column) entries are summed, as cobrapy does for a metabolite listed twice in a reaction
+        rows, cols, values = sumDuplicates(self.rows, self.cols, self.values, len(rxnNames))
+
+        if isGLPK(lp):
+            # GLPK takes the whole matrix in one call; its rows and columns are numbered from 1 in the order they were added, and element 0 of each array is not used
+            import swiglpk
+
+            nnz = len(values)
+            ia = glpkArray(swiglpk.intArray, np.concatenate([[0], rows + 1]).astype(np.intc))
+            ja = glpkArray(swiglpk.intArray, np.concatenate([[0], cols + 1]).astype(np.intc))
+            ar = glpkArray(swiglpk.doubleArray, np.concatenate([[0.], values]).astype(np.double))
+            swiglpk.glp_load_matrix(lp.problem, nnz, ia, ja, ar)
+        else:
+            # The entries are sorted by row by sumDuplicates
+            boundaries = np.searchsorted(rows, np.arange(len(metNames) + 1))
+            for i, constraint in enumerate(constraints):
+                start, end = boundaries[i], boundaries[i + 1]
+                if end > start:
+                    constraint.set_linear_coefficients(dict((self.variables[j], v) for j, v in zip(cols[start:end], values[start:end])))
+
+        lp.objective = interface.Objective(Zero, direction='max', sloppy=True)
+        lp.objective.set_linear_coefficients(dict((self.variables[j], self.objective[j]) for j in np.flatnonzero(self.objective)))
+        lp.update()
+
+        return lp
+
+    def setDiet(self, dietValues):
+        '''
+        Sets the lower bounds of the exchange reactions of the [u] compartment to correspond to the 'Diet', as setDietBounds does for a cobrapy model.
+        '''
+        for rxnID, value in dietValues:
+            if rxnID in self.rxnIndex:
+                variable = self.variables[self.rxnIndex[rxnID]]
+                variable.set_bounds(-value, variable.ub)
+
+    def switchMember(self, k, on):
+        '''
+        Switches member k of the community on (with its original bounds) or off (all its reactions with bounds set to zero).
+        '''
+        for j in self.memberColumns[k]:
+            if on:
+                self.variables[j].set_bounds(self.lb[j], self.ub[j])
+            else:
+                self.variables[j].set_bounds(0, 0)
+
+    def switchMembers(self, on):
+        '''
+        Switches on the members of the community whose positions are in the list on, and switches off all the others. Only the members whose state changes are updated.
+        '''
+        on = set(on)
+        if not hasattr(self, 'membersOn'):
+            self.membersOn = set(range(len(self.members)))
+        for k in range(len(self.members)):
+            if (k in on) != (k in self.membersOn):
+                self.switchMember(k, k in on)
+        self.membersOn = on
+
+    def optimize(self):
+        '''
+        Optimizes the community objective and raises an error if the solution is not optimal.
+        '''
+        with getRecorder().stage('solve') as event:
+            iterations = solverIterations(self.lp)
+            status = self.lp.optimize()
+            event['status'] = status
+            if iterations is not None:
+                event['iterations'] = solverIterations(self.lp) - iterations
+        if status != 'optimal':
+            import cobra
+            raise cobra.exceptions.OptimizationError('The community %s could not be optimized: %s' %(self.id, status))
+        return self.lp.objective.value
+
+    def growthRate(self, k):
+        '''
+        Returns the flux of the biomass reaction of member k in the last solution.
+        '''
+        return self.variables[self.objectiveColumns[k][0]].primal
+
+    def growthRates(self, dietValues, growth_rate_cutoff=1e-6, warmStart=None, soloGrowth=None, speciesKeys=None):
+        '''
+        Calculates the growth rates of the two members of the community in the presence and absence of the other member, as calculateGRModel does for a cobrapy model, starting from the basis in warmStart (a WarmStart object) if one is given. The growth rates of the members alone are taken from soloGrowth (a SoloGrowth object for the same 'Diet', with the members identified by speciesKeys) if they are already in it.
+        :return grAfull, grBfull, grASolo, grBSolo
+        '''
+        if dietValues is not None:
+            self.setDiet(dietValues)
+
+        speciesIDs = [member.id for member in self.members]
+        if warmStart is not None:
+            warmStart.restore(self.lp, speciesIDs, self.tags)
+        self.optimize()
+        if warmStart is not None:
+            warmStart.save(self.lp, speciesIDs, self.tags)
+        grAfull = self.growthRate(0)
+        grBfull = self.growthRate(1)
+
+        grASolo, grBSolo = None, None
+        if soloGrowth is not None:
+            grBSolo = soloGrowth.get(speciesKeys[1])
+
+        if grBSolo is None:
+            self.switchMember(0, False)
+            try:
+                self.optimize()
+                grBSolo = self.growthRate(1)
+            finally:
+                self.switchMember(0, True)
+            if soloGrowth is not None:
+                soloGrowth.set(speciesKeys[1], grBSolo)
+
+        if soloGrowth is not None:
+            grASolo = soloGrowth.get(speciesKeys[0])
+
+        if grASolo is None:
+            self.switchMember(1, False)
+            try:
+                self.optimize()
+                grASolo = self.growthRate(0)
+            finally:
+                self.switchMember(1, True)
+            if soloGrowth is not None:
+                soloGrowth.set(speciesKeys[0], grASolo)
+
+        growthRates = [grAfull, grBfull, grASolo, grBSolo]
+        return tuple([0. if gr < growth_rate_cutoff else gr for gr in growthRates])
+
+    def toModel(self):
+        '''
+        Creates the cobrapy Model of the community, e.g. to export it in SBML format. Only available for two-species communities, which are built with buildCommunityModel from copies of the member models.
+        '''
+        if len(self.members) != 2:
+            raise ValueError('toModel is only available for two-species communities')
+        if self.members[0].model is None or self.members[1].model is None:
+            raise ValueError('toModel is not available for species whose arrays were compacted')
+        return buildCommunityModel(self.members[0].model.copy(), self.members[1].model.copy())
+
+
+def libraryInteractions(modelFiles, diet, listOfPairs=None, modelFolder='', cache=None, growth_rate_cutoff=1e-6):
+    '''
+    This function screens the interactions between all the pairs of a library of species on a single linear program. All the species of the library are assembled in one CommunityLP, sharing the [u] compartment exactly as the two species of the models made by createCommunityModel do, and the 'Diet' is applied once. Each species alone, and then each pair, is evaluated by switching the members on and off through their bounds, so that the model is built once instead of once per pair, and each optimization starts from the solution of the previous one (solvers such as GLPK keep the last basis of the problem). The growth rates of a pair are the same as the ones calculated on its two-species community model, since the exchange reactions of the [u] compartment that belong to the species that are switched off can't carry flux to the ones that are on.
+    :param modelFiles: list of filenames of the metabolic models of the species in the library
+    :param diet: path to the file with the metabolite availability conditions, or its values already loaded with loadDiet
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames. Defaults to all the pairs of modelFiles (get_all_pairs).
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param cache: ModelCache object to use. A new one is created if it is None.
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :return rows: generator of tuples with the values of INTERACTION_COLUMNS for each pair, including the pairs that could not be optimized (see failedInteraction)
+    '''
+
+    if listOfPairs is None:
+        pairsList = get_all_pairs(modelFiles)
+    elif isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
+
+    # Consecutive pairs that share a species only switch one member on and off
+    pairsList = schedulePairs(pairsList)
+
+    if isinstance(diet, str):
+        dietValues = loadDiet(diet)
+    else:
+        dietValues = diet
+
+    if cache is None:
+        cache = ModelCache()
+
+    members = [cache.arrays(modelFolder + '%s' %modelFile) for modelFile in modelFiles]
+    position = dict((modelFile, k) for k, modelFile in enumerate(modelFiles))
+
+    recorder = getRecorder()
+
+    library = CommunityLP(members)
+    library.setDiet(dietValues)
+
+    def cutoff(gr):
+        if gr < growth_rate_cutoff:
+            return 0.
+        return gr
+
+    # Growth rate of each species alone, which is the same in all the pairs it takes part in
+    soloGrowth = {}
+    for k in range(len(members)):
+        library.switchMembers([k])
+        try:
+            library.optimize()
+            soloGrowth[k] = cutoff(library.growthRate(k))
+        except Exception as e:
+            log.warning('Species %s could not be optimized alone: %s' %(members[k].id, e))
+
+    for pair in pairsList:
+        a, b = position[pair[0]], position[pair[1]]
+        if a not in soloGrowth or b not in soloGrowth:
+            yield failedInteraction(pair, 'species %s could not be optimized alone' %members[a if a not in soloGrowth else b].id)
+            continue
+
+        try:
+            with recorder.pair(pairID(pair)):
+                library.switchMembers([a, b])
+                library.optimize()
+        except Exception as e:
+            log.warning('The pair %s could not be optimized: %s' %(pairID(pair), e))
+            yield failedInteraction(pair, e)
+            continue
+
+        grAfull = cutoff(library.growthRate(a))
+        grBfull = cutoff(library.growthRate(b))
+        grASolo = soloGrowth[a]
+        grBSolo = soloGrowth[b]
+
+        percentChangeRawA = percentChange(grAfull, grASolo)
+        percentChangeRawB = percentChange(grBfull, grBSolo)
+        typeOfInteraction = classifyInteraction(percentChangeRawA, percentChangeRawB)
+
+        yield (members[a].id + 'X' + members[b].id, members[a].id, members[b].id, grAfull, grBfull, grASolo, grBSolo, percentChangeRawA, percentChangeRawB, typeOfInteraction)
+
+
+class SpeciesLibrary(object):
+    '''
+    Species models of a run, loaded and indexed once in the main process before the worker processes of pair_interactions_multiproc are forked, so that the workers share them instead of parsing their own copies. Each species is kept only as its compacted SpeciesArrays (a few numpy arrays, without the cobrapy Model), which the workers read through copy-on-write without touching the reference counts of many small Python objects (this would copy the memory pages holding them into each worker). The 'Diet' is compiled once into the lower bounds of the exchange reactions of the [u] compartment (dietBounds), which are set when each community is assembled.
+    :param modelFiles: list of the filenames of the species models
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet)
+    :param modelFolder: path to the folder containing the metabolic models of individual species. It is added in front of the filenames.
+    :param cache: ModelCache object used to parse the models (e.g. with an on-disk tier). A new one keeping a single model in memory is created if it is None.
+    '''
+
+    def __init__(self, modelFiles, dietValues, modelFolder='', cache=None):
+        if cache is None:
+            cache = ModelCache(maxSize=1)
+
+        self.modelFiles = list(modelFiles)
+        self.position = dict((modelFile, k) for k, modelFile in enumerate(self.modelFiles))
+        self.members = []
+        self.hashes = []
+        for modelFile in self.modelFiles:
+            self.members.append(SpeciesArrays(cache.get(modelFolder + '%s' %modelFile)).compact())
+            self.hashes.append(cache.modelKey(modelFolder + '%s' %modelFile))
+
+        self.dietID = dietHash(dietValues)
+        self.dietBounds = dict((rxnID, -value) for rxnID, value in dietValues)
+
+    def community(self, pair):
+        '''
+        Assembles the CommunityLP of a pair of model filenames, with the 'Diet' applied.
+        '''
+        return CommunityLP([self.members[self.position[pair[0]]], self.members[self.position[pair[1]]]], dietBounds=self.dietBounds)
+
+
+# Species library shared by the worker processes of pair_interactions_multiproc. It is set in the main process right before the pool is forked, and only read by the workers.
+_LIBRARY = None
+
+
+def _initLibraryWorker(instrument=False, solverConfig=None):
+    '''
+    Pool initializer for pair_interactions_multiproc. The species library is inherited from the main process, so only the basis kept between communities (WarmStart), the growth rates of the species alone (SoloGrowth) and the recorder are set up.
+    '''
+    global _workerWarmStart, _workerSoloGrowth
+    _workerWarmStart = WarmStart()
+    _workerSoloGrowth = SoloGrowth(_LIBRARY.dietID)
+    _initWorkerRecorder(instrument, solverConfig)
+
+
+def _libraryGrowthWorker(task):
+    '''
+    Task run by the workers of pair_interactions_multiproc for one pair of species: assembles the community from the shared species library and calculates the growth rates of the two species. Returns the growth rates and the error message, one of which is None, and the events recorded for the pair.
+    '''
+    pair, growth_rate_cutoff = task
+    recorder = getRecorder()
+    try:
+        with recorder.pair(pairID(pair)):
+            mix = _LIBRARY.community(pair)
+            growthRates = mix.growthRates(None, growth_rate_cutoff, _workerWarmStart, _workerSoloGrowth, [_LIBRARY.hashes[_LIBRARY.position[modelFile]] for modelFile in pair[:2]])
+        return growthRates, None, recorder.drain()
+    except Exception as e:
+        return None, str(e), recorder.drain()
+
+
+def pair_interactions_multiproc(listOfPairs, diet, modelFolder='', n_processes=32, chunksize=None, growth_rate_cutoff=1e-6, store=None, cache=None, timeout=None, retry=True, fallbackSolver=None):
+    '''
+    This function evaluates the interactions of the pairs of species as pairInteractions does with sparse=True, using a pool of worker processes that share the species models. All the species models of the pairs are parsed and indexed once in the main process (SpeciesLibrary), together with the compiled 'Diet', and the pool is then forked, so that the workers read the library through copy-on-write instead of parsing their own copies: the memory used by each worker is the community being solved, whatever the number of species. Only available where processes can be forked (e.g. Linux). The pairs are ordered with schedulePairs and sent to the workers in chunks of consecutive pairs, and the rows are produced in that order.
+    The workers are run by a WatchdogPool: a worker that spends more than timeout seconds on a pair is killed and replaced by a new one forked from the main process. The pairs that failed or timed out are tried again at the end with the fallback solver settings, and their rows are produced after the others. The ones that fail again are recorded in the store with the reasons of both attempts.
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames
+    :param diet: path to the file with the metabolite availability conditions, or its values already loaded with loadDiet
+    :param modelFolder: path to the folder containing the metabolic models of individual species. It is added in front of the filenames of each pair.
+    :param n_processes: number of processes in the pool
+    :param chunksize: number of pairs sent to a worker at a time. By default the pairs are split in about four chunks per process.
+    :param growth_rate_cutoff: growth rates smaller than this value are rounded to zero.
+    :param store: ResultStore object where the results are recorded, with the same keys as pairInteractions. Pairs already done in the store are taken from it.
+    :param cache: ModelCache object used to parse the species models.
+    :param timeout: maximum time in seconds spent on each pair. The pairs are not limited if it is None.
+    :param retry: if True, the pairs that failed or timed out are tried again with fallbackSolver.
+    :param fallbackSolver: SolverConfig object used to try the failed pairs again. Defaults to fallbackSolverConfig().
+    :return rows: generator of tuples with the values of INTERACTION_COLUMNS for each pair, with the pairs that failed (see failedInteraction) after the others.
+    '''
+    import gc
+
+    global _LIBRARY
+
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
+
+    if isinstance(diet, str):
+        dietValues = loadDiet(diet)
+    else:
+        dietValues = diet
+
+    modelFiles = sorted(set([modelFile for pair in pairsList for modelFile in pair[:2]]))
+    with getRecorder().stage('library'):
+        library = SpeciesLibrary(modelFiles, dietValues, modelFolder, cache)
+    log.info('%d species models loaded in the library.' %len(modelFiles))
+
+    def interactionRow(pair, growthRates):
+        organismA = library.members[library.position[pair[0]]].id
+        organismB = library.members[library.position[pair[1]]].id
+        grAfull, grBfull, grASolo, grBSolo = growthRates
+        percentChangeRawA = percentChange(grAfull, grASolo)
+        percentChangeRawB = percentChange(grBfull, grBSolo)
+        return (organismA + 'X' + organismB, organismA, organismB, grAfull, grBfull, grASolo, grBSolo, percentChangeRawA, percentChangeRawB, classifyInteraction(percentChangeRawA, percentChangeRawB))
+
+    pairsList = schedulePairs(pairsList)
+    keys = {}
+    if store is not None:
+        tasks = []
+        for pair in pairsList:
+            key = ResultStore.key([library.hashes[library.position[pair[0]]], library.hashes[library.position[pair[1]]]], library.dietID, growth_rate_cutoff)
+            if store.done(key):
+                stored = store.get(key)
+                if stored is not None:
+                    yield interactionRow(pair, stored[3:])
+                else:
+                    yield failedInteraction(pair, store.error(key))
+                continue
+            keys[tuple(pair)] = key
+            tasks.append(pair)
+        pairsList = tasks
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(pairsList) // (4 * n_processes)))
+
+    recorder = getRecorder()
+
+    # The library is set as a global right before forking, and the objects that exist at this point are moved out of the reach of the garbage collector, which would otherwise write to their memory pages in the workers.
+    _LIBRARY = library
+    gc.collect()
+    gc.freeze()
+    if fallbackSolver is None:
+        fallbackSolver = fallbackSolverConfig()
+
+    solverConfig = getSolverConfig()
+    errors = {}
+    try:
+        for attempt in range(2 if retry else 1):
+            if attempt > 0:
+                log.info('%d pairs failed, trying them again with %r.' %(len(pairsList), fallbackSolver))
+                solverConfig = fallbackSolver
+                chunksize = max(1, -(-len(pairsList) // (4 * n_processes)))
+
+            failed = []
+            pool = WatchdogPool(n_processes, initializer=_initLibraryWorker, initargs=(recorder.enabled, solverConfig), timeout=timeout, context='fork')
+            try:
+                tasks = [(pair, growth_rate_cutoff) for pair in pairsList]
+                for pair, (result, error) in zip(pairsList, pool.imap(_libraryGrowthWorker, tasks, chunksize)):
+                    growthRates = None
+                    if result is not None:
+                        growthRates, error, events = result
+                        recorder.merge(events)
+                    if growthRates is None:
+                        errors[tuple(pair)] = error if attempt == 0 else '%s; with %r: %s' %(errors[tuple(pair)], solverConfig, error)
+                        failed.append(pair)
+                        continue
+                    row = interactionRow(pair, growthRates)
+                    if store is not None:
+                        store.finish(keys[tuple(pair)], row[0], row[1], row[2], library.dietID, growthRates)
+                    yield row
+            finally:
+                pool.close()
+            log.info(pool.summary())
+
+            pairsList = failed
+            if not pairsList:
+                break
+
+        for pair in pairsList:
+            log.warning('The pair %s %s could not be optimized: %s' %(pair[0], pair[1], errors[tuple(pair)]))
+            if store is not None:
+                store.fail(keys[tuple(pair)], '%s %s' %(pair[0], pair[1]), None, None, library.dietID, errors[tuple(pair)])
+            yield failedInteraction(pair, errors[tuple(pair)])
+    finally:
+        _LIBRARY = None
+        gc.unfreeze()
+
+    if store is not None:
+        log.info(store.summary())
+
+
+
+# In[10]:
+
+
+EXCHANGE_NETWORK_COLUMNS = ['Donor', 'Metabolite', 'Receiver', 'Weight']
+
+
+def pairExchangeFluxes(fluxFile, pair, dietID=None):
+    '''
+    This function reads the exchange fluxes of one pair from the table written by calculateGR, calculate_growth_rates_multiproc or pairInteractions with a fluxFile, and returns them with metabolites as rows and species as columns, as needed by exchangeNetwork. The metabolites that are not exchanged by one of the species have a flux of zero for it. A ValueError is raised if the table has fluxes of the pair under several diets and dietID is not given, or more than one flux for the same metabolite and species.
+    :param fluxFile: path to the table with the exchange fluxes (columns of EXCHANGE_FLUX_COLUMNS)
+    :param pair: id of the pair (the id of its community model, e.g. 'sp0Xsp1')
+    :param dietID: id of the 'Diet' of the fluxes (see dietHash). It is only needed if the table has several.
+    :return fluxes: pandas DataFrame with the exchange fluxes of the pair
+    '''
+    import pandas as pd
+
+    table = pd.read_csv(fluxFile, sep='\t', dtype={'Pair': str, 'DietID': str, 'Metabolite': str, 'Member': str, 'Flux': float})
+    table = table[table['Pair'] == pair]
+    if dietID is not None:
+        table = table[table['DietID'] == dietID]
+    elif table['DietID'].nunique() > 1:
+        raise ValueError('%s has fluxes of %s under %d diets, one has to be chosen with dietID' %(fluxFile, pair, table['DietID'].nunique()))
+    if table.duplicated(['Metabolite', 'Member']).any():
+        raise ValueError('%s has more than one flux for the same metabolite and species of %s' %(fluxFile, pair))
+    fluxes = table.pivot(index='Metabolite', columns='Member', values='Flux').astype(float).fillna(0.)
+    fluxes.columns.name = None
+    fluxes.index.name = None
+
+    return fluxes
+
+
+def exchangeNetwork(fluxes, outFile=None, chunksize=1000):
+    '''
+    This function creates the network of metabolite exchanges between the members of a community from the fluxes of their exchange reactions (e.g. the fluxes of a micom community filtered by '^EX_', transposed so that each row is a metabolite and each column a member). For each metabolite, the members with a negative flux are receivers and the members with a positive flux are donors. The balance between what is secreted and what is taken up is exchanged with an implicit 'medium' node: if more is secreted than taken up, the medium is one more receiver, otherwise it is one more donor. Each donor gives to each receiver a share of the total amount exchanged proportional to the product of their fluxes:
+        weight = receiver flux * donor flux / total flux on the side that doesn't include the medium * (total uptake + total secretion)
+    The edges of each metabolite are calculated at once with numpy, and the network is returned as a table (or written to a file) instead of a string.
+    :param fluxes: pandas DataFrame with the exchange fluxes, with metabolites as rows and members as columns, or path to a CSV file with members as rows and metabolites as columns (as written by micom in step 7 of the tutorial)
+    :param outFile: path to the file where the edges are written, in TSV format, or Parquet format if the filename ends with .parquet (requires pyarrow). If it is None, the table is returned.
+    :param chunksize: number of metabolites whose edges are written to outFile at a time
+    :return edges: pandas DataFrame with the columns of EXCHANGE_NETWORK_COLUMNS, or the number of edges written to outFile
+    '''
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(fluxes, str):
+        fluxes = pd.read_csv(fluxes, index_col=0).transpose()
+
+    members = np.array([str(member) for member in fluxes.columns] + ['medium'])
+    mediumColumn = len(members) - 1
+    values = fluxes.values.astype(float)
+
+    # Total secretion, total uptake and balance with the medium for all metabolites at once
+    secreted = np.where(values > 0, values, 0.).sum(axis=1)
+    takenUp = np.where(values < 0, values, 0.).sum(axis=1)
+    balance = secreted + takenUp
+    exchanged = np.abs(secreted) + np.abs(takenUp)
+
+    chunks = []
+    nEdges = 0
+    written = False
+    parquetWriter = None
+
+    def edgesTable(chunks):
+        if len(chunks) == 0:
+            return pd.DataFrame(dict((column, []) for column in EXCHANGE_NETWORK_COLUMNS), columns=EXCHANGE_NETWORK_COLUMNS)
+        return pd.DataFrame(dict((column, np.concatenate([chunk[i] for chunk in chunks])) for i, column in enumerate(EXCHANGE_NETWORK_COLUMNS)), columns=EXCHANGE_NETWORK_COLUMNS)
+
+    def write(table, written, parquetWriter):
+        if outFile.endswith('.parquet'):
+            import pyarrow
+            import pyarrow.parquet
+            arrowTable = pyarrow.Table.from_pandas(table, preserve_index=False)
+            if parquetWriter is None:
+                parquetWriter = pyarrow.parquet.ParquetWriter(outFile, arrowTable.schema)
+            parquetWriter.write_table(arrowTable)
+        else:
+            table.to_csv(outFile, sep='\t', index=False, header=not written, mode='a' if written else 'w')
+        return True, parquetWriter
+
+    for i in range(values.shape[0]):
+        row = values[i]
+        receivers = np.flatnonzero(row < 0)
+        donors = np.flatnonzero(row > 0)
+        receiverFlux = -row[receivers]
+        donorFlux = row[donors]
+
+        if balance[i] >= 0:
+            receivers = np.append(receivers, mediumColumn)
+            receiverFlux = np.append(receiverFlux, abs(balance[i]))
+            denominator = abs(secreted[i])
+        else:
+            donors = np.append(donors, mediumColumn)
+            donorFlux = np.append(donorFlux, abs(balance[i]))
+            denominator = abs(takenUp[i])
+
+        if len(receivers) == 0 or len(donors) == 0 or denominator == 0:
+            continue
+
+        weights = np.outer(receiverFlux, donorFlux) / denominator * exchanged[i]
+        receiverIndex, donorIndex = np.indices(weights.shape)
+        chunks.append((members[donors][donorIndex.ravel()], np.repeat(str(fluxes.index[i]), weights.size), members[receivers][receiverIndex.ravel()], weights.ravel()))
+        nEdges += weights.size
+
+        if outFile is not None and len(chunks) >= chunksize:
+            written, parquetWriter = write(edgesTable(chunks), written, parquetWriter)
+            chunks = []
+
+    if outFile is None:
+        edges = edgesTable(chunks)
+        for column in ['Donor', 'Metabolite', 'Receiver']:
+            edges[column] = edges[column].astype('category')
+        return edges
+
+    if len(chunks) > 0 or not written:
+        written, parquetWriter = write(edgesTable(chunks), written, parquetWriter)
+    if parquetWriter is not None:
+        parquetWriter.close()
+
+    return nEdges
+
+
+
+# In[11]:
+
+
+def buildCommunityDict(speciesA, speciesB, EXreactions, communityID):
+    '''
+    This function pieces together a two-species community in the dictionary format of cobrapy (cobra.io.model_to_dict), with the same reactions, metabolites, bounds and objective as the community models built by buildCommunityModel: the metabolites and reactions of species A and B are tagged with model_A_/modelA_ and model_B_/modelB_, the exchange reactions of each species produce the corresponding metabolite of the [u] compartment and are opened in both directions, and the [u] compartment has one exchange reaction for each exchange reaction in EXreactions. Working on the dictionaries avoids changing the ids of reactions and metabolites that are already in a Model, which is what takes most of the time in buildCommunityModel, and the community Model is then created in one go with cobra.io.model_from_dict.
+    :param speciesA: dictionary of the model of species A
+    :param speciesB: dictionary of the model of species B
+    :param EXreactions: ids of the exchange reactions of the [u] compartment (output of totalEXRxns)
+    :param communityID: id of the community model
+    :return community: dictionary of the community model
+    '''
+
+    EXset = set(EXreactions)
+    metabolites = []
+    reactions = []
+    genes = []
+    geneIDs = set()
+    compartments = {}
+
+    for species, tag in ((speciesA, 'A'), (speciesB, 'B')):
+        for met in species['metabolites']:
+            met = dict(met)
+            met['id'] = 'model_%s_%s' %(tag, met['id'])
+            metabolites.append(met)
+
+        for rxn in species['reactions']:
+            rxn = dict(rxn)
+            rxn['metabolites'] = dict(('model_%s_%s' %(tag, metID), coefficient) for metID, coefficient in rxn['metabolites'].items())
+            if 'EX_' in rxn['id'] and rxn['id'] + '[u]' in EXset:
+                rxn['metabolites'][rxn['id'][3:] + '[u]'] = 1.0
+                rxn['lower_bound'] = -1000.
+                rxn['upper_bound'] = 1000.
+            rxn['id'] = 'model%s_%s' %(tag, rxn['id'])
+            reactions.append(rxn)
+
+        for gene in species.get('genes', []):
+            if gene['id'] not in geneIDs:
+                geneIDs.add(gene['id'])
+                genes.append(gene)
+
+        compartments.update(species.get('compartments', {}))
+
+    for EXreaction in EXreactions:
+        metabolites.append({'id': EXreaction[3:], 'name': '', 'compartment': 'u'})
+        reactions.append({'id': EXreaction, 'name': '', 'metabolites': {EXreaction[3:]: -1.0}, 'lower_bound': -1000., 'upper_bound': 1000., 'gene_reaction_rule': ''})
+    compartments.setdefault('u', '')
+
+    return {'id': communityID, 'name': speciesA.get('name', communityID), 'metabolites': metabolites, 'reactions': reactions, 'genes': genes, 'compartments': compartments}
+
+
+class CommunityArchive(object):
+    '''
+    Single-file archive of two-species community models. Writing one SBML file per pair repeats the complete networks of both species in every file, so the archive stores the network of each species only once (in cobrapy JSON format, keyed by the hash of its model file), and each pair as a small record with the ids and keys of its two members and the list of the exchange reactions of its [u] compartment (the output of totalEXRxns). The archive is a ZIP file, whose index allows any pair to be read by its id without reading the rest of the file. A community is loaded by building it in memory from its two members, as a cobrapy Model (community, with buildCommunityDict) or as a CommunityLP (communityLP). The members are parsed once and kept in memory, so loading the many pairs a species takes part in costs one parse of the species.
+    :param path: path to the archive file
+    :param mode: 'r' to read the archive, 'a' to add pairs to it (it is created if it doesn't exist)
+    :param maxSize: maximum number of species models kept in memory
+    '''
+
+    def __init__(self, path, mode='r', maxSize=256):
+        import zipfile
+        from collections import OrderedDict
+
+        if mode == 'a' and not os.path.exists(path):
+            mode = 'w'
+        self.path = path
+        self.maxSize = maxSize
+        self.zipFile = zipfile.ZipFile(path, mode, zipfile.ZIP_DEFLATED)
+        self.names = set(self.zipFile.namelist())
+        self.dicts = OrderedDict()
+        self.models = OrderedDict()
+        self.speciesArrays = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.zipFile.close()
+
+    def addSpecies(self, model, key=None):
+        '''
+        Adds the model of a species to the archive, unless it is already there.
+        :param model: cobrapy Model object of the species
+        :param key: key of the species, usually the hash of its model file. The hash of the JSON serialization of the model is used if it is None.
+        :return key: key of the species in the archive
+        '''
+        import hashlib
+        import cobra
+
+        text = None
+        if key is None:
+            text = cobra.io.to_json(model)
+            key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+        name = 'species/%s.json' %key
+        if name not in self.names:
+            if text is None:
+                text = cobra.io.to_json(model)
+            self.zipFile.writestr(name, text)
+            self.names.add(name)
+
+        return key
+
+    def addPair(self, modelA, modelB, keyA=None, keyB=None):
+        '''
+        Adds a two-species community to the archive: the models of the two species, if they are not in the archive yet, and the record of the pair.
+        :param modelA: cobrapy Model object of species A
+        :param modelB: cobrapy Model object of species B
+        :param keyA: key of species A (see addSpecies)
+        :param keyB: key of species B (see addSpecies)
+        :return pairID: id of the pair, the same as the id of its community model (modelA.id + 'X' + modelB.id)
+        '''
+        pairID = modelA.id + 'X' + modelB.id
+        if 'pairs/%s.json' %pairID in self.names:
+            return pairID
+
+        keyA = self.addSpecies(modelA, keyA)
+        keyB = self.addSpecies(modelB, keyB)
+
+        record = {'id': pairID, 'members': [keyA, keyB], 'species': [modelA.id, modelB.id], 'exchanges': totalEXRxns(modelA, modelB)}
+        self.zipFile.writestr('pairs/%s.json' %pairID, json.dumps(record))
+        self.names.add('pairs/%s.json' %pairID)
+
+        return pairID
+
+    def pairIDs(self):
+        '''
+        Returns the sorted list of the ids of the pairs in the archive.
+        '''
+        return sorted([name[len('pairs/'):-len('.json')] for name in self.names if name.startswith('pairs/')])
+
+    def record(self, pairID):
+        '''
+        Returns the record of a pair: a dictionary with its id, the keys and ids of its members and its exchange reactions.
+        '''
+        return json.loads(self.zipFile.read('pairs/%s.json' %pairID).decode('utf-8'))
+
+    def pairHash(self, pairID):
+        '''
+        Returns a hash that identifies the content of a pair (the keys of its members), used as the key of its results in a ResultStore.
+        '''
+        import hashlib
+
+        return hashlib.sha1(json.dumps(self.record(pairID)['members']).encode('utf-8')).hexdigest()
+
+    def speciesDict(self, key):
+        '''
+        Returns the model of a species in the dictionary format of cobrapy, reading it from the archive only if it is not in memory. The dictionary should not be changed.
+        '''
+        if key in self.dicts:
+            speciesDict = self.dicts.pop(key)
+        else:
+            speciesDict = json.loads(self.zipFile.read('species/%s.json' %key).decode('utf-8'))
+
+        self.dicts[key] = speciesDict
+        while len(self.dicts) > self.maxSize:
+            self.dicts.popitem(last=False)
+
+        return speciesDict
+
+    def species(self, key):
+        '''
+        Returns a copy of the model of a species, creating it only if it is not in memory.
+        '''
+        import cobra
+
+        if key in self.models:
+            model = self.models.pop(key)
+        else:
+            model = cobra.io.model_from_dict(self.speciesDict(key))
+
+        self.models[key] = model
+        while len(self.models) > self.maxSize:
+            self.models.popitem(last=False)
+
+        return model.copy()
+
+    def arrays(self, key):
+        '''
+        Returns the SpeciesArrays of the model of a species, used to assemble community models with CommunityLP.
+        '''
+        if key in self.speciesArrays:
+            speciesArrays = self.speciesArrays.pop(key)
+        else:
+            speciesArrays = SpeciesArrays(self.species(key))
+
+        self.speciesArrays[key] = speciesArrays
+        while len(self.speciesArrays) > self.maxSize:
+            self.speciesArrays.popitem(last=False)
+
+        return speciesArrays
+
+    def community(self, pairID):
+        '''
+        Returns the cobrapy Model of the community of a pair, the same as the one createCommunityModel exports in SBML format, created with buildCommunityDict.
+        '''
+        import cobra
+
+        record = self.record(pairID)
+        keyA, keyB = record['members']
+        return cobra.io.model_from_dict(buildCommunityDict(self.speciesDict(keyA), self.speciesDict(keyB), record['exchanges'], record['id']))
+
+    def communityLP(self, pairID):
+        '''
+        Returns the CommunityLP of the community of a pair.
+        '''
+        keyA, keyB = self.record(pairID)['members']
+        return CommunityLP([self.arrays(keyA), self.arrays(keyB)])
+
+
+def archiveComModels(listOfPairs, modelFolder, archivePath, cache=None, cacheDir=None, compression=None):
+    '''
+    This function stores the two-species communities of all the pairs in listOfPairs in a CommunityArchive, as allPairComModels does with one SBML file per pair. Pairs are added to the archive if it already exists.
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param archivePath: path to the archive file
+    :param cache: ModelCache object to use. A new one is created if it is None.
+    :param cacheDir: path to the folder for the on-disk tier of the new cache. Only used if cache is None.
+    :param compression: SpeciesCompression object applied to the species models by the new cache (see pairsCompression). Only used if cache is None. The compressed species are stored in the archive under their own keys (ModelCache.modelKey).
+    '''
+
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = listOfPairs
+
+    if cache is None:
+        cache = ModelCache(cacheDir=cacheDir, compression=compression)
+
+    recorder = getRecorder()
+
+    archive = CommunityArchive(archivePath, 'a')
+    try:
+        for pair in pairsList:
+            modelA = modelFolder + '%s' %pair[0]
+            modelB = modelFolder + '%s' %pair[1]
+            try:
+                with recorder.pair(pairID(pair)):
+                    with recorder.stage('load'):
+                        model1 = cache.get(modelA)
+                        model2 = cache.get(modelB)
+                    with recorder.stage('write'):
+                        archive.addPair(model1, model2, cache.modelKey(modelA), cache.modelKey(modelB))
+            except Exception as e:
+                log.warning('The pair %s %s could not be added to the archive: %s' %(pair[0], pair[1], e))
+    finally:
+        archive.close()
+
+    log.info(cache.summary())
+
+
+def isArchive(comFolder):
+    '''
+    Returns True if comFolder is a CommunityArchive file rather than a folder of community models.
+    '''
+    import zipfile
+
+    return os.path.isfile(comFolder) and zipfile.is_zipfile(comFolder)
+
+
+
+# In[12]:
+
+
+PAIR_SCORE_COLUMNS = ['SpeciesA', 'SpeciesB', 'Shared', 'OnlyA', 'OnlyB', 'DietAvailable']
+
+
+_popcountTable = None
+
+
+def _popcount(words):
+    '''
+    Returns the number of bits set in each row of a 2-D array of uint64 words, with numpy.bitwise_count if it is available (numpy 2) or with a lookup table of the bytes otherwise.
+    '''
+    global _popcountTable
+    import numpy as np
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    if _popcountTable is None:
+        _popcountTable = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return _popcountTable[words.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+class ExchangeIndex(object):
+    '''
+    Index of the exchange reactions of a library of species, used to score all the pairs of species before any community model is built. Each species is a row of bits, one bit per exchange reaction found in any species (the reactions with 'EX_' in their id, as detected by getEXRxns for totalEXRxns), packed 64 to a word. The scores of a pair are then counted with bitwise operations on the two rows: the number of exchange reactions the two species share (Shared), the ones only species A or only species B has (OnlyA, OnlyB), and the ones of either species whose metabolite is available in the 'Diet' (DietAvailable). Pairs that share few exchange metabolites can hardly interact through the [u] compartment, so ranking or filtering the pairs with these scores (rankPairs) lets the flux balance analysis be spent on the pairs most likely to interact.
+    :param speciesIDs: list of the names of the species (e.g. their model filenames)
+    :param exchanges: list with the ids of the exchange reactions of each species
+    '''
+
+    def __init__(self, speciesIDs, exchanges):
+        import numpy as np
+
+        self.speciesIDs = list(speciesIDs)
+        self.exIDs = sorted(set([exID for speciesExchanges in exchanges for exID in speciesExchanges]))
+        exIndex = dict((exID, k) for k, exID in enumerate(self.exIDs))
+
+        # The rows are padded to a whole number of 64-bit words
+        present = np.zeros((len(self.speciesIDs), 64 * ((len(self.exIDs) + 63) // 64)), dtype=bool)
+        for i, speciesExchanges in enumerate(exchanges):
+            present[i, [exIndex[exID] for exID in speciesExchanges]] = True
+        self.words = self._pack(present)
+        self.counts = _popcount(self.words)
+
+    @staticmethod
+    def _pack(present):
+        import numpy as np
+
+        return np.ascontiguousarray(np.packbits(present, axis=-1).reshape(len(present), -1)).view(np.uint64)
+
+    @classmethod
+    def fromModels(cls, modelFiles, modelFolder='', cache=None):
+        '''
+        Creates the index of the species in modelFiles. Each model is parsed once (through a ModelCache).
+        :param modelFiles: list of filenames of the metabolic models of the species
+        :param modelFolder: path to the folder containing the metabolic models
+        :param cache: ModelCache object to use. A new one is created if it is None.
+        '''
+        if cache is None:
+            cache = ModelCache()
+
+        exchanges = [list(getEXRxns(cache.get(modelFolder + '%s' %modelFile))) for modelFile in modelFiles]
+        return cls(modelFiles, exchanges)
+
+    def dietWords(self, dietValues):
+        '''
+        Returns the row of bits of the exchange reactions whose metabolite is available in the 'Diet' (uptake larger than zero), as a 1 x words array. The ids of the diet ([u] exchange reactions) are matched without their [u] tag.
+        '''
+        import numpy as np
+
+        available = set([rxnID[:-len('[u]')] if rxnID.endswith('[u]') else rxnID for rxnID, value in dietValues if value > 0])
+        present = np.zeros((1, 64 * self.words.shape[1]), dtype=bool)
+        present[0, [k for k, exID in enumerate(self.exIDs) if exID in available]] = True
+        return self._pack(present)
+
+    def iterScores(self, dietValues=None):
+        '''
+        Calculates the scores of all the pairs of species, one species A at a time against all the species after it, with vectorized counts of the bits. Only the bits shared by A and B are counted for each pair: the exchange reactions only A or only B has follow from the number of exchange reactions of each species, and the ones available in the 'Diet' from the counts of A, B and A and B together restricted to the diet.
+        :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet). DietAvailable is 0 if it is None.
+        :return scores: generator of dictionaries of arrays, one per species A, with the positions of species A and B ('a', 'b') and the four scores ('shared', 'onlyA', 'onlyB', 'diet')
+        '''
+        import numpy as np
+
+        if dietValues is not None:
+            dietWords = self.words & self.dietWords(dietValues)
+            dietCounts = _popcount(dietWords)
+
+        for a in range(len(self.speciesIDs) - 1):
+            rowsB = self.words[a + 1:]
+            shared = _popcount(rowsB & self.words[a])
+            scores = {
+                'a': np.full(len(rowsB), a),
+                'b': np.arange(a + 1, len(self.speciesIDs)),
+                'shared': shared,
+                'onlyA': self.counts[a] - shared,
+                'onlyB': self.counts[a + 1:] - shared,
+            }
+            if dietValues is not None:
+                scores['diet'] = dietCounts[a] + dietCounts[a + 1:] - _popcount(dietWords[a + 1:] & dietWords[a])
+            else:
+                scores['diet'] = np.zeros(len(rowsB), dtype=np.int64)
+            yield scores
+
+    def scores(self, dietValues=None):
+        '''
+        Returns the scores of all the pairs of species, as a dictionary of arrays (see iterScores).
+        '''
+        import numpy as np
+
+        chunks = list(self.iterScores(dietValues))
+        if not chunks:
+            return dict((name, np.zeros(0, dtype=np.int64)) for name in ['a', 'b', 'shared', 'onlyA', 'onlyB', 'diet'])
+        return dict((name, np.concatenate([chunk[name] for chunk in chunks])) for name in chunks[0])
+
+    def writeScores(self, outFile, dietValues=None):
+        '''
+        Writes the scores of all the pairs of species to a tab-delimited table with the columns of PAIR_SCORE_COLUMNS.
+        '''
+        scoresFile = open(outFile, 'w')
+        scoresFile.write('\t'.join(PAIR_SCORE_COLUMNS) + '\n')
+        for scores in self.iterScores(dietValues):
+            for a, b, shared, onlyA, onlyB, diet in zip(scores['a'], scores['b'], scores['shared'], scores['onlyA'], scores['onlyB'], scores['diet']):
+                scoresFile.write('%s\t%s\t%d\t%d\t%d\t%d\n' %(self.speciesIDs[a], self.speciesIDs[b], shared, onlyA, onlyB, diet))
+        scoresFile.close()
+
+
+def rankPairs(index, rankBy='shared', top=None, minScore=None, dietValues=None):
+    '''
+    This function ranks the pairs of species of an ExchangeIndex by one of their scores, from the highest to the lowest, so that the pairs most likely to interact can be analysed first, or alone. Pairs with the same score keep the order of get_all_pairs.
+    :param index: ExchangeIndex object of the species
+    :param rankBy: score used to rank the pairs: 'shared', 'onlyA', 'onlyB', 'diet' or 'complementarity' (onlyA + onlyB)
+    :param top: number of pairs to keep. All the pairs are kept if it is None.
+    :param minScore: pairs with a lower score are left out
+    :param dietValues: list of tuples with the exchange reaction id and the uptake value (output of loadDiet), needed to rank by 'diet'
+    :return pairs: list of tuples with the names of species A and B, which can be written with writePairsFile
+    '''
+    import numpy as np
+
+    scores = index.scores(dietValues)
+    if rankBy == 'complementarity':
+        score = scores['onlyA'] + scores['onlyB']
+    else:
+        score = scores[rankBy]
+
+    keep = np.arange(len(score))
+    if minScore is not None:
+        keep = keep[score >= minScore]
+    keep = keep[np.argsort(-score[keep], kind='mergesort')]
+    if top is not None:
+        keep = keep[:top]
+
+    return [(index.speciesIDs[scores['a'][k]], index.speciesIDs[scores['b'][k]]) for k in keep]
+
+
+
+# In[13]:
+
+
+'''
+    Sharding of the runs over several machines. Each stage can process only one shard of its pairs (or community models), given as 'i/n' (shard i of n, counting from 0). The shards are made in the same way on every machine from the same pairs file or the same models, so the machines only have to share the filesystem: each one runs the same command with a different shard and its own output file, and the outputs are combined with mergeTables at the end.
+'''
+
+
+def parseShard(shard):
+    '''
+    Reads a shard given as 'i/n' (or as a tuple (i, n)), where i counts from 0.
+    :return i, n: position of the shard and number of shards
+    '''
+    if isinstance(shard, str):
+        try:
+            i, n = [int(x) for x in shard.split('/')]
+        except ValueError:
+            raise ValueError("a shard should be given as 'i/n', e.g. '0/4', not %r" %shard)
+    else:
+        i, n = shard
+
+    if n < 1 or not 0 <= i < n:
+        raise ValueError('shard %d/%d does not exist: shards go from 0 to n-1' %(i, n))
+
+    return i, n
+
+
+def shardItems(items, costs, shard):
+    '''
+    This function splits a list of items (pairs or community models) into shards of about the same total cost, and returns the items of one shard. The items are assigned from the most to the least costly to the shard with the lowest total so far (ties go to the earlier item and to the first shard), so the split only depends on the order of the items and their costs, and is the same on every machine.
+    :param items: list of items
+    :param costs: list with the estimated cost of each item
+    :param shard: shard to return, as 'i/n' or (i, n)
+    :return items: items of the shard, in their original order
+    '''
+    import heapq
+
+    i, n = parseShard(shard)
+
+    loads = [(0., k) for k in range(n)]
+    assigned = [None] * len(items)
+    for position in sorted(range(len(items)), key=lambda position: (-costs[position], position)):
+        load, k = heapq.heappop(loads)
+        assigned[position] = k
+        heapq.heappush(loads, (load + costs[position], k))
+
+    return [item for item, k in zip(items, assigned) if k == i]
+
+
+def _fileSize(path):
+    '''
+    Returns the size of a file, used as an estimate of the size of the model it contains, or 0 if it doesn't exist.
+    '''
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def shardPairs(pairsList, shard, modelFolder=''):
+    '''
+    This function returns the pairs of species of one shard, balanced by the estimated size of the community models, which is the sum of the sizes of the model files of the two species.
+    :param pairsList: list of pairs of model filenames (e.g. the output of readPairsFile)
+    :param shard: shard to return, as 'i/n' or (i, n)
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :return pairsList: pairs of the shard
+    '''
+    sizes = {}
+    for pair in pairsList:
+        for modelFile in pair[:2]:
+            if modelFile not in sizes:
+                sizes[modelFile] = _fileSize(modelFolder + '%s' %modelFile)
+
+    return shardItems(pairsList, [sizes[pair[0]] + sizes[pair[1]] for pair in pairsList], shard)
+
+
+def shardModels(allModels, shard, archive=None):
+    '''
+    This function returns the community models of one shard, balanced by the size of the model files (or, for the pairs of a CommunityArchive, the size of the two species in the archive). The models are sorted first, so the shards don't depend on the order in which the files are listed.
+    :param allModels: list of paths to community model files, or of pair ids if archive is given
+    :param shard: shard to return, as 'i/n' or (i, n)
+    :param archive: CommunityArchive object the pairs are read from
+    :return allModels: models of the shard
+    '''
+    allModels = sorted(allModels)
+
+    if archive is not None:
+        costs = [sum([archive.zipFile.getinfo('species/%s.json' %key).file_size for key in archive.record(pairID)['members']]) for pairID in allModels]
+    else:
+        costs = [_fileSize(modelFile) for modelFile in allModels]
+
+    return shardItems(allModels, costs, shard)
+
+
+def expectedPairIDs(comFolder=None, listOfPairs=None):
+    '''
+    This function lists the ids of the pairs that should be found in the merged tables of a run, either from the community models (the files of a folder of community models, or the pairs of a CommunityArchive), or from a pairs file. In the latter case the ids are made from the model filenames (see pairID), so they only match the ids of the community models if the ids of the species models are the same as their filenames.
+    :param comFolder: path to the folder with the community models, or to a CommunityArchive file
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames
+    :return pairIDs: set of the ids of the pairs
+    '''
+    if comFolder is not None:
+        if isArchive(comFolder):
+            archive = CommunityArchive(comFolder)
+            pairIDs = set(archive.pairIDs())
+            archive.close()
+            return pairIDs
+        return set([communityPairID(modelFile) for modelFile in getListOfModels(comFolder)])
+
+    if isinstance(listOfPairs, str):
+        listOfPairs = readPairsFile(listOfPairs)
+    return set([pairID(pair) for pair in listOfPairs])
+
+
+def mergeTables(inFiles, outFile, expected=None):
+    '''
+    This function combines the tables written by the shards of a run (growth rates or interactions, in any of the formats of ResultsWriter) into a single table, with the columns of the first table and the format chosen from the extension of outFile. Each pair (identified by the column PairID) is written once, from the first table it is found in. Pairs found more than once are reported as duplicates, and as conflicts if their values are different. If the ids of the expected pairs are given, the pairs missing from all the tables (and the unexpected ones) are reported as well.
+    :param inFiles: list of paths to the tables of the shards
+    :param outFile: path to the merged table
+    :param expected: set of the ids of the pairs that should be in the tables (see expectedPairIDs)
+    :return report: dictionary with the number of pairs written ('pairs') and the lists of 'duplicates', 'conflicts', 'missing' and 'unexpected' pair ids
+    '''
+
+    rows = {}
+    duplicates = []
+    conflicts = []
+    mergedFile = None
+
+    for inFile in inFiles:
+        for chunk in iterResults(inFile):
+            if mergedFile is None:
+                mergedFile = ResultsWriter(outFile, [column for column in chunk.columns if column in RESULT_TYPES])
+            chunk = chunk[mergedFile.columns]
+            for row in chunk.itertuples(index=False):
+                values = [repr(value) for value in row]
+                if row[0] in rows:
+                    duplicates.append(row[0])
+                    if rows[row[0]] != values:
+                        conflicts.append(row[0])
+                    continue
+                rows[row[0]] = values
+                mergedFile.write(row)
+
+    if mergedFile is None:
+        mergedFile = ResultsWriter(outFile, GROWTH_COLUMNS)
+    mergedFile.close()
+
+    report = {'pairs': len(rows), 'duplicates': sorted(set(duplicates)), 'conflicts': sorted(set(conflicts)), 'missing': [], 'unexpected': []}
+    if expected is not None:
+        report['missing'] = sorted(set(expected) - set(rows))
+        report['unexpected'] = sorted(set(rows) - set(expected))
+
+    log.info('%d pairs merged into %s from %d tables: %d duplicated (%d with different values), %d missing, %d unexpected.' %(report['pairs'], mergedFile.path, len(inFiles), len(report['duplicates']), len(report['conflicts']), len(report['missing']), len(report['unexpected'])))
+
+    return report
+
+
+
+# In[14]:
+def solverCandidates(solvers=None):
+    '''
+    Lists the solver configurations compared by autotuneSolver: for each backend, every simplex method of SOLVER_METHODS with the presolver turned on and off.
+    :param solvers: names of the backends. Defaults to the installed ones (availableSolvers).
+    :return candidates: list of SolverConfig objects
+    '''
+    if solvers is None:
+        solvers = availableSolvers()
+
+    candidates = []
+    for solver in solvers:
+        for method in SOLVER_METHODS.get(solver, [None]):
+            for presolve in [False, True]:
+                candidates.append(SolverConfig(solver, presolve, method))
+    return candidates
+
+
+def autotuneSolver(listOfPairs, diet, modelFolder='', sample=20, candidates=None, repeat=1, tolerance=1e-6, seed=0, cache=None):
+    '''
+    This function chooses the solver configuration of a run with an offline benchmark: the community models of a sample of the pairs are built once, and their growth rates (calculateGRModel) are calculated with each candidate SolverConfig. A candidate is correct if the growth rates of the species alone and the total growth rate of the full community (the split between the two species may differ between optimal solutions) are the same as with the default solver, within tolerance*(1+|value|). The fastest correct candidate is returned, to be saved with SolverConfig.save and used for the whole run.
+    :param listOfPairs: path to the file with the pairs of species, or list of pairs of model filenames
+    :param diet: path to the file with the metabolite availability conditions, or its values already loaded with loadDiet
+    :param modelFolder: path to the folder containing the metabolic models of individual species
+    :param sample: number of pairs in the benchmark, picked at random (with seed) from all the pairs
+    :param candidates: list of SolverConfig objects to compare. Defaults to solverCandidates().
+    :param repeat: number of times each candidate is timed. The shortest time is kept.
+    :param tolerance: relative tolerance on the growth rates
+    :param seed: seed of the random sample of pairs
+    :param cache: ModelCache object used to load the species models. A new one is created if it is None.
+    :return config, report: the fastest correct SolverConfig (SolverConfig() if none is correct), and a list with the settings, time in seconds, correctness and largest error of each candidate
+    '''
+    import random
+    import timeit
+
+    if isinstance(listOfPairs, str):
+        pairsList = readPairsFile(listOfPairs)
+    else:
+        pairsList = list(listOfPairs)
+
+    if isinstance(diet, str):
+        dietValues = loadDiet(diet)
+    else:
+        dietValues = diet
+
+    if candidates is None:
+        candidates = solverCandidates()
+    if cache is None:
+        cache = ModelCache()
+
+    if sample is not None and sample < len(pairsList):
+        pairsList = random.Random(seed).sample(pairsList, sample)
+    communities = [buildCommunityModel(cache.get(modelFolder + pair[0]), cache.get(modelFolder + pair[1])) for pair in pairsList]
+
+    def benchmark(config):
+        # The models are copied (and configured) before the clock starts, so only the optimizations are timed
+        results = []
+        elapsed = 0.0
+        for community in communities:
+            model = configureSolver(community.copy(), config)
+            start = timeit.default_timer()
+            grAfull, grBfull, grASolo, grBSolo = calculateGRModel(model, dietValues)
+            elapsed += timeit.default_timer() - start
+            results.append((grAfull + grBfull, grASolo, grBSolo))
+        return elapsed, results
+
+    reference = benchmark(SolverConfig())[1]
+
+    report = []
+    best = None
+    for config in candidates:
+        entry = config.settings()
+        try:
+            times = []
+            for i in range(repeat):
+                elapsed, results = benchmark(config)
+                times.append(elapsed)
+            error = max([abs(value - expected) / (1 + abs(expected)) for result, expectedResult in zip(results, reference) for value, expected in zip(result, expectedResult)] or [0.0])
+            entry.update({'time': min(times), 'correct': error <= tolerance, 'error': error})
+        except Exception as e:
+            entry.update({'time': None, 'correct': False, 'error': str(e)})
+        report.append(entry)
+        log.info('%r: %s' %(config, 'failed (%s)' %entry['error'] if entry['time'] is None else '%.3f s, largest error %.2g%s' %(entry['time'], entry['error'], '' if entry['correct'] else ', rejected')))
+
+        if entry['correct'] and (best is None or entry['time'] < best[1]['time']):
+            best = config, entry
+
+    if best is None:
+        log.warning('None of the %d solver configurations gave the same growth rates as the default solver, which is kept.' %len(candidates))
+        return SolverConfig(), report
+
+    log.info('Fastest solver configuration on %d pairs: %r' %(len(communities), best[0]))
+    return best[0], report
+
+
+
+# In[15]:
+
+
+'''
+    Command line interface. Each step of the analysis is a subcommand, so that it can be run as a short job on a cluster without a notebook, e.g.:
+
+        python PA_IN.py pairs models/ -o pairs.txt
+        python PA_IN.py build pairs.txt models/ pair_communities/ --processes 20
+        python PA_IN.py build pairs.txt models/ communities.zip --archive
+        python PA_IN.py growth diet.tsv pair_communities/ -o outputGR.txt --processes 20
+        python PA_IN.py interactions outputGR.txt -o interactions.tsv
+        python PA_IN.py diet diet.tsv pair_communities/ dieted/
+
+    The solver of the linear programs is chosen with an offline benchmark on a sample of the pairs (see autotuneSolver), and the configuration it writes is given to the other subcommands with --solver-config:
+
+        python PA_IN.py autotune pairs.txt models/ diet.tsv -o solver.json
+        python PA_IN.py --solver-config solver.json growth diet.tsv pair_communities/ -o outputGR.txt
+
+    With --timeout, a community that takes longer than the given number of seconds to analyse is abandoned and its worker process is replaced, so one pair that hangs the solver can't stall a run. The pairs that failed or timed out are tried again with other solver settings (see fallbackSolverConfig), and the ones that fail again are written to the table and the store with the reason:
+
+        python PA_IN.py growth diet.tsv pair_communities/ -o outputGR.txt --processes 20 --timeout 300 --store run.db
+
+    With build --compress diet.tsv, the reactions of the species that can't carry flux under that diet are removed before the communities are built (see SpeciesCompression), which makes the linear programs of the growth stage smaller.
+
+    The build, growth, interactions and diet subcommands take a --shard i/n option to process only one shard of the pairs, so that a run can be split over several machines sharing a filesystem (each shard writing its own output), and the merge subcommand combines the tables of the shards:
+
+        python PA_IN.py growth diet.tsv pair_communities/ -o outputGR.0.txt --shard 0/4
+        python PA_IN.py merge outputGR.txt outputGR.*.txt --com-folder pair_communities/
+
+    Only the modules needed by the chosen subcommand are imported.
+'''
+
+
+def writePairsFile(pairs, listOfPairs):
+    '''
+    This function writes the pairs of species to a file, one pair per line with the two model filenames separated by a tab, to be read by readPairsFile.
+    :param pairs: list of pairs of model filenames (e.g. the output of get_all_pairs)
+    :param listOfPairs: path to the file with pairs of species
+    '''
+
+    pairsFile = open(listOfPairs, 'w')
+    for pair in pairs:
+        pairsFile.write(pair[0] + '\t' + pair[1] + '\n')
+    pairsFile.close()
+
+
+def _pairsCommand(args):
+    modelFiles = sorted([modelFile for modelFile in os.listdir(args.modelFolder) if modelFile.endswith(('.xml', '.sbml', '.json', '.mat'))])
+
+    if args.rank_by is None and args.top is None and args.min_score is None and args.scores is None:
+        pairs = get_all_pairs(modelFiles)
+    else:
+        dietValues = None
+        if args.diet is not None:
+            dietValues = loadDiet(args.diet)
+        index = ExchangeIndex.fromModels(modelFiles, os.path.join(args.modelFolder, ''))
+        if args.scores is not None:
+            index.writeScores(args.scores, dietValues)
+        pairs = rankPairs(index, args.rank_by or 'shared', args.top, args.min_score, dietValues)
+
+    writePairsFile(pairs, args.output)
+    log.info('%d pairs of %d models written to %s' %(len(pairs), len(modelFiles), args.output))
+
+
+def _shardedPairs(listOfPairs, shard, modelFolder=''):
+    if shard is None:
+        return listOfPairs
+    pairsList = shardPairs(readPairsFile(listOfPairs), shard, modelFolder)
+    log.info('shard %d/%d: %d pairs' %(shard + (len(pairsList),)))
+    return pairsList
+
+
+def _buildCommand(args):
+    compression = None
+    if args.compress is not None:
+        # The metabolites available under the diet depend on all the species of the run, not only the ones of the shard
+        compression = pairsCompression(args.pairs, args.compress, args.modelFolder)
+    args.pairs = _shardedPairs(args.pairs, args.shard, args.modelFolder)
+    if args.archive:
+        archiveComModels(args.pairs, args.modelFolder, args.comFolder, cacheDir=args.cache_dir, compression=compression)
+    elif args.processes > 1:
+        create_community_models_multiproc(args.pairs, args.modelFolder, args.comFolder, n_processes=args.processes, cacheDir=args.cache_dir, compression=compression)
+    else:
+        allPairComModels(args.pairs, args.modelFolder, args.comFolder, cacheDir=args.cache_dir, compression=compression)
+
+
+def _growthCommand(args):
+    store = None
+    if args.store is not None:
+        store = ResultStore(args.store, retryFailed=args.retry_failed)
+    try:
+        if args.processes > 1 or args.timeout is not None:
+            calculate_growth_rates_multiproc(args.diet, args.comFolder, n_processes=args.processes, OutFile=args.output, store=store, shard=args.shard, fluxFile=args.fluxes, timeout=args.timeout, retry=not args.no_retry)
+        else:
+            calculateGR(args.diet, args.comFolder, OutFile=args.output, store=store, shard=args.shard, fluxFile=args.fluxes)
+    finally:
+        if store is not None:
+            store.close()
+
+
+def _interactionsCommand(args):
+    if args.growthRates is not None:
+        if args.shard is not None:
+            raise SystemExit('interactions: --shard is only used with --pairs')
+        evaluateInteractions(args.growthRates, args.output)
+        return
+
+    if args.pairs is None or args.diet is None:
+        raise SystemExit('interactions: either a growth rates table or --pairs and --diet are needed')
+
+    cache = None
+    if args.compress:
+        cache = ModelCache(maxSize=1 if args.processes > 1 else 256, compression=pairsCompression(args.pairs, args.diet, args.model_folder))
+    args.pairs = _shardedPairs(args.pairs, args.shard, args.model_folder)
+
+    store = None
+    if args.store is not None:
+        store = ResultStore(args.store, retryFailed=args.retry_failed)
+    try:
+        if args.processes > 1 or args.timeout is not None:
+            if args.com_folder is not None or args.fluxes is not None:
+                raise SystemExit('interactions: --com-folder and --fluxes are not available with --processes or --timeout')
+            rows = pair_interactions_multiproc(args.pairs, args.diet, args.model_folder, n_processes=args.processes, store=store, cache=cache, timeout=args.timeout, retry=not args.no_retry)
+        else:
+            rows = pairInteractions(args.pairs, args.diet, args.model_folder, comFolder=args.com_folder, cache=cache, store=store, sparse=args.sparse, fluxFile=args.fluxes)
+        writeInteractionsTable(rows, args.output, dietHash(loadDiet(args.diet)))
+    finally:
+        if store is not None:
+            store.close()
+
+
+def _dietCommand(args):
+    if not os.path.exists(args.outFolder):
+        os.makedirs(args.outFolder)
+    apply_diet(args.diet, args.comFolder, os.path.join(args.outFolder, ''), shard=args.shard)
+
+
+def _autotuneCommand(args):
+    candidates = None
+    if args.solvers is not None:
+        candidates = solverCandidates(args.solvers.split(','))
+    config, report = autotuneSolver(args.pairs, args.diet, args.modelFolder, sample=args.sample, candidates=candidates, repeat=args.repeat)
+    config.save(args.output, benchmark=report)
+    log.info('%r written to %s' %(config, args.output))
+
+
+def _mergeCommand(args):
+    expected = None
+    if args.com_folder is not None or args.pairs is not None:
+        expected = expectedPairIDs(args.com_folder, args.pairs)
+
+    report = mergeTables(args.tables, args.output, expected)
+
+    problems = [('missing', 'pairs missing from the tables'), ('conflicts', 'pairs with different values in the tables'), ('duplicates', 'pairs found more than once'), ('unexpected', 'pairs not expected in the run')]
+    for problem, description in problems:
+        if report[problem]:
+            log.warning('%d %s: %s' %(len(report[problem]), description, ', '.join(report[problem][:10]) + (' ...' if len(report[problem]) > 10 else '')))
+
+    if report['missing'] or report['conflicts']:
+        return 1
+    return 0
+
+
+def main(argv=None):
+    '''
+    Entry point of the command line interface.
+    :param argv: list of command line arguments. Defaults to sys.argv[1:].
+    :return status: exit status of the command
+    '''
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='PA_IN', description='Pairwise interactions of species metabolic models with flux balance analysis.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='report the progress of the run')
+    parser.add_argument('--trace', default=None, help='record the time spent on each stage and write it to this file, one row per stage and pair')
+    parser.add_argument('--solver-config', default=None, help='JSON file with the solver and its parameters (output of autotune)')
+    subparsers = parser.add_subparsers(dest='command')
+
+    pairs = subparsers.add_parser('pairs', help='list all the pairs of the models in a folder')
+    pairs.add_argument('modelFolder', help='folder with the metabolic models of individual species')
+    pairs.add_argument('-o', '--output', default='pairs.txt', help='file with the pairs of species')
+    pairs.add_argument('--rank-by', choices=['shared', 'onlyA', 'onlyB', 'diet', 'complementarity'], default=None, help='rank the pairs by a score of their exchange reactions (see ExchangeIndex)')
+    pairs.add_argument('--top', type=int, default=None, help='keep only this number of pairs, the best ranked ones')
+    pairs.add_argument('--min-score', type=int, default=None, help='leave out the pairs with a lower score')
+    pairs.add_argument('--diet', default=None, help="file with the metabolite availability conditions ('Diet'), used to score the exchange reactions available in the diet")
+    pairs.add_argument('--scores', default=None, help='write the scores of all the pairs to this file')
+    pairs.set_defaults(function=_pairsCommand)
+
+    build = subparsers.add_parser('build', help='create the two-species community models')
+    build.add_argument('pairs', help='file with the pairs of species')
+    build.add_argument('modelFolder', help='folder with the metabolic models of individual species')
+    build.add_argument('comFolder', help='folder where the community models are written (or archive file, with --archive)')
+    build.add_argument('-p', '--processes', type=int, default=1, help='number of worker processes')
+    build.add_argument('--cache-dir', default=None, help='folder for the on-disk cache of parsed species models')
+    build.add_argument('--archive', action='store_true', help='store the communities in a single CommunityArchive file instead of one SBML file per pair')
+    build.add_argument('--shard', type=parseShard, default=None, help="only build the pairs of this shard, given as 'i/n' (counting from 0)")
+    build.add_argument('--compress', metavar='DIET', default=None, help="remove the reactions of the species models that can't carry flux under this diet, and merge linear chains of reactions, before building the communities (see SpeciesCompression)")
+    build.set_defaults(function=_buildCommand)
+
+    growth = subparsers.add_parser('growth', help='calculate the growth rates of the species of the community models')
+    growth.add_argument('diet', help="file with the metabolite availability conditions ('Diet')")
+    growth.add_argument('comFolder', help='folder with the community models, or CommunityArchive file')
+    growth.add_argument('-o', '--output', default='OutputGR.txt', help='table with the growth rates')
+    growth.add_argument('-p', '--processes', type=int, default=1, help='number of worker processes')
+    growth.add_argument('--store', default=None, help='SQLite file where the results are recorded, to resume interrupted runs')
+    growth.add_argument('--retry-failed', action='store_true', help='calculate again the models that failed in a previous run')
+    growth.add_argument('--fluxes', default=None, help='also run a parsimonious FBA on each community and write the exchange fluxes of its two species to this file')
+    growth.add_argument('--timeout', type=float, default=None, help='kill and replace a worker process that spends more than this number of seconds on a community model (see WatchdogPool). The models are then analysed by worker processes even with --processes 1.')
+    growth.add_argument('--no-retry', action='store_true', help="don't try the models that failed or timed out again with the fallback solver settings")
+    growth.add_argument('--shard', type=parseShard, default=None, help="only analyse the community models of this shard, given as 'i/n' (counting from 0)")
+    growth.set_defaults(function=_growthCommand)
+
+    interactions = subparsers.add_parser('interactions', help='classify the interactions of the pairs of species')
+    interactions.add_argument('growthRates', nargs='?', default=None, help='table with the growth rates (output of growth)')
+    interactions.add_argument('-o', '--output', default='interactions.tsv', help='table with the interactions')
+    interactions.add_argument('--pairs', default=None, help='file with the pairs of species, to build and analyse the communities in one pass instead of reading a growth rates table')
+    interactions.add_argument('--diet', default=None, help="file with the metabolite availability conditions ('Diet'), used with --pairs")
+    interactions.add_argument('--model-folder', default='', help='folder with the metabolic models of individual species, used with --pairs')
+    interactions.add_argument('--com-folder', default=None, help='folder where the community models are also written, used with --pairs')
+    interactions.add_argument('-p', '--processes', type=int, default=1, help='number of worker processes, which share the species models loaded once by the main process (see pair_interactions_multiproc), used with --pairs')
+    interactions.add_argument('--sparse', action='store_true', help='assemble the community linear programs directly from the species models, used with --pairs')
+    interactions.add_argument('--store', default=None, help='SQLite file where the results are recorded, used with --pairs')
+    interactions.add_argument('--retry-failed', action='store_true', help='calculate again the pairs that failed in a previous run')
+    interactions.add_argument('--fluxes', default=None, help='also write the exchange fluxes of the two species of each pair to this file (see growth --fluxes), used with --pairs')
+    interactions.add_argument('--compress', action='store_true', help='compress the species models under the diet before building the communities (see build --compress), used with --pairs')
+    interactions.add_argument('--timeout', type=float, default=None, help='kill and replace a worker process that spends more than this number of seconds on a pair, used with --pairs (see growth --timeout)')
+    interactions.add_argument('--no-retry', action='store_true', help="don't try the pairs that failed or timed out again with the fallback solver settings, used with --pairs")
+    interactions.add_argument('--shard', type=parseShard, default=None, help="only analyse the pairs of this shard, given as 'i/n' (counting from 0), used with --pairs")
+    interactions.set_defaults(function=_interactionsCommand)
+
+    diet = subparsers.add_parser('diet', help="apply a 'Diet' to the community models and write them to another folder")
+    diet.add_argument('diet', help="file with the metabolite availability conditions ('Diet')")
+    diet.add_argument('comFolder', help='folder with the community models')
+    diet.add_argument('outFolder', help='folder where the models with the diet applied are written')
+    diet.add_argument('--shard', type=parseShard, default=None, help="only change the community models of this shard, given as 'i/n' (counting from 0)")
+    diet.set_defaults(function=_dietCommand)
+
+    merge = subparsers.add_parser('merge', help='combine the growth rates or interactions tables of the shards of a run')
+    merge.add_argument('output', help='merged table')
+    merge.add_argument('tables', nargs='+', help='tables of the shards')
+    merge.add_argument('--com-folder', default=None, help='folder with the community models (or CommunityArchive file) of the run, to report the missing pairs')
+    merge.add_argument('--pairs', default=None, help='file with the pairs of species of the run, to report the missing pairs')
+    merge.set_defaults(function=_mergeCommand)
+
+    autotune = subparsers.add_parser('autotune', help='benchmark the solver configurations on a sample of the pairs and save the fastest one')
+    autotune.add_argument('pairs', help='file with the pairs of species')
+    autotune.add_argument('modelFolder', help='folder with the metabolic models of individual species')
+    autotune.add_argument('diet', help="file with the metabolite availability conditions ('Diet')")
+    autotune.add_argument('-o', '--output', default='solver.json', help='JSON file where the chosen configuration and the benchmark are written')
+    autotune.add_argument('--sample', type=int, default=20, help='number of pairs in the benchmark')
+    autotune.add_argument('--repeat', type=int, default=1, help='number of times each configuration is timed')
+    autotune.add_argument('--solvers', default=None, help="comma-separated backends to compare (e.g. 'glpk,highs'). Defaults to the installed ones.")
+    autotune.set_defaults(function=_autotuneCommand)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)s %(message)s')
+    if args.verbose:
+        log.setLevel(logging.INFO)
+
+    if args.trace is not None:
+        recorder = setRecorder(StageRecorder())
+
+    if args.solver_config is not None:
+        log.info('%r' %setSolverConfig(SolverConfig.load(args.solver_config)))
+
+    status = args.function(args) or 0
+
+    if args.trace is not None:
+        recorder.writeTrace(args.trace)
+        log.info('\n' + recorder.summary())
+
+    return status
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
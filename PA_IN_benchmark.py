@@ -0,0 +1,244 @@
+
+# coding: utf-8
+
+'''
+    Benchmark of the stages of PA_IN on synthetic species models. The models are generated with a configurable number of reactions, metabolites and exchange reactions, and a configurable overlap of exchange metabolites between species, so that the time taken by each stage can be followed as the number of species grows. The results are stored in a JSON file, and can be compared with the results of a previous run to flag the stages that became slower. Everything runs offline, with the GLPK solver by default.
+
+    Example:
+        python PA_IN_benchmark.py --sizes 2 4 8 --out bench.json
+        python PA_IN_benchmark.py --sizes 2 4 8 --compare bench.json --threshold 0.2
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+import cobra
+
+import PA_IN
+
+
+def syntheticSpeciesModel(modelID, nReactions=500, nMetabolites=300, nExchanges=50, overlap=0.5, seed=0):
+    '''
+    This function creates a synthetic species model that can grow on the exchange metabolites available to it. Each exchange reaction (EX_<metabolite>_e) takes up an extracellular metabolite, which is transported into the cell and converted by random internal reactions. The biomass reaction consumes three internal metabolites that are always connected to the first exchange reactions, so the model is feasible. A fraction overlap of the exchange metabolites (the core metabolites) is the same in all species, the rest are specific to the species, which controls how many exchange metabolites two species share.
+    :param modelID: id of the model
+    :param nReactions: number of internal reactions
+    :param nMetabolites: number of internal metabolites
+    :param nExchanges: number of exchange reactions
+    :param overlap: fraction of the exchange metabolites that are shared by all species
+    :param seed: seed of the random number generator
+    :return model: cobrapy Model object
+    '''
+
+    rnd = random.Random(seed)
+    model = cobra.Model(modelID)
+
+    internal = [cobra.Metabolite('c%d_c' %i, compartment='c') for i in range(nMetabolites)]
+
+    nCore = int(round(overlap * nExchanges))
+    exchangeIDs = ['cpd%d' %k for k in range(nCore)] + ['cpd%s_%d' %(modelID, k) for k in range(nExchanges - nCore)]
+
+    reactions = []
+    for k, exchangeID in enumerate(exchangeIDs):
+        extracellular = cobra.Metabolite(exchangeID + '_e', compartment='e')
+
+        exchange = cobra.Reaction('EX_%s_e' %exchangeID)
+        exchange.bounds = (-10., 1000.)
+        exchange.add_metabolites({extracellular: -1.})
+
+        transport = cobra.Reaction('T_%s' %exchangeID)
+        transport.bounds = (-1000., 1000.)
+        transport.add_metabolites({extracellular: -1., internal[k % nMetabolites]: 1.})
+
+        reactions.extend([exchange, transport])
+
+    for j in range(nReactions):
+        substrate, product = rnd.sample(internal, 2)
+        rxn = cobra.Reaction('R%d' %j)
+        rxn.bounds = (0. if rnd.random() < 0.5 else -1000., 1000.)
+        rxn.add_metabolites({substrate: -1., product: 1.})
+        reactions.append(rxn)
+
+    biomass = cobra.Reaction('Growth')
+    biomass.bounds = (0., 1000.)
+    biomass.add_metabolites({internal[0]: -1., internal[1 % nMetabolites]: -1., internal[2 % nMetabolites]: -0.5})
+    reactions.append(biomass)
+
+    model.add_reactions(reactions)
+    model.objective = 'Growth'
+
+    return model
+
+
+def syntheticLibrary(folder, nSpecies, nReactions=500, nMetabolites=300, nExchanges=50, overlap=0.5, seed=0):
+    '''
+    This function writes nSpecies synthetic species models to folder in SBML format, the file with all their pairs, and a 'Diet' that makes part of the exchange metabolites available.
+    :return modelFiles, pairsFile, dietFile: list of model filenames, path to the pairs file and path to the diet file
+    '''
+
+    rnd = random.Random(seed)
+    modelFiles = []
+    exchangeIDs = set()
+
+    for i in range(nSpecies):
+        model = syntheticSpeciesModel('sp%d' %i, nReactions, nMetabolites, nExchanges, overlap, seed + i)
+        exchangeIDs.update([rxn.id for rxn in model.exchanges])
+        modelFile = 'sp%d.xml' %i
+        cobra.io.write_sbml_model(model, os.path.join(folder, modelFile))
+        modelFiles.append(modelFile)
+
+    pairsFile = os.path.join(folder, 'pairs.txt')
+    outFile = open(pairsFile, 'w')
+    for pair in PA_IN.get_all_pairs(modelFiles):
+        outFile.write(pair[0] + '\t' + pair[1] + '\n')
+    outFile.close()
+
+    dietFile = os.path.join(folder, 'diet.tsv')
+    outFile = open(dietFile, 'w')
+    for exchangeID in sorted(exchangeIDs):
+        outFile.write('%s[u]\t%s\n' %(exchangeID, rnd.choice([0., 1., 5., 10.])))
+    outFile.close()
+
+    return modelFiles, pairsFile, dietFile
+
+
+def timeStage(function, repeat=1):
+    '''
+    Runs function repeat times and returns the shortest wall time, in seconds.
+    '''
+    times = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+
+def benchmarkSize(nSpecies, args):
+    '''
+    Times all the stages for a library of nSpecies synthetic species.
+    :return results: list of dictionaries with the stage, the number of species and the time in seconds
+    '''
+
+    folder = tempfile.mkdtemp(prefix='pa_in_bench_')
+    try:
+        modelFolder = os.path.join(folder, 'models') + '/'
+        comFolder = os.path.join(folder, 'communities')
+        dietedFolder = os.path.join(folder, 'dieted') + '/'
+        os.makedirs(modelFolder)
+        os.makedirs(dietedFolder)
+
+        modelFiles, pairsFile, dietFile = syntheticLibrary(modelFolder, nSpecies, args.reactions, args.metabolites, args.exchanges, args.overlap, args.seed)
+        modelA = cobra.io.read_sbml_model(modelFolder + modelFiles[0])
+        modelB = cobra.io.read_sbml_model(modelFolder + modelFiles[1])
+        growthFile = os.path.join(folder, 'OutputGR.txt')
+        interactionsFile = os.path.join(folder, 'interactions.tsv')
+
+        def allPairs():
+            if os.path.exists(comFolder):
+                shutil.rmtree(comFolder)
+            PA_IN.allPairComModels(pairsFile, modelFolder, comFolder)
+
+        def growth():
+            if os.path.exists(growthFile):
+                os.remove(growthFile)
+            PA_IN.calculateGR(dietFile, comFolder, growthFile)
+
+        stages = [
+            ('totalEXRxns', lambda: PA_IN.totalEXRxns(modelA, modelB)),
+            ('createCommunityModel', lambda: PA_IN.createCommunityModel(modelFolder + modelFiles[0], modelFolder + modelFiles[1], folder)),
+            ('allPairComModels', allPairs),
+            ('calculateGR', growth),
+            ('apply_diet', lambda: PA_IN.apply_diet(dietFile, comFolder, dietedFolder)),
+            ('evaluateInteractions', lambda: PA_IN.evaluateInteractions(growthFile, interactionsFile)),
+        ]
+
+        results = []
+        for stage, function in stages:
+            if args.stages and stage not in args.stages:
+                # Later stages need the files of the earlier ones
+                if stage in ('allPairComModels', 'calculateGR'):
+                    function()
+                continue
+            seconds = timeStage(function, args.repeat)
+            results.append({'stage': stage, 'species': nSpecies, 'pairs': len(modelFiles) * (len(modelFiles) - 1) // 2, 'seconds': seconds})
+            print('%-22s N=%-4d %10.4f s' %(stage, nSpecies, seconds))
+    finally:
+        shutil.rmtree(folder)
+
+    return results
+
+
+def compareResults(results, baseline, threshold):
+    '''
+    Compares the results of this run with the results of a previous run, and returns the stages that are slower than before by more than threshold (a fraction, e.g. 0.2 for 20%).
+    :return regressions: list of dictionaries with the stage, the number of species, and the old and new times
+    '''
+
+    before = dict(((result['stage'], result['species']), result['seconds']) for result in baseline['results'])
+    regressions = []
+
+    for result in results:
+        key = (result['stage'], result['species'])
+        if key in before and before[key] > 0 and result['seconds'] > before[key] * (1. + threshold):
+            regressions.append({'stage': result['stage'], 'species': result['species'], 'before': before[key], 'after': result['seconds']})
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of the stages of PA_IN on synthetic species models.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2, 4, 8], help='numbers of species to benchmark')
+    parser.add_argument('--reactions', type=int, default=500, help='internal reactions per species')
+    parser.add_argument('--metabolites', type=int, default=300, help='internal metabolites per species')
+    parser.add_argument('--exchanges', type=int, default=50, help='exchange reactions per species')
+    parser.add_argument('--overlap', type=float, default=0.5, help='fraction of exchange metabolites shared by all species')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+    parser.add_argument('--repeat', type=int, default=1, help='number of repetitions of each stage (the shortest time is kept)')
+    parser.add_argument('--stages', nargs='+', default=None, help='stages to time (default: all)')
+    parser.add_argument('--solver', default='glpk', help='LP solver used by cobrapy')
+    parser.add_argument('--out', default='benchmark.json', help='JSON file where the results are stored')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown (fraction) above which a stage is flagged as a regression')
+    args = parser.parse_args(argv)
+
+    cobra.Configuration().solver = args.solver
+
+    results = []
+    for nSpecies in args.sizes:
+        results.extend(benchmarkSize(nSpecies, args))
+
+    report = {
+        'parameters': vars(args),
+        'python': platform.python_version(),
+        'cobra': cobra.__version__,
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    outFile = open(args.out, 'w')
+    json.dump(report, outFile, indent=1)
+    outFile.close()
+
+    if args.compare is not None:
+        baselineFile = open(args.compare, 'r')
+        baseline = json.load(baselineFile)
+        baselineFile.close()
+
+        regressions = compareResults(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION %-22s N=%-4d %10.4f s -> %10.4f s' %(regression['stage'], regression['species'], regression['before'], regression['after']))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
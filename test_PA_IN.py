@@ -0,0 +1,471 @@
+# coding: utf-8
+
+'''
+    Tests of PA_IN on the tiny synthetic library of PA_IN_benchmark. Each optimization of the pipeline is checked against the baseline path it replaces: the growth rates of the species alone and the total growth rate of each community have to be the same (the split of the total between the two species is not unique, so it is not compared). Run with:
+
+        python -m pytest -q test_PA_IN.py
+'''
+
+import os
+
+import numpy as np
+import pytest
+
+import PA_IN
+import PA_IN_benchmark
+
+
+TOLERANCE = 1e-6
+
+
+@pytest.fixture(scope='module')
+def library(tmp_path_factory):
+    '''
+    Five synthetic species models, the file with their ten pairs and a 'Diet'.
+    '''
+    folder = str(tmp_path_factory.mktemp('library'))
+    modelFiles, pairsFile, dietFile = PA_IN_benchmark.syntheticLibrary(folder, 5, nReactions=60, nMetabolites=40, nExchanges=12)
+    return {'folder': os.path.join(folder, ''), 'modelFiles': modelFiles, 'pairs': pairsFile, 'diet': dietFile}
+
+
+@pytest.fixture(scope='module')
+def communities(library, tmp_path_factory):
+    '''
+    Folder with the community models of all the pairs, built without any cache.
+    '''
+    comFolder = os.path.join(str(tmp_path_factory.mktemp('communities')), '')
+    PA_IN.allPairComModels(library['pairs'], library['folder'], comFolder)
+    return comFolder
+
+
+@pytest.fixture(scope='module')
+def baseline(library):
+    '''
+    Growth rates of all the pairs calculated on cobrapy community models, indexed by PairID.
+    '''
+    return interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder'], cache=PA_IN.ModelCache(), schedule=False))
+
+
+def interactionsTable(rows):
+    import pandas as pd
+
+    return pd.DataFrame(list(rows), columns=PA_IN.INTERACTION_COLUMNS).rename(columns={'Model': 'PairID'}).set_index('PairID')
+
+
+def assertSameGrowth(table, reference):
+    '''
+    Checks that two tables of growth rates have the same pairs, the same growth rates of the species alone and the same total growth rate of each community.
+    '''
+    assert sorted(table.index) == sorted(reference.index)
+    table = table.loc[reference.index]
+    for column in ['GRASolo', 'GRBSolo']:
+        assert np.allclose(table[column].astype(float), reference[column].astype(float), atol=TOLERANCE)
+    total = table['GRSpeciesAFull'].astype(float) + table['GRSpeciesBFull'].astype(float)
+    referenceTotal = reference['GRSpeciesAFull'].astype(float) + reference['GRSpeciesBFull'].astype(float)
+    assert np.allclose(total, referenceTotal, atol=TOLERANCE)
+
+
+def test_baseline_grows(baseline):
+    assert len(baseline) == 10
+    assert (baseline['GRASolo'] > 0).any()
+
+
+def test_growth_table_matches_baseline(library, communities, baseline, tmp_path):
+    outFile = str(tmp_path / 'growth.tsv')
+    PA_IN.calculateGR(library['diet'], communities, OutFile=outFile)
+    table = PA_IN.readResults(outFile).set_index('PairID')
+    assert set(table['Status']) == set(['optimal'])
+    assertSameGrowth(table, baseline)
+
+
+def test_interactions_table_matches_baseline(library, communities, baseline, tmp_path):
+    growthFile = str(tmp_path / 'growth.tsv')
+    interactionsFile = str(tmp_path / 'interactions.tsv')
+    PA_IN.calculateGR(library['diet'], communities, OutFile=growthFile)
+    PA_IN.evaluateInteractions(growthFile, interactionsFile)
+    table = PA_IN.readResults(interactionsFile).set_index('PairID')
+    assertSameGrowth(table, baseline)
+    assert sorted(table.columns) == sorted([column for column in PA_IN.INTERACTION_RESULT_COLUMNS if column != 'PairID'])
+
+
+def test_community_lp_matches_cobra(library, baseline):
+    table = interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder'], sparse=True))
+    assertSameGrowth(table, baseline)
+
+
+@pytest.mark.parametrize('glpk', [True, False])
+def test_community_lp_sums_duplicated_coefficients(library, monkeypatch, glpk):
+    import copy
+
+    import swiglpk
+
+    cache = PA_IN.ModelCache()
+    members = [cache.arrays(library['folder'] + modelFile) for modelFile in library['modelFiles'][:2]]
+    dietValues = PA_IN.loadDiet(library['diet'])
+    expected = PA_IN.CommunityLP(members).growthRates(dietValues, 1e-6)
+
+    # The first coefficient of species A is split in two entries that add up to it
+    split = copy.copy(members[0])
+    split.rows = np.concatenate([members[0].rows, members[0].rows[:1]])
+    split.cols = np.concatenate([members[0].cols, members[0].cols[:1]])
+    split.values = np.concatenate([[members[0].values[0] / 4], members[0].values[1:], [3 * members[0].values[0] / 4]])
+    if not glpk:
+        monkeypatch.setattr(PA_IN, 'isGLPK', lambda lp: False)
+    community = PA_IN.CommunityLP([split, members[1]])
+
+    problem = community.lp.problem
+    row, col = members[0].rows[0] + 1, members[0].cols[0] + 1
+    ind = swiglpk.intArray(swiglpk.glp_get_num_cols(problem) + 1)
+    val = swiglpk.doubleArray(swiglpk.glp_get_num_cols(problem) + 1)
+    coefficients = dict((ind[k], val[k]) for k in range(1, swiglpk.glp_get_mat_row(problem, int(row), ind, val) + 1))
+    assert coefficients[col] == pytest.approx(members[0].values[0])
+
+    grown = community.growthRates(dietValues, 1e-6)
+    assert np.allclose(grown[2:], expected[2:], atol=TOLERANCE)
+    assert abs(grown[0] + grown[1] - expected[0] - expected[1]) <= TOLERANCE
+
+
+def test_library_workers_match_cobra(library, baseline):
+    table = interactionsTable(PA_IN.pair_interactions_multiproc(library['pairs'], library['diet'], library['folder'], n_processes=2))
+    assertSameGrowth(table, baseline)
+
+
+def test_compressed_matches_uncompressed(library, baseline):
+    compression = PA_IN.pairsCompression(library['pairs'], library['diet'], library['folder'])
+    cache = PA_IN.ModelCache(compression=compression)
+    table = interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder'], cache=cache))
+    assertSameGrowth(table, baseline)
+    compressed = cache.get(library['folder'] + library['modelFiles'][0])
+    uncompressed = PA_IN.ModelCache().get(library['folder'] + library['modelFiles'][0])
+    assert len(compressed.reactions) <= len(uncompressed.reactions)
+
+
+def test_cached_matches_uncached(library, communities, baseline, tmp_path):
+    cacheDir = str(tmp_path / 'cache')
+    comFolder = os.path.join(str(tmp_path / 'cached'), '')
+    PA_IN.allPairComModels(library['pairs'], library['folder'], comFolder, cacheDir=cacheDir)
+    assert sorted(os.listdir(comFolder)) == sorted(os.listdir(communities))
+
+    # A second cache only reads the pickled models of the first one
+    cache = PA_IN.ModelCache(cacheDir=cacheDir)
+    table = interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder'], cache=cache))
+    assert cache.misses == 0 and cache.diskHits == len(library['modelFiles'])
+    assertSameGrowth(table, baseline)
+
+    outFile = str(tmp_path / 'growth.tsv')
+    PA_IN.calculateGR(library['diet'], comFolder, OutFile=outFile)
+    assertSameGrowth(PA_IN.readResults(outFile).set_index('PairID'), baseline)
+
+
+def test_archive_matches_folder(library, baseline, tmp_path):
+    archivePath = str(tmp_path / 'communities.zip')
+    PA_IN.archiveComModels(library['pairs'], library['folder'], archivePath)
+    outFile = str(tmp_path / 'growth.tsv')
+    PA_IN.calculateGR(library['diet'], archivePath, OutFile=outFile)
+    assertSameGrowth(PA_IN.readResults(outFile).set_index('PairID'), baseline)
+
+
+def test_growth_workers_match_serial(library, communities, baseline, tmp_path):
+    outFile = str(tmp_path / 'growth.tsv')
+    PA_IN.calculate_growth_rates_multiproc(library['diet'], communities, n_processes=2, OutFile=outFile)
+    assertSameGrowth(PA_IN.readResults(outFile).set_index('PairID'), baseline)
+
+
+def test_solo_growth_memo(library, communities):
+    import cobra
+
+    dietValues = PA_IN.loadDiet(library['diet'])
+    soloGrowth = PA_IN.SoloGrowth(PA_IN.dietHash(dietValues))
+    for modelFile in sorted(PA_IN.getListOfModels(communities)):
+        memoized = PA_IN.calculateGRModel(cobra.io.read_sbml_model(modelFile), dietValues, soloGrowth=soloGrowth)
+        alone = PA_IN.calculateGRModel(cobra.io.read_sbml_model(modelFile), dietValues)
+        assert np.allclose(memoized[2:], alone[2:], atol=TOLERANCE)
+    # Five species in ten pairs: each one is optimized alone once
+    assert soloGrowth.misses == 5 and soloGrowth.hits == 15
+
+
+def test_result_store_resumes(library, communities, baseline, tmp_path):
+    store = PA_IN.ResultStore(str(tmp_path / 'store.db'))
+    PA_IN.calculateGR(library['diet'], communities, OutFile=str(tmp_path / 'first.tsv'), store=store)
+    assert len(store.rows()) == 10
+
+    # Nothing is calculated again: all the rows of the second table come from the store
+    calculated = []
+    growthRatesRow = PA_IN.growthRatesRow
+    PA_IN.growthRatesRow = lambda *args, **kwargs: calculated.append(args[0])
+    try:
+        PA_IN.calculateGR(library['diet'], communities, OutFile=str(tmp_path / 'second.tsv'), store=store)
+    finally:
+        PA_IN.growthRatesRow = growthRatesRow
+        store.close()
+    assert calculated == []
+    assertSameGrowth(PA_IN.readResults(str(tmp_path / 'second.tsv')).set_index('PairID'), baseline)
+
+
+@pytest.mark.parametrize('workers', [False, True])
+def test_result_store_resumes_failed_pairs(communities, library, tmp_path, monkeypatch, workers):
+    import shutil
+
+    comFolder = os.path.join(str(tmp_path / 'communities'), '')
+    shutil.copytree(communities, comFolder)
+    with open(comFolder + 'communitysp0Xbroken.sbml', 'w') as brokenFile:
+        brokenFile.write('not a model')
+
+    def calculateGR(outFile, store):
+        if workers:
+            PA_IN.calculate_growth_rates_multiproc(library['diet'], comFolder, n_processes=2, OutFile=outFile, store=store, retry=False)
+        else:
+            PA_IN.calculateGR(library['diet'], comFolder, OutFile=outFile, store=store)
+        return PA_IN.readResults(outFile).set_index('PairID')
+
+    store = PA_IN.ResultStore(str(tmp_path / 'store.db'))
+    started = []
+    start = store.start
+    monkeypatch.setattr(store, 'start', lambda key, *args: (started.append(key), start(key, *args)))
+    first = calculateGR(str(tmp_path / 'first.tsv'), store)
+    assert len(started) == 11
+    assert first.loc['sp0Xbroken', 'Status'].startswith('failed: ')
+
+    # The failed pair is not calculated again, but its row is still in the table of the resumed run
+    calculated = []
+    monkeypatch.setattr(PA_IN, 'growthRatesRow', lambda *args, **kwargs: calculated.append(args[0]))
+    try:
+        second = calculateGR(str(tmp_path / 'second.tsv'), store)
+    finally:
+        store.close()
+    assert calculated == [] and len(started) == 11
+    assert sorted(second.index) == sorted(first.index)
+    assert second.loc['sp0Xbroken', 'Status'] == first.loc['sp0Xbroken', 'Status']
+
+
+def test_result_store_shared_with_pair_interactions(library, communities, baseline, tmp_path, monkeypatch):
+    for modelFile in PA_IN.getListOfModels(communities):
+        speciesA, speciesB = PA_IN.communitySpecies(modelFile)
+        assert PA_IN.memberKeys(modelFile) == [PA_IN.fileHash(library['folder'] + speciesA + '.xml'), PA_IN.fileHash(library['folder'] + speciesB + '.xml')]
+
+    store = PA_IN.ResultStore(str(tmp_path / 'store.db'))
+    PA_IN.calculate_growth_rates_multiproc(library['diet'], communities, n_processes=2, OutFile=str(tmp_path / 'growth.tsv'), store=store)
+
+    # The pairs are stored under the keys of their species models, so pairInteractions doesn't load any of them again
+    def noLoad(self, modelFile):
+        raise AssertionError('%s was loaded' %modelFile)
+    monkeypatch.setattr(PA_IN.ModelCache, 'get', noLoad)
+    monkeypatch.setattr(PA_IN.ModelCache, 'arrays', noLoad)
+    try:
+        table = interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder'], store=store))
+    finally:
+        store.close()
+    assertSameGrowth(table, baseline)
+
+
+def test_shards_merge_to_full_table(library, communities, baseline, tmp_path):
+    shardFiles = []
+    for i in range(3):
+        shardFiles.append(str(tmp_path / ('growth.%d.tsv' %i)))
+        PA_IN.calculateGR(library['diet'], communities, OutFile=shardFiles[-1], shard=(i, 3))
+    shardIDs = [set(PA_IN.readResults(shardFile)['PairID']) for shardFile in shardFiles]
+    assert sum([len(ids) for ids in shardIDs]) == 10 and len(set.union(*shardIDs)) == 10
+
+    outFile = str(tmp_path / 'growth.tsv')
+    report = PA_IN.mergeTables(shardFiles, outFile, PA_IN.expectedPairIDs(communities))
+    assert report['pairs'] == 10 and report['missing'] == [] and report['duplicates'] == []
+    assertSameGrowth(PA_IN.readResults(outFile).set_index('PairID'), baseline)
+
+    report = PA_IN.mergeTables(shardFiles[:2], str(tmp_path / 'partial.tsv'), PA_IN.expectedPairIDs(communities))
+    assert sorted(report['missing']) == sorted(shardIDs[2])
+
+
+def test_shard_items_are_balanced():
+    items = ['m%d' %i for i in range(20)]
+    costs = [1 + i % 4 for i in range(len(items))]
+    shards = [PA_IN.shardItems(items, costs, (i, 4)) for i in range(4)]
+    assert sorted([item for shard in shards for item in shard]) == sorted(items)
+    loads = [sum([costs[items.index(item)] for item in shard]) for shard in shards]
+    assert max(loads) - min(loads) <= max(costs)
+
+
+def test_exchange_index_scores(library):
+    import cobra
+
+    index = PA_IN.ExchangeIndex.fromModels(library['modelFiles'], library['folder'])
+    exchanges = dict((modelFile, set(PA_IN.getEXRxns(cobra.io.read_sbml_model(library['folder'] + modelFile)))) for modelFile in library['modelFiles'])
+    scores = index.scores()
+    for a, b, shared, onlyA, onlyB in zip(scores['a'], scores['b'], scores['shared'], scores['onlyA'], scores['onlyB']):
+        exchangesA = exchanges[index.speciesIDs[a]]
+        exchangesB = exchanges[index.speciesIDs[b]]
+        assert (shared, onlyA, onlyB) == (len(exchangesA & exchangesB), len(exchangesA - exchangesB), len(exchangesB - exchangesA))
+
+    ranked = PA_IN.rankPairs(index, 'shared')
+    assert sorted(ranked) == sorted(PA_IN.get_all_pairs(library['modelFiles']))
+    assert len(PA_IN.rankPairs(index, 'shared', top=3)) == 3
+
+
+def test_solver_config(library, baseline, tmp_path):
+    config = PA_IN.SolverConfig('glpk', presolve=True, method='dual', tolerances={'feasibility': 1e-9})
+    configFile = str(tmp_path / 'solver.json')
+    config.save(configFile, benchmark=[{'time': 1.0}])
+    assert PA_IN.SolverConfig.load(configFile).settings() == config.settings()
+    assert PA_IN.SolverConfig().isDefault() and not config.isDefault()
+    assert PA_IN.fallbackSolverConfig(config).method == 'primal'
+    with pytest.raises(ValueError):
+        PA_IN.SolverConfig('glpk', method='interior point').apply(PA_IN.ModelCache().get(library['folder'] + library['modelFiles'][0]).solver)
+
+    PA_IN.setSolverConfig(config)
+    try:
+        table = interactionsTable(PA_IN.pairInteractions(library['pairs'], library['diet'], library['folder']))
+    finally:
+        PA_IN.setSolverConfig(PA_IN.SolverConfig())
+    assertSameGrowth(table, baseline)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_warm_start_restores_basis(library, sparse):
+    dietValues = PA_IN.loadDiet(library['diet'])
+    cache = PA_IN.ModelCache()
+    warmStart = PA_IN.WarmStart()
+    for pair in PA_IN.schedulePairs(PA_IN.readPairsFile(library['pairs'])):
+        if sparse:
+            members = [cache.arrays(library['folder'] + pair[0]), cache.arrays(library['folder'] + pair[1])]
+            warm = PA_IN.CommunityLP(members).growthRates(dietValues, 1e-6, warmStart)
+            cold = PA_IN.CommunityLP(members).growthRates(dietValues, 1e-6)
+        else:
+            mix = PA_IN.buildCommunityModel(cache.get(library['folder'] + pair[0]), cache.get(library['folder'] + pair[1]))
+            warm = PA_IN.calculateGRModel(mix.copy(), dietValues, warmStart=warmStart)
+            cold = PA_IN.calculateGRModel(mix, dietValues)
+        assert np.allclose(warm[2:], cold[2:], atol=TOLERANCE)
+        assert abs(warm[0] + warm[1] - cold[0] - cold[1]) <= TOLERANCE
+    # Every pair but the first shares a species with the previous one
+    assert warmStart.restored > 0
+    assert warmStart.restored + warmStart.crashed == 10
+
+
+def _sleepTask(seconds):
+    import time
+
+    time.sleep(seconds)
+    return seconds
+
+
+def _crashTask(value):
+    if value == 3:
+        os._exit(3)
+    return 2 * value
+
+
+def test_watchdog_pool_kills_hung_task():
+    import time
+
+    start = time.time()
+    cpu = time.process_time()
+    pool = PA_IN.WatchdogPool(2, timeout=1)
+    try:
+        results = list(pool.imap(_sleepTask, [0, 0, 60, 0, 0, 0], 2))
+    finally:
+        pool.close()
+    assert results[2][0] is None and results[2][1].startswith('timed out')
+    assert [result for result, error in results[:2] + results[3:]] == [0, 0, 0, 0, 0]
+    assert pool.timedOut == 1 and pool.died == 0
+    assert time.time() - start < 20
+    # The main process waits on the pipes of the workers instead of polling them
+    assert time.process_time() - cpu < 0.5
+
+
+def test_watchdog_pool_replaces_crashed_worker():
+    pool = PA_IN.WatchdogPool(2)
+    try:
+        results = list(pool.imap(_crashTask, list(range(8)), 3))
+    finally:
+        pool.close()
+    assert results[3][0] is None and 'died' in results[3][1]
+    assert [result for result, error in results[:3] + results[4:]] == [0, 2, 4, 8, 10, 12, 14]
+    assert pool.died == 1 and len(pool.workers) == 0
+
+
+def test_growth_workers_retry_failed_pairs(library, communities, baseline, tmp_path, monkeypatch):
+    import time
+
+    modelFiles = sorted(PA_IN.getListOfModels(communities))
+    hanging, flaky = modelFiles[2], modelFiles[5]
+    growthRatesRow = PA_IN.growthRatesRow
+
+    # The hanging pair never finishes, and the flaky one only fails with the default solver settings
+    def patchedGrowthRatesRow(modelFile, *args, **kwargs):
+        if modelFile == hanging:
+            time.sleep(60)
+        if modelFile == flaky and PA_IN.getSolverConfig().isDefault():
+            raise RuntimeError('simulated solver failure')
+        return growthRatesRow(modelFile, *args, **kwargs)
+
+    # The worker processes are forked, so they inherit the patched function
+    monkeypatch.setattr(PA_IN, 'growthRatesRow', patchedGrowthRatesRow)
+    store = PA_IN.ResultStore(str(tmp_path / 'store.db'))
+    outFile = str(tmp_path / 'growth.tsv')
+    try:
+        PA_IN.calculate_growth_rates_multiproc(library['diet'], communities, n_processes=2, OutFile=outFile, store=store, timeout=2)
+        failed = store.connection.execute("SELECT pair, error FROM results WHERE status = 'failed'").fetchall()
+    finally:
+        store.close()
+
+    assert [pair for pair, error in failed] == [os.path.basename(hanging)]
+    assert failed[0][1].count('timed out') == 2 and 'SolverConfig' in failed[0][1]
+
+    table = PA_IN.readResults(outFile).set_index('PairID')
+    assert (table['Status'] != 'optimal').sum() == 1
+    assertSameGrowth(table[table['Status'] == 'optimal'], baseline.drop(table.index[table['Status'] != 'optimal']))
+
+
+def test_failed_pairs_are_reported(library, tmp_path):
+    pairs = PA_IN.readPairsFile(library['pairs'])[:2] + [(library['modelFiles'][0], 'missing.xml')]
+    rows = list(PA_IN.pairInteractions(pairs, library['diet'], library['folder']))
+    assert len(rows) == 3
+    assert rows[-1][0] == 'sp0Xmissing' and rows[-1][-1].startswith('failed: ')
+
+    outFile = str(tmp_path / 'interactions.tsv')
+    PA_IN.writeInteractionsTable(rows, outFile)
+    table = PA_IN.readResults(outFile).set_index('PairID')
+    assert table.loc['sp0Xmissing', 'Status'].startswith('failed: ')
+    assert np.isnan(table.loc['sp0Xmissing', 'GRASolo'])
+    assert (table.drop('sp0Xmissing')['Status'] == 'optimal').all()
+
+
+def test_apply_diet_sets_bounds(library, communities, tmp_path):
+    import cobra
+
+    outFolder = os.path.join(str(tmp_path), '')
+    PA_IN.apply_diet(library['diet'], communities, outFolder)
+    dietValues = PA_IN.loadDiet(library['diet'])
+    modelFiles = sorted(os.listdir(outFolder))
+    assert len(modelFiles) == 10
+
+    model = cobra.io.read_sbml_model(outFolder + modelFiles[0])
+    applied = [(rxnID, value) for rxnID, value in dietValues if rxnID in model.reactions]
+    assert applied
+    for rxnID, value in applied:
+        assert model.reactions.get_by_id(rxnID).lower_bound == -value
+
+    with pytest.raises(Exception):
+        PA_IN.apply_diet(str(tmp_path / 'missing.tsv'), communities, outFolder)
+
+
+def test_sweep_reports_failed_conditions(library, communities, tmp_path, monkeypatch):
+    import pandas as pd
+
+    conditions = PA_IN.dietGridConditions(library['diet'], {'EX_cpd0_e[u]': [0, 10]})
+    calculateGRModel = PA_IN.calculateGRModel
+    calls = []
+
+    def failFirst(*args, **kwargs):
+        calls.append(args[0].id)
+        if len(calls) == 1:
+            raise RuntimeError('solver failure')
+        return calculateGRModel(*args, **kwargs)
+    monkeypatch.setattr(PA_IN, 'calculateGRModel', failFirst)
+
+    outFile = str(tmp_path / 'sweep.tsv')
+    PA_IN.sweepGR(conditions, outFile, comFolder=communities)
+    table = pd.read_csv(outFile, sep='\t')
+    assert list(table.columns) == PA_IN.SWEEP_HEADER
+    assert len(table) == 2 * len(PA_IN.getListOfModels(communities))
+    failed = table[table['Status'] != 'optimal']
+    assert len(failed) == 1 and failed['Status'].iloc[0] == 'failed: solver failure'
+    assert failed[['GRSpeciesAFull', 'GRSpeciesBFull', 'GRASolo', 'GRBSolo']].isna().all().all()